@@ -1,21 +1,35 @@
 import mysql.connector
 import pandas as pd
+import numpy as np
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai # Adicione esta linha
 import re
+import hashlib
 import json
 from datetime import datetime, timedelta
-import math
-import requests
-import base64
 import json
 import time
-from prophet import Prophet
-from prophet.plot import plot_plotly, plot_components_plotly
-
-# ... (após os imports)
-print(">>> DEBUG: Módulo agente_dados.py foi importado com sucesso.")
+import threading
+from pool_conexoes import obter_pool, PoolEsgotadoError
+from cache_local import CachePersistente
+from cache_vendas import CacheJanelaVendas
+from cubo_abc import CuboCustoDiario
+from catalogo_indice import CONSULTA_CATALOGO, CONSULTA_ESTOQUE_PRIMARIOS, CONSULTA_IMPRESSAO_CATALOGO, IndiceCatalogo
+from cenarios_compra import MotorCenarios
+from consultas_paralelas import executar_em_paralelo, executar_consultas_em_paralelo
+from consulta_streaming import ler_em_streaming
+from envio_pedidos_bling import montar_payload_pedido, enviar_pedido, enviar_pedidos_em_paralelo
+from tokens_bling import GerenciadorTokens
+from guarda_custo_sql import avaliar_consulta
+from replica_analitica import consultar_na_replica
+from sql_parametrizado import como_data, executar_parametrizada
+from tipos_colunas import aplicar_tipos
+from resumo_resultados import RESUMO_ORCAMENTO_TOKENS, estimar_tokens, montar_resumo_resultado
+from previsao_lote import preparar_historicos, gerar_previsoes_em_lote
+from modelos_previsao import ArmazemModelos
+from util_texto import normalizar_pergunta
+from rastreamento import rastrear, registrar_na_etapa
+from roteador_local import classificar_localmente, registrar_roteamento
 
 # Carregar variáveis de ambiente do arquivo .env
 load_dotenv()
@@ -28,39 +42,55 @@ DB_NAME = os.getenv("DB_NAME")
 
 # Configuração da API do Gemini
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
-if not GOOGLE_API_KEY:
-    print("Chave da API do Google não encontrada. Verifique seu arquivo .env")
-    exit() # Sai do script se a chave não for encontrada
-
-genai.configure(api_key=GOOGLE_API_KEY)
-
-# # ---- NOVO: Para listar modelos ----
-# print("Modelos disponíveis que suportam 'generateContent':")
-# for m in genai.list_models():
-#   if 'generateContent' in m.supported_generation_methods:
-#     print(m.name)
-# print("----------------------------------------------------")
-# ---- FIM NOVO ----
-
-# Inicializa o modelo Generativo
-# TENTATIVA 1: Usar um nome de modelo mais específico e comum atualmente
-try:
-    # Substitua pela sua escolha principal da lista:
-    MODEL_NAME = "models/gemini-1.5-flash-latest" 
-    model = genai.GenerativeModel(MODEL_NAME)
-    print(f"\nUsando o modelo: {MODEL_NAME}")
-
-except Exception as e:
-    print(f"Erro ao inicializar o modelo '{MODEL_NAME}'. Detalhe: {e}")
-    # Você pode adicionar um fallback aqui se desejar, como o 'gemini-1.5-flash-latest'
-    try:
-        MODEL_NAME_FALLBACK = "models/gemini-1.5-pro-latest"
-        print(f"Tentando fallback com: {MODEL_NAME_FALLBACK}")
-        model = genai.GenerativeModel(MODEL_NAME_FALLBACK)
-        print(f"\nUsando o modelo de fallback: {MODEL_NAME_FALLBACK}")
-    except Exception as e_fallback:
-        print(f"Erro ao inicializar o modelo de fallback '{MODEL_NAME_FALLBACK}'. Verifique a lista de modelos disponíveis. Detalhe: {e_fallback}")
-        exit() # Sai se não conseguir inicializar nenhum modelo
+MODEL_NAME = "models/gemini-1.5-flash-latest"
+MODEL_NAME_FALLBACK = "models/gemini-1.5-pro-latest"
+
+# O cliente do Gemini (e a biblioteca google.generativeai, que é pesada) só é
+# carregado na primeira chamada à IA. Assim, importar este módulo é rápido e não
+# tem efeitos colaterais: scripts que só usam as funções de SQL nem tocam no Gemini.
+_modelo_gemini = None
+_trava_modelo_gemini = threading.Lock()
+
+def _obter_modelo():
+    """
+    Retorna o GenerativeModel do Gemini, configurando a biblioteca na primeira chamada.
+    Levanta RuntimeError se a chave da API não existir ou nenhum modelo puder ser criado.
+    """
+    global _modelo_gemini
+    if _modelo_gemini is not None:
+        return _modelo_gemini
+
+    with _trava_modelo_gemini:
+        if _modelo_gemini is not None:
+            return _modelo_gemini
+        if not GOOGLE_API_KEY:
+            raise RuntimeError("Chave da API do Google não encontrada. Verifique seu arquivo .env")
+
+        import google.generativeai as genai
+        genai.configure(api_key=GOOGLE_API_KEY)
+
+        # TENTATIVA 1: Usar um nome de modelo mais específico e comum atualmente
+        try:
+            _modelo_gemini = genai.GenerativeModel(MODEL_NAME)
+            print(f"\nUsando o modelo: {MODEL_NAME}")
+        except Exception as e:
+            print(f"Erro ao inicializar o modelo '{MODEL_NAME}'. Detalhe: {e}")
+            try:
+                print(f"Tentando fallback com: {MODEL_NAME_FALLBACK}")
+                _modelo_gemini = genai.GenerativeModel(MODEL_NAME_FALLBACK)
+                print(f"\nUsando o modelo de fallback: {MODEL_NAME_FALLBACK}")
+            except Exception as e_fallback:
+                raise RuntimeError(
+                    f"Erro ao inicializar o modelo de fallback '{MODEL_NAME_FALLBACK}'. "
+                    f"Verifique a lista de modelos disponíveis. Detalhe: {e_fallback}"
+                ) from e_fallback
+        return _modelo_gemini
+
+def __getattr__(nome):
+    # Compatibilidade: 'agente_dados.model' continua funcionando, mas agora é criado sob demanda
+    if nome == "model":
+        return _obter_modelo()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
 def processar_pergunta_com_gemini(pergunta_usuario: str):
     """
@@ -139,7 +169,8 @@ def processar_pergunta_com_gemini(pergunta_usuario: str):
 
 
          # 2.CONFIGURAÇÃO DA GERAÇÃO (Opcional, mas útil)
-        generation_config = genai.types.GenerationConfig(
+        from google.generativeai.types import GenerationConfig
+        generation_config = GenerationConfig(
             # response_mime_type="application/json", # Habilitar se a versão da lib suportar e funcionar bem
             candidate_count=1, # Queremos apenas uma melhor resposta.
             temperature=0.1    # VALOR BAIXO (0.0 a ~0.3): Torna a resposta mais determinística, factual, menos "criativa".
@@ -148,7 +179,7 @@ def processar_pergunta_com_gemini(pergunta_usuario: str):
         )
         
         # 3. CHAMADA À API DO GEMINI
-        response = model.generate_content( # 'model' é a nossa instância do GenerativeModel
+        response = _obter_modelo().generate_content( # _obter_modelo() devolve a nossa instância do GenerativeModel
             prompt,                          # O prompt que criamos acima.
             generation_config=generation_config # As configurações de geração.
         )
@@ -212,96 +243,204 @@ def processar_pergunta_com_gemini(pergunta_usuario: str):
 
 def conectar_bd():
     """
-    Cria e retorna uma conexão com o banco de dados MySQL.
+    Empresta uma conexão do pool de conexões MySQL do processo.
+    Chamar .close() na conexão devolve ela ao pool (não fecha de verdade).
     Retorna None em caso de falha na conexão.
     """
     try:
-        conexao = mysql.connector.connect(
-            host=DB_HOST,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME
-        )
-        print("Conexão com o MySQL bem-sucedida!")
-        return conexao
-    except mysql.connector.Error as err:
+        return obter_pool().obter()
+    except (mysql.connector.Error, PoolEsgotadoError) as err:
         print(f"Erro ao conectar ao MySQL: {err}")
         return None
 
-def obter_esquema_bd():
-    print(">>> DEBUG: Função obter_esquema_bd() FOI CHAMADA.")
+# Cache do esquema do banco, compartilhado entre as sessões e persistido em disco.
+# Dentro da validade, o esquema é servido sem nenhuma consulta; depois dela, uma
+# "impressão digital" barata do esquema decide se vale a pena recarregar tudo.
+ESQUEMA_TTL_SEGUNDOS = int(os.getenv("ESQUEMA_TTL_SEGUNDOS", "600"))
+cache_esquema = CachePersistente("esquema_bd.json", ESQUEMA_TTL_SEGUNDOS)
+
+CONSULTA_IMPRESSAO_ESQUEMA = """
+    SELECT COUNT(*) AS total_colunas,
+           COALESCE(SUM(CRC32(CONCAT_WS('|', TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY))), 0) AS soma_crc
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE();
+"""
+
+CONSULTA_ESQUEMA_COMPLETO = """
+    SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+    ORDER BY TABLE_NAME, ORDINAL_POSITION;
+"""
+
+def _ler_esquema_do_banco(cursor, impressao_digital: str):
+    """Lê o esquema completo (colunas, tipos e chaves) em uma única consulta ao information_schema."""
+    cursor.execute(CONSULTA_ESQUEMA_COMPLETO)
+    esquema = {}
+    for nome_tabela, nome_coluna, tipo, chave in cursor.fetchall():
+        esquema.setdefault(nome_tabela, []).append({"nome": nome_coluna, "tipo": tipo, "chave": chave or ""})
+    return {"impressao_digital": impressao_digital, "esquema": esquema}
+
+@rastrear("obter_esquema_bd")
+def obter_esquema_bd_detalhado():
     """
-    Conecta-se ao banco de dados e retorna um dicionário com a estrutura das tabelas.
-    Formato do retorno: {'nome_tabela1': ['coluna1', 'coluna2'], 'nome_tabela2': [...]}
+    Retorna o esquema do banco com tipos e chaves de cada coluna, usando o cache do processo.
+    Formato do retorno: {'nome_tabela': [{'nome': 'coluna', 'tipo': 'int(11)', 'chave': 'PRI'}, ...]}
     """
+    chave_cache = f"{DB_HOST}/{DB_NAME}"
+    em_cache = cache_esquema.obter(chave_cache)
+    if em_cache:
+        return em_cache["esquema"]
+
     print("\n--- Lendo esquema do banco de dados... ---")
+    # Reutilizamos nossa função de conexão (emprestada do pool)
+    conexao = conectar_bd()
+    if not conexao:
+        # Sem banco, um esquema vencido ainda é melhor do que nenhum
+        vencido = cache_esquema.obter_mesmo_expirado(chave_cache)
+        return vencido["esquema"] if vencido else None
+
     try:
-        # Reutilizamos nossa função de conexão que já é robusta
-        conexao = conectar_bd()
-        if not conexao:
-            return None
-        
         cursor = conexao.cursor()
-        
-        # 1. Pega o nome de todas as tabelas do banco
-        cursor.execute("SHOW TABLES;")
-        tabelas = cursor.fetchall()
-
-        esquema = {}
-        # 2. Itera sobre cada tabela encontrada
-        for (nome_tabela,) in tabelas:
-            # 3. Para cada tabela, busca o nome das suas colunas
-            cursor.execute(f"SHOW COLUMNS FROM {nome_tabela};")
-            
-            # Pega apenas o primeiro elemento de cada linha do resultado (que é o nome da coluna)
-            colunas = [coluna[0] for coluna in cursor.fetchall()]
-            
-            # 4. Armazena no nosso dicionário de esquema
-            esquema[nome_tabela] = colunas
-        
+
+        vencido = cache_esquema.obter_mesmo_expirado(chave_cache)
+        cursor.execute(CONSULTA_IMPRESSAO_ESQUEMA)
+        impressao_digital = "{}:{}".format(*cursor.fetchone())
+
+        if vencido and vencido["impressao_digital"] == impressao_digital:
+            # O esquema não mudou: só renovamos a validade do cache
+            cache_esquema.renovar(chave_cache)
+            cursor.close()
+            print("--- Esquema inalterado; cache renovado. ---")
+            return vencido["esquema"]
+
+        dados_esquema = _ler_esquema_do_banco(cursor, impressao_digital)
         cursor.close()
-        conexao.close()
+        cache_esquema.definir(chave_cache, dados_esquema)
         print("--- Esquema lido com sucesso! ---")
-        print(">>> DEBUG: Função obter_esquema_bd() está PRESTES A RETORNAR.")
-        return esquema
+        return dados_esquema["esquema"]
         
     except Exception as e:
         print(f"Erro ao obter o esquema do banco de dados: {e}")
         return None
+    finally:
+        conexao.close()  # devolve ao pool
+
+def obter_esquema_bd():
+    """
+    Retorna um dicionário com a estrutura das tabelas (servido pelo cache de esquema).
+    Formato do retorno: {'nome_tabela1': ['coluna1', 'coluna2'], 'nome_tabela2': [...]}
+    """
+    esquema = obter_esquema_bd_detalhado()
+    if esquema is None:
+        return None
+    return {tabela: [coluna["nome"] for coluna in colunas] for tabela, colunas in esquema.items()}
 
-def executar_consulta(query: str):
+@rastrear("executar_consulta")
+def executar_consulta(query: str, parametros: dict = None, tipos: str = None, usar_replica: bool = True):
     """
     Executa uma consulta SQL no banco de dados e retorna os resultados como um DataFrame do Pandas.
+    Os valores vão em `parametros` e aparecem no SQL como :nome (listas funcionam em IN :nome);
+    no MySQL a consulta é preparada no servidor e reaproveitada (ver sql_parametrizado.py).
+    Com `tipos` (nome de uma consulta em tipos_colunas.TIPOS_POR_CONSULTA), as colunas
+    ganham tipos compactos (category, datetime64, float64/int32) seja qual for a fonte.
     Retorna None se a conexão ou a consulta falharem.
+    Leituras sobre vendas, catálogo e pedidos vão para a réplica analítica local quando
+    ela está ligada e em dia (ver replica_analitica.py); caso contrário, para o MySQL.
+    SQL gerado pela IA deve passar usar_replica=False: só o MySQL garante o resultado dele.
     """
+    df = consultar_na_replica(query, parametros=parametros) if usar_replica else None
+    if df is not None:
+        registrar_na_etapa(fonte="replica")
+        return aplicar_tipos(df, tipos) if tipos else df
+
     conexao = conectar_bd()
     if conexao is None:
         return None
 
     try:
-        # Usar o pandas para ler o SQL diretamente em um DataFrame
-        df = pd.read_sql(query, conexao)
-        return df
+        df = executar_parametrizada(conexao, query, parametros)
+        return aplicar_tipos(df, tipos) if tipos else df
     except mysql.connector.Error as err:
         print(f"Erro ao executar consulta: {err}")
+        if isinstance(err, mysql.connector.errors.OperationalError):
+            conexao.invalidar()  # conexão provavelmente caiu; não volta para o pool
         return None
     except Exception as e:
         print(f"Ocorreu um erro inesperado: {e}")
         return None
     finally:
-        if conexao and conexao.is_connected():
-            conexao.close()
-            print("Conexão com o MySQL fechada.")
+        # Devolve a conexão ao pool para ser reaproveitada pela próxima consulta
+        conexao.close()
 
+@rastrear("executar_consulta_em_streaming")
+def executar_consulta_em_streaming(query: str, ao_receber_lote=None, ao_iniciar=None):
+    """
+    Executa uma consulta lendo o resultado em lotes (cursor sem buffer), com limite de
+    linhas e de memória. Usada para o SQL gerado pela IA, que pode trazer resultados enormes.
+      - ao_receber_lote(df_lote, linhas_lidas): chamada a cada lote, para exibir os dados enquanto chegam.
+      - ao_iniciar(consulta): recebe a ConsultaEmStreaming, que pode ser cancelada com consulta.cancelar().
+    Retorna o DataFrame (com df.attrs['aviso_truncamento'] se o resultado foi cortado) ou None em caso de erro.
+    Roda sempre no MySQL, nunca na réplica analítica (ver replica_analitica.py).
+    """
+    try:
+        df, consulta = ler_em_streaming(query, ao_receber_lote=ao_receber_lote, ao_iniciar=ao_iniciar)
+    except PoolEsgotadoError as e:
+        print(f"Erro ao conectar ao MySQL: {e}")
+        return None
+    except mysql.connector.Error as err:
+        print(f"Erro ao executar consulta: {err}")
+        return None
+    except Exception as e:
+        print(f"Ocorreu um erro inesperado: {e}")
+        return None
+
+    if consulta.cancelada:
+        df.attrs['aviso_truncamento'] = f"Consulta cancelada; exibindo as {len(df)} linhas lidas até o cancelamento."
+    elif consulta.truncada:
+        df.attrs['aviso_truncamento'] = f"{consulta.motivo_truncamento} Exibindo apenas as primeiras {len(df)} linhas."
+    return df
+
+# Cache das respostas de Text-to-SQL do Gemini.
+# A chave combina a pergunta normalizada, o esquema e a versão do prompt abaixo;
+# como o prompt obriga o uso de datas relativas (CURDATE()), o SQL continua válido nos dias seguintes.
+# IMPORTANTE: incremente PROMPT_SQL_VERSAO sempre que o prompt de gerar_sql_com_ia mudar.
+PROMPT_SQL_VERSAO = "1"
+CACHE_SQL_TTL_SEGUNDOS = int(os.getenv("CACHE_SQL_TTL_SEGUNDOS", str(7 * 24 * 3600)))
+CACHE_SQL_MAX_ITENS = int(os.getenv("CACHE_SQL_MAX_ITENS", "500"))
+cache_sql_ia = CachePersistente("sql_gerado_ia.json", CACHE_SQL_TTL_SEGUNDOS, max_itens=CACHE_SQL_MAX_ITENS)
+
+def chave_cache_sql(pergunta_usuario: str, esquema_bd: dict) -> str:
+    """Monta a chave do cache de SQL: pergunta normalizada + hash do esquema + versão do prompt."""
+    hash_esquema = hashlib.sha256(json.dumps(esquema_bd, sort_keys=True, default=str).encode()).hexdigest()[:16]
+    base = f"{normalizar_pergunta(pergunta_usuario)}|{hash_esquema}|{PROMPT_SQL_VERSAO}"
+    return hashlib.sha256(base.encode()).hexdigest()
+
+@rastrear("gerar_sql_com_ia")
 def gerar_sql_com_ia(pergunta_usuario: str, esquema_bd: dict) -> str:
     """
     Você é um especialista em MySQL. Sua tarefa é gerar uma única consulta SQL que responda à pergunta do usuário, com base no esquema do banco de dados e nas regras de negócio fornecidas.
-
+    Respostas já geradas para a mesma pergunta (normalizada) e o mesmo esquema vêm do cache, sem chamar o Gemini.
     """
+    chave_cache = chave_cache_sql(pergunta_usuario, esquema_bd)
+    sql_em_cache = cache_sql_ia.obter(chave_cache)
+    if sql_em_cache:
+        print("\n--- SQL encontrado no cache (Gemini não foi chamado) ---")
+        registrar_na_etapa(cache=True)
+        return sql_em_cache
+
     # Primeiro, formatamos o esquema do banco em um texto legível para a IA
+    # (aceita tanto a lista simples de colunas quanto o esquema detalhado, com tipos e chaves)
     esquema_texto = ""
     for tabela, colunas in esquema_bd.items():
-        esquema_texto += f"Tabela: {tabela}, Colunas: {', '.join(colunas)}\n"
+        descricoes = []
+        for coluna in colunas:
+            if isinstance(coluna, dict):
+                chave = f", {coluna['chave']}" if coluna.get("chave") else ""
+                descricoes.append(f"{coluna['nome']} ({coluna['tipo']}{chave})")
+            else:
+                descricoes.append(coluna)
+        esquema_texto += f"Tabela: {tabela}, Colunas: {', '.join(descricoes)}\n"
 
     # Agora, criamos o prompt de Text-to-SQL
     prompt = f"""
@@ -349,7 +488,8 @@ def gerar_sql_com_ia(pergunta_usuario: str, esquema_bd: dict) -> str:
     print("\n--- Enviando pergunta e esquema para o Gemini gerar o SQL... ---")
     
     try:
-        response = model.generate_content(prompt)
+        response = _obter_modelo().generate_content(prompt)
+        registrar_na_etapa(tamanho_prompt=len(prompt), tamanho_resposta=len(response.text))
         
         # Limpeza básica da resposta para remover ```sql e ``` que a IA às vezes adiciona
         sql_gerado = response.text.strip()
@@ -358,11 +498,15 @@ def gerar_sql_com_ia(pergunta_usuario: str, esquema_bd: dict) -> str:
         if sql_gerado.endswith("```"):
             sql_gerado = sql_gerado[:-3]
         
-        return sql_gerado.strip()
+        sql_gerado = sql_gerado.strip()
+        if sql_gerado:
+            cache_sql_ia.definir(chave_cache, sql_gerado)
+        return sql_gerado
     except Exception as e:
         print(f"Erro ao gerar SQL com a IA: {e}")
         return ""
 
+@rastrear("resumir_resultados_com_gemini")
 def resumir_resultados_com_gemini(df_resultado, pergunta_original: str):
     """
     Usa o Gemini para criar um resumo em texto a partir de um DataFrame de resultados.
@@ -372,7 +516,13 @@ def resumir_resultados_com_gemini(df_resultado, pergunta_original: str):
         
     try:
         # Converte o DataFrame para uma string em formato de markdown, que é fácil para o LLM ler.
-        resultado_str = df_resultado.to_markdown()
+        # (cada linha custa pelo menos um token, então tabelas mais longas que o orçamento nem são convertidas)
+        resultado_str = df_resultado.to_markdown() if len(df_resultado) <= RESUMO_ORCAMENTO_TOKENS else None
+        descricao_dados = "Dados da Consulta (em formato Markdown)"
+        if resultado_str is None or estimar_tokens(resultado_str) > RESUMO_ORCAMENTO_TOKENS:
+            # Tabela grande demais: manda um resumo estatístico de tamanho limitado em vez das linhas
+            resultado_str = montar_resumo_resultado(df_resultado)
+            descricao_dados = "Resumo estatístico dos Dados da Consulta (a tabela completa é grande demais para enviar)"
 
         prompt = f"""
         Com base na pergunta original do usuário e nos dados da consulta abaixo, escreva um resumo amigável e conciso em português.
@@ -381,14 +531,15 @@ def resumir_resultados_com_gemini(df_resultado, pergunta_original: str):
         Pergunta Original do Usuário:
         "{pergunta_original}"
 
-        Dados da Consulta (em formato Markdown):
+        {descricao_dados}:
         {resultado_str}
 
         Seu resumo em linguagem natural:
         """
 
         print("\nGerando resumo em texto com o Gemini...")
-        response = model.generate_content(prompt)
+        response = _obter_modelo().generate_content(prompt)
+        registrar_na_etapa(tamanho_prompt=len(prompt))
         return response.text
         
     except Exception as e:
@@ -426,21 +577,21 @@ def obter_vendas_produto_periodo(item_codigo: str, dias: int) -> float:
     Retorna a quantidade total como um float.
     """
     # Calcula a data de início do período
-    data_inicio = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d')
-    data_fim = datetime.now().strftime('%Y-%m-%d')
+    data_inicio = (datetime.now() - timedelta(days=dias)).date()
+    data_fim = datetime.now().date()
     
-    # Monta a consulta SQL
-    consulta = f"""
+    # Monta a consulta SQL (o código do item vem do chat: vai como parâmetro, nunca no texto do SQL)
+    consulta = """
         SELECT SUM(item_quantidade) 
         FROM vendas_detalhes 
-        WHERE item_codigo = '{item_codigo}' 
+        WHERE item_codigo = :item_codigo 
           AND situacao_desc IN ('Aprovado', 'Em Aberto', 'Em andamento')
-          AND data BETWEEN '{data_inicio}' AND '{data_fim}';
+          AND data BETWEEN :data_inicio AND :data_fim;
     """
     
     print(f"Buscando vendas para o item {item_codigo} nos últimos {dias} dias...")
     
-    df_resultado = executar_consulta(consulta) # Usamos nossa função que já conecta e executa SQL
+    df_resultado = executar_consulta(consulta, {"item_codigo": item_codigo, "data_inicio": data_inicio, "data_fim": data_fim})
     
     if df_resultado is not None and not df_resultado.empty:
         # O resultado de SUM() pode ser None se não houver vendas
@@ -449,30 +600,58 @@ def obter_vendas_produto_periodo(item_codigo: str, dias: int) -> float:
     else:
         return 0.0
 
+# Catálogo (produtos_2) em memória: explosão de kits e dados dos SKUs primários sem ir ao banco
+# Vendas já explodidas em memória (cache_vendas_base, definido abaixo) são descartadas se os kits mudarem.
+# Impressão digital e estoque vêm sempre do MySQL: a soma de CRC32 da réplica não é a mesma
+# (e a alternância entre as fontes recarregaria o catálogo), e o estoque da réplica pode estar atrasado
+indice_catalogo = IndiceCatalogo(
+    lambda: executar_consulta(CONSULTA_CATALOGO, tipos="catalogo"),
+    lambda: executar_consulta(CONSULTA_IMPRESSAO_CATALOGO, usar_replica=False),
+    lambda: executar_consulta(CONSULTA_ESTOQUE_PRIMARIOS, tipos="catalogo", usar_replica=False),
+    identificador_banco=f"{DB_HOST}/{DB_NAME}",
+    ao_alterar_kits=lambda: cache_vendas_base.invalidar(),
+)
+
+def _buscar_vendas_explodidas_periodo(data_inicio, data_fim) -> pd.DataFrame:
+    """
+    Busca no banco as vendas do intervalo [data_inicio, data_fim], somadas por dia e código
+    vendido (sem JOIN com produtos_2), e aplica a 'explosão de kits' pelo índice do catálogo.
+    Como a explosão é uma multiplicação por código, somar antes não muda nenhum total.
+    Retorna as colunas data, sku_primario, demanda_primario e faturamento_custo (ou None).
+    """
+    query = """
+        SELECT v.data, v.item_codigo, SUM(v.item_quantidade) AS item_quantidade
+        FROM vendas_detalhes v
+        WHERE v.situacao_desc IN ('Aprovado', 'Em Aberto', 'Em andamento')
+          AND v.data BETWEEN :data_inicio AND :data_fim
+        GROUP BY v.data, v.item_codigo;
+    """
+    df_vendas = executar_consulta(query, {"data_inicio": como_data(data_inicio), "data_fim": como_data(data_fim)},
+                                  tipos="vendas_por_codigo")
+    if df_vendas is None:
+        return None
+    return indice_catalogo.explodir_vendas(df_vendas)
+
+def _buscar_vendas_base_periodo(data_inicio, data_fim) -> pd.DataFrame:
+    """
+    Busca as vendas do intervalo [data_inicio, data_fim] com a lógica de 'explosão de kits'.
+    Usada pelo cache de vendas para buscar só os dias que faltam.
+    """
+    print(f"Buscando no banco as vendas de {data_inicio:%Y-%m-%d} a {data_fim:%Y-%m-%d}...")
+    df = _buscar_vendas_explodidas_periodo(data_inicio, data_fim)
+    return None if df is None else df[['data', 'sku_primario', 'demanda_primario']]
+
+# Cache do processo com a maior janela de vendas já buscada (ver cache_vendas.py)
+cache_vendas_base = CacheJanelaVendas(_buscar_vendas_base_periodo)
+
 def obter_dados_base_vendas(dias: int) -> pd.DataFrame:
     """
     Função 'motor' que busca os dados de vendas brutos, já com a lógica de
-    'explosão de kits', retornando um DataFrame não agregado.
+    'explosão de kits', retornando um DataFrame não agregado por SKU (uma linha por dia e código vendido).
+    Servida pelo cache de vendas: janelas menores que a já carregada não vão ao banco.
     """
     print(f"\n--- Buscando dados base de vendas dos últimos {dias} dias... ---")
-    hoje = datetime.now()
-    data_fim = (hoje - timedelta(days=1)).strftime('%Y-%m-%d')
-    data_inicio = (hoje - timedelta(days=dias)).strftime('%Y-%m-%d')
-    
-    query = f"""
-        SELECT 
-            v.data,
-            p.sku_primario,
-            v.item_quantidade * IF(p.quantidade = 0, 1, p.quantidade) AS demanda_primario
-        FROM 
-            vendas_detalhes v
-        JOIN 
-            produtos_2 p ON v.item_codigo = p.codigo
-        WHERE 
-            v.situacao_desc IN ('Aprovado', 'Em Aberto', 'Em andamento')
-            AND v.data BETWEEN '{data_inicio}' AND '{data_fim}';
-    """
-    df_vendas_base = executar_consulta(query)
+    df_vendas_base = cache_vendas_base.obter(dias)
     
     return df_vendas_base if df_vendas_base is not None else pd.DataFrame()
 
@@ -483,7 +662,7 @@ def calcular_demanda_por_sku_primario(df_vendas_base: pd.DataFrame) -> dict:
     if df_vendas_base.empty:
         return {}
     
-    df_demanda_final = df_vendas_base.groupby('sku_primario')['demanda_primario'].sum()
+    df_demanda_final = df_vendas_base.groupby('sku_primario', observed=True)['demanda_primario'].sum()
     print("--- Cálculo de demanda a partir dos dados base finalizado ---")
     return df_demanda_final.to_dict()
 
@@ -502,106 +681,126 @@ DADOS_FORNECEDORES = {
     'CULLIGAN LATAM LTDA': {'id': 15861666951, 'tempo_entrega': 30}
 }
 
+def calcular_sugestoes_compra(demanda_por_sku: pd.Series, df_produtos_primarios: pd.DataFrame,
+                              pedidos_em_aberto_por_sku: pd.Series, mapa_curva_abc: dict,
+                              dias_janela: int = 30) -> pd.DataFrame:
+    """
+    Motor vetorizado da sugestão de compras. Junta demanda, catálogo, prazos dos
+    fornecedores e pedidos em aberto em um único DataFrame e aplica a fórmula de
+    compra em todas as linhas de uma vez (sem loops em Python).
+
+    Recebe:
+      - demanda_por_sku: Series com a demanda total no período, indexada por sku_primario.
+      - df_produtos_primarios: catálogo dos SKUs primários (id, sku_primario, nome, saldoVirtualTotal, Fornecedor, precoCusto).
+      - pedidos_em_aberto_por_sku: Series com as quantidades em pedidos abertos, indexada pelo SKU.
+      - mapa_curva_abc: dicionário {sku_primario: curva}.
+    Retorna apenas as linhas com sugestão de compra > 0, com as colunas do relatório
+    e as colunas auxiliares usadas na criação dos pedidos na API.
+    """
+    # Em SKUs duplicados no catálogo vale a última linha, como no dicionário antigo
+    df_produtos = df_produtos_primarios.drop_duplicates(subset='sku_primario', keep='last')
+
+    # SKU como object: os .map()/.fillna() abaixo não funcionariam em uma coluna category
+    df = pd.DataFrame({'SKU': np.asarray(demanda_por_sku.index, dtype=object), 'Vendas 30d': demanda_por_sku.to_numpy()})
+    df = df.merge(df_produtos, left_on='SKU', right_on='sku_primario', how='inner', sort=False)
+
+    media_diaria = df['Vendas 30d'].to_numpy(dtype=float) / float(dias_janela)
+
+    fornecedor = df['Fornecedor'].astype('string').str.strip().str.upper()
+    tempo_entrega = fornecedor.map({nome: dados['tempo_entrega'] for nome, dados in DADOS_FORNECEDORES.items()})
+    id_fornecedor = fornecedor.map({nome: dados['id'] for nome, dados in DADOS_FORNECEDORES.items()})
+
+    estoque_atual = df['saldoVirtualTotal'].to_numpy(dtype=float)
+    pedidos_em_aberto = df['SKU'].map(pedidos_em_aberto_por_sku).fillna(0.0).to_numpy(dtype=float)
+
+    dias_de_cobertura = dias_janela + tempo_entrega.to_numpy(dtype=float, na_value=np.nan)
+    estoque_necessario = dias_de_cobertura * media_diaria
+    quantidade_a_comprar = estoque_necessario - estoque_atual - pedidos_em_aberto
+
+    # Mesmos filtros do cálculo linha a linha: demanda positiva, fornecedor conhecido e compra > 0
+    manter = (media_diaria > 0) & tempo_entrega.notna().to_numpy() & (quantidade_a_comprar > 0)
+    if not manter.any():
+        return pd.DataFrame()
+
+    media_diaria = media_diaria[manter]
+    df = df.loc[manter]
+
+    return pd.DataFrame({
+        'Fornecedor': fornecedor[manter].to_numpy(dtype=object),
+        'SKU': df['SKU'].to_numpy(),
+        'Curva': df['SKU'].map(mapa_curva_abc).fillna('N/D').to_numpy(),
+        'Vendas 30d': df['Vendas 30d'].to_numpy(),
+        # round() do Python (e não np.round) para manter exatamente os valores do relatório antigo
+        'Média Venda/Dia': [round(media, 2) for media in media_diaria.tolist()],
+        'Estoque Atual': df['saldoVirtualTotal'].to_numpy(),
+        'Duração Estoque (dias)': np.rint(estoque_atual[manter] / media_diaria).astype('int64'),
+        'Pedido em Aberto': pedidos_em_aberto[manter].astype('int64'),
+        'Sugestão de Compra': np.ceil(quantidade_a_comprar[manter]).astype('int64'),
+        'produto_id': df['id'].to_numpy(),
+        'nome_produto': df['nome'].to_numpy(),
+        'preco_custo': df['precoCusto'].to_numpy(),
+        'id_fornecedor_api': id_fornecedor[manter].astype('int64').to_numpy(),
+    })
+
 # VERSÃO COMPLETA E DEFINITIVA
+@rastrear("sugerir_compras")
 def sugerir_compras(dry_run=True, fornecedores_selecionados=None):
     """
     Função principal que integra a Análise ABC e gera um relatório detalhado de sugestões de compra,
     retornando um DataFrame para exibição na interface.
     """
-    # ETAPA 1: Análise ABC para classificação estratégica
-     # 1. Busca os dados base UMA VEZ SÓ
+    # ETAPA 1: Análise ABC para classificação estratégica (mesma janela de 30 dias da demanda)
+    print("\n--- Etapa 1 de 4: Classificando os SKUs pela Curva ABC...")
+    hoje = datetime.now()
+    df_abc = analisar_curva_abc((hoje - timedelta(days=30)).strftime('%Y-%m-%d'), (hoje - timedelta(days=1)).strftime('%Y-%m-%d'))
+    mapa_curva_abc = dict(zip(df_abc['sku_primario'], df_abc['curva_abc'])) if df_abc is not None else {}
+
+    # 1. Busca os dados base UMA VEZ SÓ
     df_vendas_base = obter_dados_base_vendas(30)
 
     # ETAPA 2: Cálculo de Demanda
     print("\n--- Etapa 2 de 4: Calculando demanda de vendas por SKU primário...")
-    demanda_por_sku = calcular_demanda_por_sku_primario(df_vendas_base)
-    if not demanda_por_sku:
+    if df_vendas_base.empty:
         print("Análise encerrada por falta de dados de demanda.")
         return pd.DataFrame() # Retorna um DataFrame vazio
+    demanda_por_sku = df_vendas_base.groupby('sku_primario', observed=True)['demanda_primario'].sum()
 
     # ETAPA 3: Busca de Dados dos Produtos
     print("\n--- Etapa 3 de 4: Buscando informações dos produtos primários...")
-    base_query = "SELECT id, produto_id, sku_primario, nome, saldoVirtualTotal, Fornecedor, precoCusto FROM produtos_2 WHERE codigo = sku_primario"
-    
-    if fornecedores_selecionados:
-        # Se a lista tiver apenas um item, o tuple precisa de uma vírgula no final -> ('Fornecedor1',)
-        if len(fornecedores_selecionados) == 1:
-            base_query += f" AND Fornecedor = '{fornecedores_selecionados[0]}'"
-        else:
-            base_query += f" AND Fornecedor IN {tuple(fornecedores_selecionados)}"
-    else:
-        fornecedores_validos = tuple(DADOS_FORNECEDORES.keys())
-        base_query += f" AND Fornecedor IN {fornecedores_validos}"
-
-    df_produtos_primarios = executar_consulta(base_query + ";")
+    # A lista de fornecedores vai como parâmetro: funciona com um só item e com nomes que têm aspas
+    # Vem do índice do catálogo; a impressão digital é conferida e o estoque relido agora
+    df_produtos_primarios = indice_catalogo.produtos_primarios(
+        list(fornecedores_selecionados or DADOS_FORNECEDORES.keys()), forcar_verificacao=True
+    )
     
     if df_produtos_primarios is None or df_produtos_primarios.empty:
         print("Não foi possível buscar produtos para os filtros selecionados.")
         return pd.DataFrame()
 
-    info_produtos = {row['sku_primario']: row.to_dict() for index, row in df_produtos_primarios.iterrows()}
+    # Pedidos em aberto de todos os SKUs em uma única consulta agrupada
+    # (a tabela de pedidos abertos é pequena; trazer tudo evita um IN gigante)
+    pedidos_em_aberto_por_sku = obter_pedidos_em_aberto_em_lote()
     
-    sugestoes = []
-    print("\n--- Etapa 4 de 4: Analisando necessidade de compra para cada SKU... ---")
-    
-    for sku, demanda_total in demanda_por_sku.items():
-        produto_info = info_produtos.get(sku)
-        if not produto_info:
-            continue
-
-        media_diaria_vendas = demanda_total / 30.0
-        if media_diaria_vendas <= 0:
-            continue
-
-        nome_fornecedor_db = produto_info['Fornecedor'].strip().upper()
-        dados_do_fornecedor = DADOS_FORNECEDORES.get(nome_fornecedor_db)
-        if not dados_do_fornecedor:
-            continue
-            
-        estoque_atual = produto_info['saldoVirtualTotal']
-        tempo_entrega = dados_do_fornecedor['tempo_entrega']
-        pedidos_em_aberto = obter_pedidos_em_aberto(sku)
-        duracao_estoque_dias = estoque_atual / media_diaria_vendas if media_diaria_vendas > 0 else float('inf')
-        
-        dias_de_cobertura = 30 + tempo_entrega
-        estoque_necessario = dias_de_cobertura * media_diaria_vendas
-        quantidade_a_comprar = estoque_necessario - estoque_atual - pedidos_em_aberto
-
-        if quantidade_a_comprar > 0:
-            sugestao = {
-                'Fornecedor': nome_fornecedor_db,
-                'SKU': sku,
-                'Curva': mapa_curva_abc.get(sku, 'N/D'),
-                'Vendas 30d': demanda_total,
-                'Média Venda/Dia': round(media_diaria_vendas, 2),
-                'Estoque Atual': estoque_atual,
-                'Duração Estoque (dias)': round(duracao_estoque_dias),
-                'Pedido em Aberto': int(pedidos_em_aberto),
-                'Sugestão de Compra': math.ceil(quantidade_a_comprar),
-                'produto_id': produto_info['id'],
-                'nome_produto': produto_info['nome'],
-                'preco_custo': produto_info['precoCusto'],
-                'id_fornecedor_api': dados_do_fornecedor['id']
-            }
-            sugestoes.append(sugestao)
+    print("\n--- Etapa 4 de 4: Analisando necessidade de compra para todos os SKUs... ---")
+    df_compras_necessarias = calcular_sugestoes_compra(
+        demanda_por_sku, df_produtos_primarios, pedidos_em_aberto_por_sku, mapa_curva_abc
+    )
 
     print("\n--- ANÁLISE CONCLUÍDA ---")
     
-    df_compras_necessarias = pd.DataFrame() # Cria um DataFrame vazio como padrão
-    if sugestoes:
-        df_sugestoes_final = pd.DataFrame(sugestoes)
-        df_compras_necessarias = df_sugestoes_final[df_sugestoes_final['Sugestão de Compra'] > 0].copy()
-    
     if not df_compras_necessarias.empty and not dry_run:
         print("\n--- GERANDO PEDIDOS DE COMPRA NO BLING ---")
         sugestoes_finais_para_api = df_compras_necessarias.to_dict('records')
         pedidos_por_fornecedor = agrupar_sugestoes_por_fornecedor(sugestoes_finais_para_api)
-        sucesso_total = True
-        for nome_fornecedor, produtos in pedidos_por_fornecedor.items():
-            id_fornecedor = DADOS_FORNECEDORES[nome_fornecedor]['id']
-            sucesso_pedido = criar_pedido_de_compra_api(nome_fornecedor, id_fornecedor, produtos, dry_run=dry_run)
-            if not sucesso_pedido:
-                sucesso_total = False
+        # Os fornecedores são enviados em paralelo, respeitando o limite de requisições do Bling
+        df_resultado_envio = enviar_pedidos_em_paralelo(
+            pedidos_por_fornecedor,
+            {nome: DADOS_FORNECEDORES[nome]['id'] for nome in pedidos_por_fornecedor},
+            _obter_access_token,
+            renovar_token,
+        )
+        print(df_resultado_envio.to_string())
+        sucesso_total = (df_resultado_envio['Status'] == 'criado').all()
         
         if sucesso_total:
             print("\nTodos os pedidos de compra foram processados com sucesso.")
@@ -614,36 +813,93 @@ def sugerir_compras(dry_run=True, fornecedores_selecionados=None):
             'Fornecedor', 'SKU', 'Curva', 'Vendas 30d', 'Média Venda/Dia', 
             'Estoque Atual', 'Duração Estoque (dias)', 'Pedido em Aberto', 'Sugestão de Compra'
         ]
-        return df_compras_necessarias[colunas_relatorio]
+        df_relatorio = df_compras_necessarias[colunas_relatorio]
+        if not dry_run:
+            # Tabela com o resultado do envio de cada fornecedor, para a interface mostrar
+            df_relatorio.attrs['resultado_envio'] = df_resultado_envio
+        return df_relatorio
     else:
         # Retorna um DataFrame vazio se não houver compras a sugerir
         return pd.DataFrame()
 
+def obter_pedidos_em_aberto_em_lote(skus=None) -> pd.Series:
+    """
+    Busca, em UMA única consulta agrupada, a quantidade total em pedidos de compra
+    com situação 'em aberto' ou 'em andamento' para todos os SKUs (ou só para os
+    SKUs informados).
+    Retorna uma Series indexada pelo código do SKU (SKUs sem pedido não aparecem).
+    """
+    # Assumindo que a coluna de SKU na tabela pedido_compras se chama 'codigo'.
+    consulta = """
+        SELECT codigo, SUM(quantidade) AS pedidos_em_aberto
+        FROM pedido_compras 
+        WHERE situacao IN ('em aberto', 'em andamento')
+    """
+    parametros = None
+    if skus is not None:
+        skus = [str(sku) for sku in skus]
+        if not skus:
+            return pd.Series(dtype=float, name='pedidos_em_aberto')
+        # Listas grandes vão para uma tabela temporária de chaves (ver sql_parametrizado.py)
+        consulta += " AND codigo IN :skus"
+        parametros = {"skus": skus}
+    consulta += " GROUP BY codigo;"
+
+    print(f"Verificando pedidos em aberto para {'todos os SKUs' if skus is None else f'{len(skus)} SKU(s)'}...")
+
+    df_resultado = executar_consulta(consulta, parametros, tipos="pedidos_em_aberto")
+
+    if df_resultado is None or df_resultado.empty:
+        return pd.Series(dtype=float, name='pedidos_em_aberto')
+
+    # O resultado de SUM() pode vir como Decimal ou None; normalizamos para float.
+    pedidos = pd.to_numeric(df_resultado['pedidos_em_aberto'], errors='coerce').fillna(0.0).astype(float)
+    pedidos.index = df_resultado['codigo']
+    return pedidos
+
 def obter_pedidos_em_aberto(sku: str) -> float:
     """
     Busca no banco de dados a quantidade total de um item que está em 
     pedidos de compra com situação 'em aberto' ou 'em andamento'.
+    Atalho para obter_pedidos_em_aberto_em_lote com um único SKU.
     """
-    # Monta a consulta SQL para a tabela 'pedido_compras'
-    # Usamos o operador IN para verificar as duas situações de uma vez.
-    # Assumindo que a coluna de SKU na tabela pedido_compras se chama 'codigo'.
-    consulta = f"""
-        SELECT SUM(quantidade) 
-        FROM pedido_compras 
-        WHERE codigo = '{sku}' 
-          AND situacao IN ('em aberto', 'em andamento');
+    pedidos = obter_pedidos_em_aberto_em_lote([sku])
+    return float(pedidos.get(sku, 0.0))
+
+def carregar_motor_cenarios(fornecedores_selecionados=None, max_janela_vendas: int = 90) -> MotorCenarios:
     """
-    
-    print(f"Verificando pedidos em aberto para o SKU: {sku}...")
-    
-    df_resultado = executar_consulta(consulta)
-    
-    if df_resultado is not None and not df_resultado.empty:
-        # O resultado de SUM() pode ser None (ou NaN no Pandas) se não houver registros.
-        pedidos_abertos = df_resultado.iloc[0, 0]
-        return float(pedidos_abertos) if pd.notna(pedidos_abertos) else 0.0
-    else:
-        return 0.0
+    Busca UMA VEZ as vendas (até `max_janela_vendas` dias), o catálogo, os pedidos em aberto e
+    os prazos dos fornecedores e devolve um MotorCenarios, que avalia grades de parâmetros da
+    sugestão de compras sem voltar ao banco (ver cenarios_compra.py). None se faltarem dados.
+    """
+    df_vendas_base = obter_dados_base_vendas(max_janela_vendas)
+    df_produtos_primarios = indice_catalogo.produtos_primarios(
+        list(fornecedores_selecionados or DADOS_FORNECEDORES.keys()), forcar_verificacao=True
+    )
+    if df_produtos_primarios is None or df_produtos_primarios.empty:
+        print("Não foi possível buscar produtos para os filtros selecionados.")
+        return None
+    return MotorCenarios(
+        df_vendas_base if not df_vendas_base.empty else pd.DataFrame(columns=['data', 'sku_primario', 'demanda_primario']),
+        df_produtos_primarios,
+        obter_pedidos_em_aberto_em_lote(),
+        {nome: dados['tempo_entrega'] for nome, dados in DADOS_FORNECEDORES.items()},
+    )
+
+@rastrear("simular_cenarios_compra")
+def simular_cenarios_compra(janelas_vendas=(30,), dias_cobertura=(None,), prazos_fornecedor=({},), crescimentos=(1.0,),
+                            fornecedores_selecionados=None) -> pd.DataFrame:
+    """
+    Gasto e unidades da sugestão de compras em cada combinação de parâmetros, por fornecedor
+    (os totais por cenário vão em df.attrs['totais_por_cenario']). Os dados são buscados uma
+    vez só; os cenários são calculados juntos, em arrays. Os parâmetros padrão reproduzem sugerir_compras.
+    """
+    motor = carregar_motor_cenarios(fornecedores_selecionados, max(janelas_vendas))
+    if motor is None:
+        return pd.DataFrame()
+    df_cenarios = motor.avaliar(janelas_vendas, dias_cobertura, prazos_fornecedor, crescimentos)
+    registrar_na_etapa(cenarios=len(df_cenarios.attrs['totais_por_cenario']), skus=len(motor.skus))
+    return df_cenarios
 
 def agrupar_sugestoes_por_fornecedor(sugestoes_finais: list) -> dict:
     pedidos_agrupados = {}
@@ -662,174 +918,84 @@ def agrupar_sugestoes_por_fornecedor(sugestoes_finais: list) -> dict:
         pedidos_agrupados[nome_fornecedor].append(produto_para_api)
     return pedidos_agrupados
 
-credenciais_file = r"C:\Users\Murilo\OneDrive\CTZ\APIs\Bling\auto\refresh_token.json"
-tokens_file = r"c:\Users\Murilo\OneDrive\CTZ\APIs\Bling\auto\tokens.json"
+# Tokens do Bling: caminhos configurados no .env, token em memória com renovação antecipada
+gerenciador_tokens_bling = GerenciadorTokens()
 
 def get_tokens():
-    try:
-        with open(tokens_file, "r") as f:
-            tokens = json.load(f)
-        return tokens
-    except FileNotFoundError:
-        print("Erro: Arquivo de tokens não encontrado!")
-        return None
+    return gerenciador_tokens_bling.ler_tokens()
 
 def save_tokens(tokens):
-    with open(tokens_file, "w") as f:
-        json.dump(tokens, f)
+    gerenciador_tokens_bling.salvar_tokens(tokens)
 
-def renovar_token():
-    try:
-        with open(credenciais_file, "r") as f:
-            credenciais = json.load(f)
-        client_id = credenciais.get("client_id")
-        client_secret = credenciais.get("client_secret")
-        
-        tokens = get_tokens()
-        if not tokens or "refresh_token" not in tokens:
-            print("Erro: Refresh token não encontrado!")
-            return None
-            
-        refresh_token = tokens["refresh_token"]
-        credenciais_base64 = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
-        
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "Accept": "1.0",
-            "Authorization": f"Basic {credenciais_base64}"
-        }
-        dados = {
-            "grant_type": "refresh_token",
-            "refresh_token": refresh_token
-        }
-        url = "https://api.bling.com.br/Api/v3/oauth/token"
-        
-        response = requests.post(url, headers=headers, data=dados)
-        
-        if response.status_code == 200:
-            token_info = response.json()
-            save_tokens(token_info) # Salva o novo conjunto de tokens (access e refresh)
-            print("Token renovado com sucesso.")
-            return token_info.get("access_token")
-        else:
-            print(f"Erro na renovação do token: {response.status_code} - {response.text}")
-            return None
-    except Exception as e:
-        print(f"Um erro inesperado ocorreu durante a renovação do token: {e}")
-        return None
+def renovar_token(token_rejeitado: str = None):
+    """
+    Renova o access token do Bling e retorna o novo (ou None).
+    Com `token_rejeitado`, threads que recebem 401 ao mesmo tempo compartilham uma única renovação.
+    """
+    return gerenciador_tokens_bling.renovar(token_rejeitado)
+
+def _obter_access_token():
+    """Access token em memória, renovado antes de expirar."""
+    return gerenciador_tokens_bling.obter_access_token()
 
 def criar_pedido_de_compra_api(nome_fornecedor: str, id_fornecedor: int, produtos_para_comprar: list, dry_run=True):
     """
     Monta e envia um pedido de compra para a API v3 do Bling, com lógica de
     renovação de token, re-tentativas e payload completo. (VERSÃO CORRIGIDA)
+    Para vários fornecedores de uma vez, prefira enviar_pedidos_em_paralelo.
     """
     print(f"\n--- Processando pedido para o fornecedor: {nome_fornecedor} ---")
 
-    # Monta a lista de itens com todos os detalhes que temos
-    itens_formatados = []
-    for produto in produtos_para_comprar:
-        itens_formatados.append({
-            "produto": {
-                "id": produto['id'],
-                "codigo": produto['sku']
-            },
-            "descricao": produto['nome'],
-            "quantidade": produto['quantidade'],
-            "valor": produto['preco'],
-            "unidade": "un",  # Unidade padrão, pode ser ajustada se necessário
-        })
-
-    # Monta o payload final
-    payload = {
-        "fornecedor": {"id": id_fornecedor},
-        "itens": itens_formatados,
-        "observacoes": f"Pedido gerado em {datetime.now().strftime('%d/%m/%Y %H:%M')} pelo Agente Cientista de Dados."
-    }
-
     if dry_run:
         print(">>> MODO DE SIMULAÇÃO (DRY RUN) ATIVADO <<<")
         print("Payload que seria enviado:")
-        print(json.dumps(payload, indent=2))
+        print(json.dumps(montar_payload_pedido(id_fornecedor, produtos_para_comprar), indent=2))
         return True
 
-    # Lógica de Autenticação e Chamada Real
-    tokens = get_tokens()
-    if not tokens or 'access_token' not in tokens:
-        access_token = renovar_token()
-        if not access_token:
-            return False
-    else:
-        access_token = tokens['access_token']
-    
-    url_api = "https://api.bling.com.br/Api/v3/pedidos/compras"
-    
-    for tentativa in range(2):
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        try:
-            print(f"Tentativa {tentativa + 1}: Enviando pedido para {nome_fornecedor}...")
-            #print("Payload que será enviado:", json.dumps(payload, indent=2)) # DEBUG
-            response = requests.post(url_api, data=json.dumps(payload), headers=headers)
-            
-            if response.status_code == 201:
-                print(f"SUCESSO: Pedido de compra para '{nome_fornecedor}' criado.")
-                print("Resposta da API:", json.dumps(response.json(), indent=2))
-                return True
-            
-            # Bloco elif com a lógica de renovação indentada corretamente
-            elif response.status_code == 401 and tentativa == 0:
-                print("Token expirado. Tentando renovar...")
-                access_token = renovar_token()
-                if not access_token:
-                    print("Falha ao renovar o token. Abortando.")
-                    return False
-                # Se renovou com sucesso, o loop continua para a segunda tentativa
-            
-            else:
-                print(f"ERRO: A API retornou um status inesperado ({response.status_code}).")
-                print("Resposta da API:", response.text)
-                return False
+    resultado = enviar_pedido(nome_fornecedor, id_fornecedor, produtos_para_comprar, _obter_access_token, renovar_token)
+    return resultado['Status'] == 'criado'
 
-        except requests.exceptions.RequestException as e:
-            print(f"ERRO de conexão ao tentar criar pedido. Erro: {e}")
-            return False
-            
-    print(f"Falha ao criar o pedido para {nome_fornecedor} após todas as tentativas.")
-    return False
+def _buscar_custo_diario_periodo(data_inicio, data_fim) -> pd.DataFrame:
+    """Faturamento a preço de custo por dia e SKU primário (alimenta o cubo da Curva ABC)."""
+    print(f"Atualizando o cubo da Curva ABC com os dias de {data_inicio:%Y-%m-%d} a {data_fim:%Y-%m-%d}...")
+    df = _buscar_vendas_explodidas_periodo(data_inicio, data_fim)
+    if df is None:
+        return None
+    return df.groupby(['data', 'sku_primario'], as_index=False, sort=False, observed=True)['faturamento_custo'].sum()
+
+# Cubo diário SKU x dia da Curva ABC, persistido em disco (ver cubo_abc.py)
+cubo_custo_diario = CuboCustoDiario(_buscar_custo_diario_periodo, identificador_banco=f"{DB_HOST}/{DB_NAME}")
+
+def obter_nomes_skus_primarios() -> pd.DataFrame:
+    """Nomes "oficiais" de todos os SKUs primários (linha do catálogo em que codigo = sku_primario), do índice do catálogo."""
+    return indice_catalogo.nomes_primarios()
 
+@rastrear("analisar_curva_abc")
 def analisar_curva_abc(data_inicio: str, data_fim: str):
     """
     Realiza a análise de Curva ABC com base no faturamento por SKU PRIMÁRIO e garante
     que o nome exibido seja o do produto primário.
+    O faturamento da janela vem do cubo diário (só os dias novos são buscados no banco).
+    Dias a partir de hoje ainda não fecharam e não entram no cubo.
     """
     print(f"\n--- Executando Análise ABC para o período de {data_inicio} a {data_fim} ---")
     
-    query = f"""
-        SELECT p.sku_primario, SUM(v.item_quantidade * p.precoCusto) as faturamento_custo
-        FROM vendas_detalhes v
-        JOIN produtos_2 p ON v.item_codigo = p.codigo
-        WHERE v.situacao_desc IN ('Aprovado', 'Em Aberto', 'Em andamento')
-          AND v.data BETWEEN '{data_inicio}' AND '{data_fim}'
-        GROUP BY p.sku_primario
-        HAVING faturamento_custo > 0;
-    """
-    df = executar_consulta(query)
+    inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+    fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
+    indice = indice_catalogo.obter()
+    try:
+        cubo_custo_diario.atualizar(inicio, fim, impressao_catalogo=None if indice is None else indice.impressao_kits)
+    except RuntimeError as e:
+        print(f"Erro ao atualizar o cubo da Curva ABC: {e}")
+        return None
+    df = cubo_custo_diario.faturamento_por_sku(inicio, fim)
 
     if df is None or df.empty:
         print("Não foram encontrados dados para a análise ABC no período.")
         return None
 
-    # Pega a lista de SKUs primários que tiveram faturamento
-    skus_relevantes = tuple(df['sku_primario'].unique())
-    
-    # Busca os nomes "oficiais" desses SKUs primários
-    query_nomes = f"SELECT sku_primario, nome FROM produtos_2 WHERE sku_primario IN {skus_relevantes} AND codigo = sku_primario;"
-    df_nomes = executar_consulta(query_nomes)
-    
     # Junta a informação do nome oficial com a de faturamento
+    df_nomes = obter_nomes_skus_primarios()
     if df_nomes is not None:
         df = pd.merge(df, df_nomes, on='sku_primario')
 
@@ -838,16 +1004,15 @@ def analisar_curva_abc(data_inicio: str, data_fim: str):
     df['percentual'] = (df['faturamento_custo'] / df['faturamento_custo'].sum()) * 100
     df['percentual_acumulado'] = df['percentual'].cumsum()
 
-    def classificar_curva(p):
-        if p <= 80: return 'A'
-        elif p <= 95: return 'B'
-        else: return 'C'
-
-    df['curva_abc'] = df['percentual_acumulado'].apply(classificar_curva)
+    # A: até 80% acumulado, B: até 95%, C: o restante
+    df['curva_abc'] = np.select(
+        [df['percentual_acumulado'] <= 80, df['percentual_acumulado'] <= 95], ['A', 'B'], default='C'
+    )
     
     print("--- Análise ABC do período concluída ---")
     return df
 
+@rastrear("comparar_curva_abc")
 def comparar_curva_abc(periodo_em_dias: int, curva_filtro: str = None):
     print(f"\n>>> DEBUG: A função recebeu o filtro: '{curva_filtro}' (Tipo: {type(curva_filtro)}) <<<\n")
 
@@ -866,12 +1031,14 @@ def comparar_curva_abc(periodo_em_dias: int, curva_filtro: str = None):
     data_fim_antigo = data_inicio_recente - timedelta(days=1)
     data_inicio_antigo = data_fim_antigo - timedelta(days=periodo_em_dias)
 
-    # --- Parte 2: Roda a análise para cada período ---
+    # --- Parte 2: Roda a análise dos dois períodos ao mesmo tempo (são independentes) ---
     print(f"\n--- Analisando Período Antigo: {data_inicio_antigo.strftime(formato_sql)} a {data_fim_antigo.strftime(formato_sql)} ---")
-    df_antigo = analisar_curva_abc(data_inicio_antigo.strftime(formato_sql), data_fim_antigo.strftime(formato_sql))
-    
     print(f"\n--- Analisando Período Recente: {data_inicio_recente.strftime(formato_sql)} a {data_fim_recente.strftime(formato_sql)} ---")
-    df_recente = analisar_curva_abc(data_inicio_recente.strftime(formato_sql), data_fim_recente.strftime(formato_sql))
+    resultado_antigo, resultado_recente = executar_em_paralelo([
+        lambda: analisar_curva_abc(data_inicio_antigo.strftime(formato_sql), data_fim_antigo.strftime(formato_sql)),
+        lambda: analisar_curva_abc(data_inicio_recente.strftime(formato_sql), data_fim_recente.strftime(formato_sql)),
+    ])
+    df_antigo, df_recente = resultado_antigo.valor, resultado_recente.valor
 
     if df_antigo is None or df_recente is None:
         print("Não foi possível gerar a comparação pois um dos períodos não retornou dados.")
@@ -915,12 +1082,32 @@ def comparar_curva_abc(periodo_em_dias: int, curva_filtro: str = None):
     # --- MUDANÇA AQUI: Adicione esta linha no final da função ---
     return df_relatorio_final
 
-def executar_analise_comparativa(pergunta: str):
+def explicar_consulta(query: str) -> dict:
+    """Roda EXPLAIN FORMAT=JSON no MySQL e devolve o plano da consulta (usado pela guarda de custo)."""
+    with obter_pool().conexao() as conexao:
+        cursor = conexao.cursor()
+        cursor.execute(f"EXPLAIN FORMAT=JSON {query}")
+        plano = json.loads(cursor.fetchone()[0])
+        cursor.close()
+    return plano
+
+def _resultado_bloqueado(avaliacoes: list) -> pd.DataFrame:
+    """DataFrame vazio que leva o motivo da rejeição para a interface."""
+    df = pd.DataFrame()
+    df.attrs['guarda_sql'] = {'acao': 'rejeitada', 'descricao': " | ".join(a.descricao() for a in avaliacoes)}
+    return df
+
+@rastrear("executar_analise_comparativa")
+def executar_analise_comparativa(pergunta: str, ao_receber_lote=None, ao_iniciar_consulta=None, explicar=explicar_consulta):
     """
     Orquestra a análise comparativa. É flexível para lidar com respostas
     JSON (comparativo) ou SQL simples da IA. (VERSÃO ROBUSTA)
+    O SQL simples é lido em streaming; os callbacks são repassados para executar_consulta_em_streaming.
+    Antes de executar, todo SQL passa pela guarda de custo (EXPLAIN); `explicar` pode ser
+    trocado por outra função que devolva o plano, ex: de um banco de testes.
+    O resultado leva em df.attrs['guarda_sql'] a estimativa de custo e, se bloqueado, o motivo.
     """
-    esquema = obter_esquema_bd()
+    esquema = obter_esquema_bd_detalhado()
     if not esquema:
         return None
 
@@ -941,10 +1128,20 @@ def executar_analise_comparativa(pergunta: str):
 
     # --- Execução baseada no tipo de resposta ---
     if is_comparative:
-        print("DEBUG: IA retornou um JSON. Executando as duas queries...")
+        print("DEBUG: IA retornou um JSON. Executando as duas queries em paralelo...")
         try:
-            df_recente = executar_consulta(queries['query_periodo_recente'])
-            df_antigo = executar_consulta(queries['query_periodo_antigo'])
+            avaliacoes = [
+                avaliar_consulta(queries['query_periodo_recente'], explicar),
+                avaliar_consulta(queries['query_periodo_antigo'], explicar),
+            ]
+            if not all(avaliacao.permitida for avaliacao in avaliacoes):
+                return _resultado_bloqueado([a for a in avaliacoes if not a.permitida])
+
+            resultado_recente, resultado_antigo = executar_consultas_em_paralelo(
+                [avaliacao.query for avaliacao in avaliacoes],
+                lambda query: executar_consulta(query, usar_replica=False),
+            )
+            df_recente, df_antigo = resultado_recente.valor, resultado_antigo.valor
 
             if df_recente is None or df_antigo is None:
                 return pd.DataFrame()
@@ -967,14 +1164,21 @@ def executar_analise_comparativa(pergunta: str):
                 ((df_comparativo[valor_recente_col] - df_comparativo[valor_antigo_col]) / denominador) * 100, 2
             ).fillna(100.0) # Se o valor antigo era 0, consideramos um crescimento de 100%
 
+            df_comparativo.attrs['guarda_sql'] = {'acao': 'aprovada', 'descricao': " | ".join(a.descricao() for a in avaliacoes)}
             return df_comparativo
         except KeyError as e:
             print(f"DEBUG: Chave não encontrada no JSON: {e}")
             return pd.DataFrame()
     else:
         # Se não for comparativo, executa como SQL simples
-        print("DEBUG: Executando como um SQL simples...")
-        return executar_consulta(resposta_limpa)
+        avaliacao = avaliar_consulta(resposta_limpa, explicar)
+        if not avaliacao.permitida:
+            return _resultado_bloqueado([avaliacao])
+        print("DEBUG: Executando como um SQL simples (em streaming)...")
+        df_resultado = executar_consulta_em_streaming(avaliacao.query, ao_receber_lote=ao_receber_lote, ao_iniciar=ao_iniciar_consulta)
+        if df_resultado is not None:
+            df_resultado.attrs['guarda_sql'] = {'acao': avaliacao.acao, 'descricao': avaliacao.descricao()}
+        return df_resultado
 
 def obter_historico_vendas_sku(df_vendas_base: pd.DataFrame, sku_primario: str):
     """
@@ -988,13 +1192,16 @@ def obter_historico_vendas_sku(df_vendas_base: pd.DataFrame, sku_primario: str):
     if df_sku.empty:
         return None
 
-    df_historico = df_sku.groupby('data')['demanda_primario'].sum().reset_index()
+    df_historico = df_sku.groupby('data', observed=True)['demanda_primario'].sum().reset_index()
     df_historico = df_historico.rename(columns={'data': 'ds', 'demanda_primario': 'y'})
     
     print(f"DEBUG: Histórico preparado para {sku_primario}. Total de vendas no período: {df_historico['y'].sum()}")
     return df_historico
 
-# Em agente_dados.py
+# Modelos do Prophet já ajustados, por SKU e janela, persistidos em disco
+armazem_modelos = ArmazemModelos()
+
+@rastrear("gerar_previsao_vendas")
 def gerar_previsao_vendas(sku_primario: str, dias_historico: int = 180, dias_previsao: int = 30):
     """
     Gera uma previsão de vendas para um SKU usando o Prophet e retorna os resultados em tabelas.
@@ -1006,11 +1213,9 @@ def gerar_previsao_vendas(sku_primario: str, dias_historico: int = 180, dias_pre
         print(f"Não há dados históricos suficientes para o SKU {sku_primario}.")
         return None
 
-    m = Prophet(weekly_seasonality=True, daily_seasonality=False)
-    m.fit(df_historico)
-
-    future = m.make_future_dataframe(periods=dias_previsao)
-    forecast = m.predict(future)
+    # O armazém devolve a previsão guardada se os dados não mudaram, ou reajusta
+    # partindo do modelo anterior quando chegaram dias novos (ver modelos_previsao.py)
+    forecast = armazem_modelos.obter_previsao(sku_primario, df_historico, dias_historico, dias_previsao)
     
     print(f"Previsão para {sku_primario} gerada com sucesso.")
 
@@ -1026,11 +1231,63 @@ def gerar_previsao_vendas(sku_primario: str, dias_historico: int = 180, dias_pre
         "explicacao": explicacao_texto
     }
 
+# Processos usados na previsão em lote (padrão: um por núcleo da máquina)
+PREVISAO_LOTE_WORKERS = int(os.getenv("PREVISAO_LOTE_WORKERS", "0")) or None
+
+@rastrear("gerar_previsoes_vendas_em_lote")
+def gerar_previsoes_vendas_em_lote(skus=None, curvas=None, dias_historico: int = 180, dias_previsao: int = 30,
+                                   min_dias_historico: int = 15, max_workers: int = None, ao_progredir=None):
+    """
+    Gera previsões de vendas para vários SKUs de uma vez, ajustando os modelos do
+    Prophet em paralelo (ver previsao_lote.py). Os dados de vendas são buscados uma vez só.
+
+    Recebe:
+      - skus: lista de SKUs primários; se None, usa todos com pelo menos `min_dias_historico` dias de venda.
+      - curvas: opcional, ex: ['A', 'B'] para prever só os SKUs dessas curvas no período do histórico.
+      - ao_progredir: função chamada como ao_progredir(concluidos, total, sku) a cada SKU terminado.
+    Retorna (df_previsoes, df_falhas).
+    """
+    df_vendas_base = obter_dados_base_vendas(dias_historico)
+
+    if curvas:
+        hoje = datetime.now()
+        df_abc = analisar_curva_abc((hoje - timedelta(days=dias_historico)).strftime('%Y-%m-%d'), (hoje - timedelta(days=1)).strftime('%Y-%m-%d'))
+        skus_das_curvas = set() if df_abc is None else set(df_abc.loc[df_abc['curva_abc'].isin([c.upper() for c in curvas]), 'sku_primario'])
+        skus = skus_das_curvas if skus is None else skus_das_curvas.intersection(skus)
+
+    historicos = preparar_historicos(df_vendas_base, skus, min_dias_historico)
+    print(f"\n--- Previsão em lote: {len(historicos)} SKU(s) com histórico suficiente ---")
+    return gerar_previsoes_em_lote(historicos, dias_previsao, max_workers or PREVISAO_LOTE_WORKERS, ao_progredir)
+
+# Confiança mínima para aceitar a classificação do roteador local sem consultar o Gemini
+ROTEADOR_CONFIANCA_MINIMA = float(os.getenv("ROTEADOR_CONFIANCA_MINIMA", "0.8"))
+
+def obter_mapa_skus_catalogo() -> dict:
+    """
+    Retorna {sku_em_minusculas: sku_primario} com todos os SKUs primários do catálogo,
+    usado pelo roteador local para confirmar os SKUs citados nas perguntas.
+    """
+    skus = indice_catalogo.skus_primarios()
+    if skus is None:
+        return {}
+    return {sku.lower(): sku for sku in skus}
+
+@rastrear("rotear_pergunta")
 def rotear_pergunta(pergunta_usuario: str) -> dict:
     """
-    Usa o Gemini para classificar a pergunta do usuário e extrair parâmetros,
-    retornando um dicionário JSON. (VERSÃO ROBUSTA)
+    Classifica a pergunta do usuário e extrai parâmetros, retornando um dicionário JSON.
+    Primeiro tenta o roteador local (regras, sem custo); o Gemini só é chamado quando
+    a confiança local fica abaixo de ROTEADOR_CONFIANCA_MINIMA. (VERSÃO ROBUSTA)
     """
+    analise_local, confianca = classificar_localmente(pergunta_usuario, obter_mapa_skus_catalogo())
+    if confianca >= ROTEADOR_CONFIANCA_MINIMA:
+        registrar_roteamento(local=True)
+        registrar_na_etapa(roteador="local")
+        print(f"Pergunta roteada localmente (confiança {confianca:.2f}): {analise_local}")
+        return analise_local
+    registrar_roteamento(local=False)
+    registrar_na_etapa(roteador="gemini")
+
     prompt = f"""
     Você é um roteador de intenções inteligente. Analise a pergunta do usuário e a classifique, extraindo os parâmetros. Responda APENAS com um objeto JSON válido.
 
@@ -1057,7 +1314,8 @@ def rotear_pergunta(pergunta_usuario: str) -> dict:
     Sua Resposta JSON:
     """
     try:
-        response = model.generate_content(prompt)
+        response = _obter_modelo().generate_content(prompt)
+        registrar_na_etapa(tamanho_prompt=len(prompt), tamanho_resposta=len(response.text))
         
         # Limpa a resposta para extrair apenas o JSON
         resposta_limpa = response.text.strip()
@@ -1080,6 +1338,7 @@ def rotear_pergunta(pergunta_usuario: str) -> dict:
         # Em caso de qualquer outra falha, retorna um dicionário de erro
         return {"intencao": "erro"}
 
+@rastrear("explicar_previsao_com_gemini")
 def explicar_previsao_com_gemini(sku: str, forecast_df: pd.DataFrame):
     """
     Usa o Gemini para analisar os resultados de uma previsão do Prophet e gerar um resumo em texto.
@@ -1118,7 +1377,8 @@ def explicar_previsao_com_gemini(sku: str, forecast_df: pd.DataFrame):
 
     print("Gerando explicação da previsão com Gemini...")
     try:
-        response = model.generate_content(prompt)
+        response = _obter_modelo().generate_content(prompt)
+        registrar_na_etapa(tamanho_prompt=len(prompt))
         return response.text
     except Exception as e:
         print(f"Erro ao gerar explicação: {e}")
@@ -1,11 +1,104 @@
+import contextvars
+import queue
+import threading
 import streamlit as st
 import pandas as pd
 import agente_dados as agente
+from armazem_resultados import obter_armazem_resultados
+from rastreamento import rastro_da_resposta, ler_rastreamento, agregar_rastreamento
+from replica_analitica import REPLICA_ATIVA, obter_replica
+from roteador_local import estatisticas_roteamento
 from datetime import datetime, timedelta
 
 # --- Configuração da Página ---
 st.set_page_config(page_title="Agente Cientista de Dados", page_icon="🤖", layout="wide")
 
+# Tabelas do histórico ficam no armazém de resultados; a sessão guarda só o identificador
+armazem_resultados = obter_armazem_resultados()
+LINHAS_POR_PAGINA = 50
+
+# A réplica analítica é sincronizada em segundo plano enquanto o app estiver no ar (uma thread por processo)
+if REPLICA_ATIVA:
+    obter_replica().iniciar_sincronizacao_periodica()
+
+
+def exibir_resultado_do_historico(id_resultado):
+    """Mostra só uma página do resultado guardado, com botão para carregar mais linhas."""
+    linhas_exibidas = st.session_state.linhas_exibidas.get(id_resultado, LINHAS_POR_PAGINA)
+    df_pagina, total_linhas = armazem_resultados.ler_pagina(id_resultado, linhas_exibidas)
+    if df_pagina is None:
+        st.caption("Esta tabela não está mais disponível (foi descartada do armazém de resultados).")
+        return
+    st.dataframe(df_pagina)
+    if total_linhas > len(df_pagina):
+        st.caption(f"Mostrando {len(df_pagina)} de {total_linhas} linhas.")
+        if st.button("Carregar mais", key=f"mais_{id_resultado}"):
+            st.session_state.linhas_exibidas[id_resultado] = linhas_exibidas + LINHAS_POR_PAGINA
+            st.rerun()
+
+
+def exibir_tempos_da_resposta(registros):
+    """Tabela com a duração e o volume de cada etapa medida durante a resposta."""
+    with st.expander("⏱️ Tempos desta resposta"):
+        df_tempos = pd.DataFrame(registros)
+        df_tempos['etapa'] = ["    " * nivel + etapa for etapa, nivel in zip(df_tempos['etapa'], df_tempos['nivel'])]
+        colunas = [c for c in ['etapa', 'duracao_ms', 'linhas', 'bytes', 'tamanho_prompt', 'tamanho_resposta', 'ok'] if c in df_tempos.columns]
+        st.dataframe(df_tempos[colunas], hide_index=True)
+
+
+def executar_pergunta_sql_em_streaming(prompt, area_previa, area_status):
+    """
+    Roda a pergunta aberta em uma thread separada e mostra o primeiro lote assim que ele chega.
+    Enquanto isso o script fica atualizando a tela; se o usuário clicar em "Cancelar consulta",
+    o Streamlit interrompe este loop e a consulta é cancelada no banco (KILL QUERY).
+    """
+    fila = queue.Queue()
+    cancelado = threading.Event()
+    consulta_ativa = {}
+
+    def guardar_consulta(consulta):
+        consulta_ativa["consulta"] = consulta
+        if cancelado.is_set():
+            consulta.cancelar()
+
+    def ler():
+        try:
+            df = agente.executar_analise_comparativa(
+                prompt,
+                ao_receber_lote=lambda df_lote, linhas_lidas: fila.put(("lote", df_lote, linhas_lidas)),
+                ao_iniciar_consulta=guardar_consulta,
+            )
+        except Exception as e:
+            print(f"Erro na análise: {e}")
+            df = None
+        fila.put(("fim", df, None))
+
+    # A cópia do contexto leva junto o rastro da resposta (tempos de cada etapa)
+    threading.Thread(target=contextvars.copy_context().run, args=(ler,), daemon=True).start()
+    texto_status = "Gerando SQL e buscando dados..."
+    terminou = False
+    try:
+        while True:
+            try:
+                tipo, df, linhas_lidas = fila.get(timeout=0.3)
+            except queue.Empty:
+                # Atualizar a tela dá ao Streamlit a chance de interromper o script (cancelamento)
+                area_status.caption(texto_status)
+                continue
+            if tipo == "fim":
+                terminou = True
+                return df
+            if linhas_lidas == len(df):
+                area_previa.dataframe(df)  # primeiro lote: já dá para ver os dados
+            texto_status = f"Carregando... {linhas_lidas} linhas recebidas."
+            area_status.caption(texto_status)
+    finally:
+        if not terminou:
+            cancelado.set()
+            if "consulta" in consulta_ativa:
+                consulta_ativa["consulta"].cancelar()
+
+
 # ==============================================================================
 # --- BARRA LATERAL (SIDEBAR) PARA AÇÕES CRÍTICAS ---
 # ==============================================================================
@@ -24,6 +117,9 @@ with st.sidebar:
             with st.spinner("Analisando e criando pedidos..."):
                 resultado_compras = agente.sugerir_compras(dry_run=False)
             st.success("Processo finalizado!")
+            if 'resultado_envio' in resultado_compras.attrs:
+                st.caption("Resultado do envio por fornecedor:")
+                st.dataframe(resultado_compras.attrs['resultado_envio'])
             st.caption("Abaixo está o relatório dos pedidos que foram criados:")
             st.dataframe(resultado_compras)
         else:
@@ -34,6 +130,82 @@ with st.sidebar:
             st.caption("Abaixo está o relatório de sugestões:")
             st.dataframe(resultado_compras)
 
+    st.header("Cenários de Compra")
+    st.caption("Gasto e unidades da sugestão de compras em cada combinação de parâmetros (sem criar pedidos).")
+    janelas_cenario = st.multiselect("Janela de vendas (dias)", [15, 30, 60, 90], default=[30])
+    coberturas_cenario = st.multiselect("Cobertura (dias, além do prazo)", ["Igual à janela", 30, 45, 60, 90],
+                                        default=["Igual à janela"])
+    atrasos_cenario = st.multiselect("Atraso extra nos prazos dos fornecedores (dias)", [0, 5, 10, 15], default=[0])
+    crescimentos_cenario = st.multiselect("Crescimento das vendas", [0.8, 0.9, 1.0, 1.1, 1.2, 1.5], default=[1.0],
+                                          format_func=lambda fator: f"{fator - 1:+.0%}")
+    if st.button("Simular Cenários") and janelas_cenario and coberturas_cenario and atrasos_cenario and crescimentos_cenario:
+        # Com rótulos, a coluna 'prazos' mostra só o atraso escolhido (e não o prazo de cada fornecedor)
+        prazos_cenario = {
+            f"+{atraso} dias" if atraso else "cadastrados":
+                {nome: dados['tempo_entrega'] + atraso for nome, dados in agente.DADOS_FORNECEDORES.items()} if atraso else {}
+            for atraso in atrasos_cenario
+        }
+        with st.spinner("Calculando cenários..."):
+            df_cenarios = agente.simular_cenarios_compra(
+                janelas_cenario, [None if c == "Igual à janela" else c for c in coberturas_cenario],
+                prazos_cenario, crescimentos_cenario,
+            )
+        if df_cenarios.empty:
+            st.warning("Não há dados para simular os cenários.")
+        else:
+            df_totais = df_cenarios.attrs['totais_por_cenario']
+            st.caption(f"{len(df_totais)} cenário(s):")
+            st.dataframe(df_totais)
+            with st.expander("Por fornecedor"):
+                st.dataframe(df_cenarios)
+
+    st.header("Previsão em Lote")
+    curvas_lote = st.multiselect("Curvas a prever", ["A", "B", "C"], default=["A", "B"])
+    if st.button("Gerar Previsões em Lote"):
+        barra_progresso = st.progress(0.0, text="Preparando previsões...")
+
+        def atualizar_progresso(concluidos, total, sku):
+            barra_progresso.progress(concluidos / total, text=f"{concluidos}/{total} SKUs ({sku})")
+
+        df_previsoes, df_falhas = agente.gerar_previsoes_vendas_em_lote(curvas=curvas_lote, ao_progredir=atualizar_progresso)
+        st.success(f"Previsões geradas para {df_previsoes['sku_primario'].nunique()} SKU(s).")
+        st.dataframe(df_previsoes)
+        if not df_falhas.empty:
+            st.warning(f"{len(df_falhas)} SKU(s) falharam:")
+            st.dataframe(df_falhas)
+
+    st.header("Diagnóstico")
+    estatisticas_roteador = estatisticas_roteamento()
+    st.metric(
+        "Perguntas roteadas sem o Gemini",
+        f"{estatisticas_roteador['fracao_local']:.0%}",
+        help=f"{estatisticas_roteador['local']} de {estatisticas_roteador['total']} perguntas classificadas pelo roteador local.",
+    )
+    if REPLICA_ATIVA:
+        situacao_replica = obter_replica().situacao()
+        if situacao_replica["atraso_minutos"] is None:
+            st.warning("Réplica analítica ainda não sincronizada: as análises estão indo ao MySQL.")
+        elif situacao_replica["atualizada"]:
+            st.caption(f"🟢 Réplica analítica atualizada há {situacao_replica['atraso_minutos']:.0f} min "
+                       f"(vendas até {situacao_replica['vendas_ate']}).")
+        else:
+            st.warning(f"🟠 Réplica analítica desatualizada há {situacao_replica['atraso_minutos']:.0f} min: "
+                       "as análises estão indo ao MySQL.")
+        if situacao_replica["erro"]:
+            st.caption(f"Último erro da réplica: {situacao_replica['erro']}")
+        if st.button("Sincronizar réplica agora"):
+            with st.spinner("Sincronizando a réplica com o MySQL..."):
+                try:
+                    obter_replica().sincronizar()
+                except Exception as e:
+                    st.error(f"Falha ao sincronizar a réplica: {e}")
+                else:
+                    st.rerun()
+    mostrar_tempos = st.toggle("Mostrar tempos de cada etapa")
+    if mostrar_tempos:
+        with st.expander("Percentis por etapa (últimas 5000)"):
+            st.dataframe(agregar_rastreamento(ler_rastreamento(ultimas=5000)))
+
 # ==============================================================================
 # --- INTERFACE PRINCIPAL DO CHAT ---
 # ==============================================================================
@@ -42,14 +214,18 @@ st.title("🤖 Converse com seu Agente de Dados")
 # Inicializa o histórico do chat na memória da sessão
 if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "assistant", "content": "Olá! Sou seu agente de dados. Em que posso ajudar hoje?"}]
+if "linhas_exibidas" not in st.session_state:
+    st.session_state.linhas_exibidas = {}
 
 # Exibe as mensagens antigas do histórico
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         # Se a mensagem tiver uma tabela de dados, exibe também
-        if "data" in message and isinstance(message["data"], pd.DataFrame):
-            st.dataframe(message["data"])
+        if "resultado_id" in message:
+            exibir_resultado_do_historico(message["resultado_id"])
+        if mostrar_tempos and "tempos" in message:
+            exibir_tempos_da_resposta(message["tempos"])
 
 if prompt := st.chat_input("Qual a sua análise de hoje?"):
     # Adiciona e exibe a mensagem do usuário
@@ -58,7 +234,7 @@ if prompt := st.chat_input("Qual a sua análise de hoje?"):
         st.markdown(prompt)
 
     # O Agente "pensa" e responde
-    with st.chat_message("assistant"):
+    with st.chat_message("assistant"), rastro_da_resposta() as registros_etapas:
         resposta_container = st.empty()
         with st.spinner("Analisando sua pergunta..."):
             # 1. Roteador de intenções decide o que fazer
@@ -97,7 +273,7 @@ if prompt := st.chat_input("Qual a sua análise de hoje?"):
 
                 st.write("Resumo da contagem geral por curva:")
                 st.write(df_resultado['curva_abc'].value_counts())
-                st.session_state.messages.append({"role": "assistant", "content": f"Aqui está a Análise de Curva ABC para os últimos {periodo} dias:", "data": df_para_exibir})
+                st.session_state.messages.append({"role": "assistant", "content": f"Aqui está a Análise de Curva ABC para os últimos {periodo} dias:", "resultado_id": armazem_resultados.guardar(df_para_exibir)})
             else:
                 st.error("Não foi possível gerar a Análise ABC.")
                 st.session_state.messages.append({"role": "assistant", "content": "Não foi possível gerar a Análise ABC."})
@@ -112,7 +288,7 @@ if prompt := st.chat_input("Qual a sua análise de hoje?"):
             if df_resultado is not None and not df_resultado.empty:
                 resposta_container.success("Análise Comparativa Concluída!")
                 st.dataframe(df_resultado)
-                st.session_state.messages.append({"role": "assistant", "content": "Aqui está a sua Análise Comparativa de Curva ABC:", "data": df_resultado})
+                st.session_state.messages.append({"role": "assistant", "content": "Aqui está a sua Análise Comparativa de Curva ABC:", "resultado_id": armazem_resultados.guardar(df_resultado)})
             else:
                  resposta_container.info("Nenhuma mudança de curva detectada para os critérios especificados.")
                  st.session_state.messages.append({"role": "assistant", "content": "Nenhuma mudança de curva detectada para os critérios especificados."})
@@ -150,18 +326,39 @@ if prompt := st.chat_input("Qual a sua análise de hoje?"):
                 st.session_state.messages.append({"role": "assistant", "content": msg_aviso})
 
         elif intencao == "pergunta_aberta_sql":
-            with st.spinner("Gerando SQL e buscando dados..."):
-                df_resultado = agente.executar_analise_comparativa(prompt) # Reutilizamos esta função que lida com SQL
-            
-            if df_resultado is not None and not df_resultado.empty:
+            # Clicar no botão reinicia o script, o que interrompe e cancela a consulta em andamento
+            area_cancelar = st.empty()
+            area_cancelar.button("Cancelar consulta", key="cancelar_consulta")
+            area_previa, area_status = st.empty(), st.empty()
+            df_resultado = executar_pergunta_sql_em_streaming(prompt, area_previa, area_status)  # Reutilizamos a função que lida com SQL
+            area_cancelar.empty()
+            area_previa.empty()
+            area_status.empty()
+
+            guarda_sql = df_resultado.attrs.get('guarda_sql') if df_resultado is not None else None
+            if guarda_sql and guarda_sql['acao'] == 'rejeitada':
+                msg_bloqueio = f"Consulta bloqueada pela guarda de custo: {guarda_sql['descricao']}"
+                resposta_container.error(msg_bloqueio)
+                st.session_state.messages.append({"role": "assistant", "content": msg_bloqueio})
+            elif df_resultado is not None and not df_resultado.empty:
                 resposta_container.success("Análise Concluída!")
+                if guarda_sql:
+                    st.caption(f"Custo da consulta: {guarda_sql['descricao']}")
                 st.dataframe(df_resultado)
+                if df_resultado.attrs.get('aviso_truncamento'):
+                    st.warning(df_resultado.attrs['aviso_truncamento'])
                 resumo = agente.resumir_resultados_com_gemini(df_resultado, prompt)
                 st.success(resumo)
-                st.session_state.messages.append({"role": "assistant", "content": resumo, "data": df_resultado})
+                st.session_state.messages.append({"role": "assistant", "content": resumo, "resultado_id": armazem_resultados.guardar(df_resultado)})
             else:
                 resposta_container.error("Não foi possível executar a análise ou não há dados para a sua pergunta.")
                 st.session_state.messages.append({"role": "assistant", "content": "Não foi possível executar a análise ou não há dados para a sua pergunta."})
         else:
             st.error("Desculpe, não consegui entender ou processar sua solicitação.")
-            st.session_state.messages.append({"role": "assistant", "content": "Desculpe, não consegui entender ou processar sua solicitação."})
\ No newline at end of file
+            st.session_state.messages.append({"role": "assistant", "content": "Desculpe, não consegui entender ou processar sua solicitação."})
+
+        # Guarda os tempos das etapas junto com a resposta, para o painel de tempos
+        if registros_etapas and st.session_state.messages[-1]["role"] == "assistant":
+            st.session_state.messages[-1]["tempos"] = list(registros_etapas)
+            if mostrar_tempos:
+                exibir_tempos_da_resposta(registros_etapas)
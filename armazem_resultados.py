@@ -0,0 +1,184 @@
+"""
+Armazém de resultados (DataFrames) exibidos no chat.
+
+Em vez de guardar os DataFrames inteiros dentro de st.session_state.messages, o chat
+guarda só um identificador. Os dados ficam em arquivos Parquet no disco local, com
+uma camada pequena em memória (LRU) para os resultados usados recentemente. Assim a
+memória da sessão não cresce com o tamanho da conversa, e o histórico pode exibir
+só uma página de cada resultado.
+O chat redesenha todo o histórico a cada interação, então as páginas exibidas ficam em
+um LRU próprio, bem maior (RESULTADOS_MAX_PAGINAS): com mais resultados do que cabem
+no LRU dos DataFrames inteiros, um redesenho não relê nada do disco. Quando relê, só as
+primeiras linhas do Parquet são lidas (o total de linhas vem dos metadados do arquivo).
+Sem pyarrow/fastparquet instalados, os resultados são gravados como pickle.
+"""
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from cache_local import caminho_cache
+
+RESULTADOS_MAX_DISCO = int(os.getenv("RESULTADOS_MAX_DISCO", "500"))
+RESULTADOS_MAX_MEMORIA = int(os.getenv("RESULTADOS_MAX_MEMORIA", "8"))
+RESULTADOS_MAX_PAGINAS = int(os.getenv("RESULTADOS_MAX_PAGINAS", "200"))
+
+
+def _preparar_para_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte colunas de objetos mistos (ex: Decimal junto com None) em texto, que o Parquet aceita."""
+    df = df.copy()
+    df.columns = [str(coluna) for coluna in df.columns]
+    for coluna in df.columns:
+        if df[coluna].dtype == object:
+            df[coluna] = df[coluna].map(lambda valor: None if valor is None else str(valor))
+    return df
+
+
+class ArmazemResultados:
+    def __init__(self, pasta: str = None, max_disco: int = RESULTADOS_MAX_DISCO, max_memoria: int = RESULTADOS_MAX_MEMORIA,
+                 max_paginas: int = RESULTADOS_MAX_PAGINAS):
+        self.pasta = pasta or caminho_cache("resultados_chat")
+        self.max_disco = max_disco
+        self.max_memoria = max_memoria
+        self.max_paginas = max_paginas
+        self._memoria = OrderedDict()
+        self._paginas = OrderedDict()  # id -> (primeiras linhas, total de linhas)
+        self._trava = threading.Lock()
+
+    def _arquivo(self, id_resultado: str, extensao: str = ".parquet") -> str:
+        return os.path.join(self.pasta, f"{id_resultado}{extensao}")
+
+    def _gravar(self, id_resultado: str, df: pd.DataFrame):
+        try:
+            df.to_parquet(self._arquivo(id_resultado))
+        except ImportError:
+            df.to_pickle(self._arquivo(id_resultado, ".pkl"))
+        except Exception:
+            _preparar_para_parquet(df).to_parquet(self._arquivo(id_resultado))
+
+    def _carregar(self, id_resultado: str):
+        for extensao, leitor in ((".parquet", pd.read_parquet), (".pkl", pd.read_pickle)):
+            arquivo = self._arquivo(id_resultado, extensao)
+            if os.path.exists(arquivo):
+                df = leitor(arquivo)
+                os.utime(arquivo)  # marca como usado recentemente
+                return df
+        return None
+
+    def _carregar_inicio(self, id_resultado: str, linhas: int):
+        """(primeiras `linhas` do arquivo, total de linhas), sem ler o Parquet inteiro; (None, 0) se não existe."""
+        arquivo = self._arquivo(id_resultado)
+        if not os.path.exists(arquivo):
+            df = self._carregar(id_resultado)  # pickle: não dá para ler só o começo
+            return (None, 0) if df is None else (df.head(linhas), len(df))
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:  # gravado pelo fastparquet
+            df = pd.read_parquet(arquivo)
+            os.utime(arquivo)
+            return df.head(linhas), len(df)
+
+        arquivo_parquet = pq.ParquetFile(arquivo)
+        lotes, lidas = [], 0
+        for lote in arquivo_parquet.iter_batches(batch_size=max(linhas, 1), use_pandas_metadata=True):
+            lotes.append(lote)
+            lidas += lote.num_rows
+            if lidas >= linhas:
+                break
+        df = pa.Table.from_batches(lotes, schema=arquivo_parquet.schema_arrow).to_pandas()
+        os.utime(arquivo)  # marca como usado recentemente
+        return df.head(linhas), arquivo_parquet.metadata.num_rows
+
+    def _lembrar_pagina(self, id_resultado: str, df_pagina: pd.DataFrame, total_linhas: int):
+        with self._trava:
+            self._paginas[id_resultado] = (df_pagina, total_linhas)
+            self._paginas.move_to_end(id_resultado)
+            while len(self._paginas) > self.max_paginas:
+                self._paginas.popitem(last=False)
+
+    def _lembrar(self, id_resultado: str, df: pd.DataFrame):
+        with self._trava:
+            self._memoria[id_resultado] = df
+            self._memoria.move_to_end(id_resultado)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def guardar(self, df: pd.DataFrame) -> str:
+        """Grava o DataFrame e devolve o identificador que deve ser guardado na sessão."""
+        id_resultado = uuid.uuid4().hex
+        os.makedirs(self.pasta, exist_ok=True)
+        self._gravar(id_resultado, df)
+        self._lembrar(id_resultado, df)
+        self._despejar_excesso()
+        return id_resultado
+
+    def ler(self, id_resultado: str):
+        """Devolve o DataFrame completo, ou None se o resultado já foi descartado."""
+        with self._trava:
+            if id_resultado in self._memoria:
+                self._memoria.move_to_end(id_resultado)
+                return self._memoria[id_resultado]
+        try:
+            df = self._carregar(id_resultado)
+        except FileNotFoundError:
+            return None  # descartado entre a verificação e a leitura
+        if df is None:
+            return None
+        self._lembrar(id_resultado, df)
+        return df
+
+    def ler_pagina(self, id_resultado: str, linhas: int):
+        """
+        Devolve (primeiras `linhas` do resultado, total de linhas), ou (None, 0) se ele não existe mais.
+        Não carrega o DataFrame inteiro nem o coloca no LRU dos resultados completos.
+        """
+        with self._trava:
+            if id_resultado in self._memoria:
+                df = self._memoria[id_resultado]
+                return df.head(linhas), len(df)
+            pagina = self._paginas.get(id_resultado)
+            if pagina is not None and (len(pagina[0]) >= linhas or len(pagina[0]) == pagina[1]):
+                self._paginas.move_to_end(id_resultado)
+                return pagina[0].head(linhas), pagina[1]
+        try:
+            df_pagina, total_linhas = self._carregar_inicio(id_resultado, linhas)
+        except FileNotFoundError:
+            return None, 0  # descartado entre a verificação e a leitura
+        if df_pagina is None:
+            return None, 0
+        self._lembrar_pagina(id_resultado, df_pagina, total_linhas)
+        return df_pagina, total_linhas
+
+    def _despejar_excesso(self):
+        """Mantém no disco só os `max_disco` resultados usados mais recentemente."""
+        try:
+            arquivos = [
+                os.path.join(self.pasta, nome) for nome in os.listdir(self.pasta) if nome.endswith((".parquet", ".pkl"))
+            ]
+        except FileNotFoundError:
+            return
+        if len(arquivos) <= self.max_disco:
+            return
+        arquivos.sort(key=lambda caminho: os.path.getmtime(caminho))
+        for caminho in arquivos[:len(arquivos) - self.max_disco]:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+
+_armazem_global = None
+_trava_armazem_global = threading.Lock()
+
+
+def obter_armazem_resultados() -> ArmazemResultados:
+    """Armazém único do processo, compartilhado pelas sessões do Streamlit."""
+    global _armazem_global
+    if _armazem_global is None:
+        with _trava_armazem_global:
+            if _armazem_global is None:
+                _armazem_global = ArmazemResultados()
+    return _armazem_global
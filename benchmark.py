@@ -0,0 +1,278 @@
+"""
+Benchmark das rotinas pesadas do agente sobre dados sintéticos (ver dados_sinteticos.py).
+
+Para cada escala (linhas de vendas_detalhes) gera, uma vez, um banco SQLite sintético e
+mede sugerir_compras, analisar_curva_abc, comparar_curva_abc, gerar_previsao_vendas e
+simular_cenarios_compra (grade de 240 cenários):
+  - tempo "frio" (caches vazios) e "quente" (segunda chamada no mesmo processo);
+  - vazão (linhas de vendas por segundo, na execução fria);
+  - pico de memória alocada pelo Python/NumPy/pandas (tracemalloc, em uma execução à parte,
+    porque o tracemalloc deixa o código mais lento).
+Cada medição roda em um processo novo, com uma pasta de cache vazia e sem Gemini
+(a explicação da previsão cai no texto padrão), para que uma não aqueça a outra.
+
+O resultado é comparado com a linha de base salva; uma piora acima da tolerância em tempo
+ou memória é marcada como regressão e o script termina com código 1.
+
+Uso:
+    python benchmark.py                                        # escalas padrão, compara com a linha de base
+    python benchmark.py --escalas 10000 1000000 --casos sugerir_compras analisar_curva_abc
+    python benchmark.py --salvar-linha-de-base                 # grava os resultados como a nova linha de base
+    python benchmark.py --escalas 50000000 --pasta-dados /mnt/dados/benchmark
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+
+from cache_local import caminho_cache, gravar_json_atomico
+
+ESCALAS_PADRAO = [10_000, 100_000, 1_000_000]
+BENCHMARK_TOLERANCIA = float(os.getenv("BENCHMARK_TOLERANCIA", "0.25"))
+BENCHMARK_LINHA_DE_BASE = os.getenv(
+    "BENCHMARK_LINHA_DE_BASE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_linha_de_base.json")
+)
+BENCHMARK_PASTA_DADOS = os.getenv("BENCHMARK_PASTA_DADOS", caminho_cache("benchmark"))
+
+# Diferenças menores que isso são ruído de medição, mesmo que passem da tolerância relativa
+FOLGA_SEGUNDOS = 0.05
+FOLGA_MB = 2.0
+
+
+def _caso_sugerir_compras(agente, info):
+    return agente.sugerir_compras(dry_run=True)
+
+
+def _caso_analisar_curva_abc(agente, info):
+    fim = datetime.fromisoformat(info["ultimo_dia"])
+    return agente.analisar_curva_abc((fim - timedelta(days=90)).strftime("%Y-%m-%d"), fim.strftime("%Y-%m-%d"))
+
+
+def _caso_comparar_curva_abc(agente, info):
+    return agente.comparar_curva_abc(90)
+
+
+def _caso_gerar_previsao_vendas(agente, info):
+    resultado = agente.gerar_previsao_vendas(info["sku_mais_vendido"], dias_historico=180, dias_previsao=30)
+    return resultado["forecast_df"] if resultado else None
+
+
+def _caso_simular_cenarios_compra(agente, info):
+    prazos = {f"+{atraso}": {nome: dados["tempo_entrega"] + atraso for nome, dados in agente.DADOS_FORNECEDORES.items()}
+              for atraso in (0, 5, 10)}
+    return agente.simular_cenarios_compra([15, 30, 60, 90], [None, 30, 45, 60], prazos, [0.8, 0.9, 1.0, 1.1, 1.2])
+
+
+CASOS = {
+    "sugerir_compras": _caso_sugerir_compras,
+    "analisar_curva_abc": _caso_analisar_curva_abc,
+    "comparar_curva_abc": _caso_comparar_curva_abc,
+    "gerar_previsao_vendas": _caso_gerar_previsao_vendas,
+    "simular_cenarios_compra": _caso_simular_cenarios_compra,
+}
+
+
+# --- execução de um caso (dentro do processo filho) ---
+
+def _linhas(resultado):
+    return len(resultado) if resultado is not None and hasattr(resultado, "__len__") else 0
+
+
+def executar_caso(caso: str, banco: str, medir_memoria: bool) -> dict:
+    """Roda um caso contra o banco sintético. Chamado no processo filho (ver _medir)."""
+    import agente_dados
+    from dados_sinteticos import PoolSQLite, ler_info_banco
+    from pool_conexoes import definir_pool
+
+    definir_pool(PoolSQLite(banco))
+    info = ler_info_banco(banco)
+    funcao = CASOS[caso]
+
+    with open(os.devnull, "w") as nulo, redirect_stdout(nulo):
+        if medir_memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        resultado = funcao(agente_dados, info)
+        segundos_frio = time.perf_counter() - inicio
+        if medir_memoria:
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return {"pico_mb": round(pico / 1024 / 1024, 1)}
+
+        inicio = time.perf_counter()
+        funcao(agente_dados, info)
+        segundos_quente = time.perf_counter() - inicio
+
+    return {
+        "segundos_frio": round(segundos_frio, 3),
+        "segundos_quente": round(segundos_quente, 3),
+        "linhas_resultado": _linhas(resultado),
+    }
+
+
+def _medir(caso: str, banco: str, medir_memoria: bool) -> dict:
+    """Roda o caso em um processo novo, com cache vazio, rastreamento desligado e sem chave do Gemini."""
+    with tempfile.TemporaryDirectory(prefix="benchmark_cache_") as pasta_cache:
+        ambiente = {**os.environ, "AGENTE_CACHE_DIR": pasta_cache, "RASTREAMENTO_ATIVO": "0", "GOOGLE_API_KEY": "",
+                    "PYTHONWARNINGS": "ignore"}
+        comando = [sys.executable, os.path.abspath(__file__), "--executar-caso", caso, "--banco", banco]
+        if medir_memoria:
+            comando.append("--medir-memoria")
+        processo = subprocess.run(comando, capture_output=True, text=True, env=ambiente,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+    if processo.returncode != 0:
+        return {"erro": (processo.stderr.strip().splitlines() or ["falha sem mensagem"])[-1]}
+    return json.loads(processo.stdout.strip().splitlines()[-1])
+
+
+# --- orquestração (processo principal) ---
+
+def preparar_banco(linhas: int, pasta: str, semente: int) -> str:
+    """Caminho do banco sintético da escala, gerando-o se ainda não existir."""
+    from dados_sinteticos import gerar_banco_sintetico, ler_info_banco
+
+    caminho = os.path.join(pasta, f"vendas_{linhas}_s{semente}.sqlite")
+    # Bancos de outro dia têm as vendas deslocadas em relação a "ontem"; são gerados de novo
+    ontem = (datetime.now() - timedelta(days=1)).date().isoformat()
+    if os.path.exists(caminho) and ler_info_banco(caminho).get("ultimo_dia") == ontem:
+        return caminho
+
+    print(f"Gerando banco sintético com {linhas:,} linhas de vendas em {caminho}...")
+    inicio = time.perf_counter()
+
+    def progresso(gravadas, total):
+        print(f"  {gravadas:,}/{total:,} linhas", end="\r", flush=True)
+
+    gerar_banco_sintetico(caminho, linhas, semente=semente, ao_progredir=progresso)
+    print(f"\n  pronto em {time.perf_counter() - inicio:.1f}s")
+    return caminho
+
+
+def medir_escala(linhas: int, casos: list, banco: str, repeticoes: int) -> dict:
+    resultados = {}
+    for caso in casos:
+        print(f"  {caso}...", end=" ", flush=True)
+        tempos = [_medir(caso, banco, medir_memoria=False) for _ in range(repeticoes)]
+        erros = [t["erro"] for t in tempos if "erro" in t]
+        if erros:
+            resultados[f"{caso}@{linhas}"] = {"caso": caso, "linhas": linhas, "erro": erros[0]}
+            print(f"ERRO: {erros[0]}")
+            continue
+        # O menor tempo entre as repetições é o menos afetado por ruído da máquina
+        melhor = min(tempos, key=lambda t: t["segundos_frio"])
+        memoria = _medir(caso, banco, medir_memoria=True)
+        resultado = {
+            "caso": caso, "linhas": linhas, **melhor,
+            "linhas_por_segundo": round(linhas / melhor["segundos_frio"]) if melhor["segundos_frio"] > 0 else None,
+            "pico_mb": memoria.get("pico_mb"),
+        }
+        resultados[f"{caso}@{linhas}"] = resultado
+        print(f"{resultado['segundos_frio']:.2f}s frio, {resultado['segundos_quente']:.2f}s quente, "
+              f"pico {resultado['pico_mb']} MB")
+    return resultados
+
+
+def comparar_com_linha_de_base(resultados: dict, linha_de_base: dict, tolerancia: float) -> list:
+    """Lista de regressões (textos) em tempo frio, tempo quente ou pico de memória."""
+    regressoes = []
+    for chave, atual in resultados.items():
+        base = linha_de_base.get(chave)
+        if not base or "erro" in atual or "erro" in base:
+            continue
+        for metrica, folga, unidade in [("segundos_frio", FOLGA_SEGUNDOS, "s"), ("segundos_quente", FOLGA_SEGUNDOS, "s"),
+                                        ("pico_mb", FOLGA_MB, " MB")]:
+            valor, referencia = atual.get(metrica), base.get(metrica)
+            if valor is None or referencia is None:
+                continue
+            if valor > referencia * (1 + tolerancia) and valor - referencia > folga:
+                regressoes.append(f"{chave}: {metrica} {referencia}{unidade} -> {valor}{unidade} "
+                                  f"(+{(valor / referencia - 1) * 100 if referencia else float('inf'):.0f}%)")
+    return regressoes
+
+
+def imprimir_tabela(resultados: dict, linha_de_base: dict):
+    import pandas as pd
+
+    linhas = []
+    for chave, r in resultados.items():
+        base = linha_de_base.get(chave, {})
+        linhas.append({
+            "caso": r["caso"], "linhas": r["linhas"],
+            "frio (s)": r.get("segundos_frio"), "base frio (s)": base.get("segundos_frio"),
+            "quente (s)": r.get("segundos_quente"),
+            "linhas/s": r.get("linhas_por_segundo"),
+            "pico (MB)": r.get("pico_mb"), "base pico (MB)": base.get("pico_mb"),
+            "erro": r.get("erro", ""),
+        })
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(pd.DataFrame(linhas).to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--escalas", type=int, nargs="+", default=ESCALAS_PADRAO, help="linhas de vendas_detalhes")
+    parser.add_argument("--casos", nargs="+", choices=list(CASOS), default=list(CASOS))
+    parser.add_argument("--repeticoes", type=int, default=1, help="execuções frias por caso (vale a mais rápida)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--pasta-dados", default=BENCHMARK_PASTA_DADOS)
+    parser.add_argument("--linha-de-base", default=BENCHMARK_LINHA_DE_BASE)
+    parser.add_argument("--salvar-linha-de-base", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=BENCHMARK_TOLERANCIA, help="piora relativa aceita (0.25 = 25%%)")
+    # Uso interno: execução de um único caso no processo filho
+    parser.add_argument("--executar-caso", choices=list(CASOS), help=argparse.SUPPRESS)
+    parser.add_argument("--banco", help=argparse.SUPPRESS)
+    parser.add_argument("--medir-memoria", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar_caso:
+        print(json.dumps(executar_caso(args.executar_caso, args.banco, args.medir_memoria)))
+        return 0
+
+    resultados = {}
+    for linhas in args.escalas:
+        banco = preparar_banco(linhas, args.pasta_dados, args.semente)
+        print(f"\nEscala: {linhas:,} linhas de vendas")
+        resultados.update(medir_escala(linhas, args.casos, banco, args.repeticoes))
+
+    try:
+        with open(args.linha_de_base, "r", encoding="utf-8") as f:
+            linha_de_base = json.load(f).get("resultados", {})
+    except FileNotFoundError:
+        linha_de_base = {}
+
+    print()
+    imprimir_tabela(resultados, linha_de_base)
+
+    if args.salvar_linha_de_base:
+        # Mantém as medições de escalas/casos que não rodaram desta vez
+        gravar_json_atomico(args.linha_de_base, {
+            "gerado_em": datetime.now().isoformat(timespec="seconds"),
+            "maquina": platform.node(), "python": platform.python_version(),
+            "resultados": {**linha_de_base, **resultados},
+        })
+        print(f"\nLinha de base gravada em {args.linha_de_base}.")
+        return 0
+
+    if not linha_de_base:
+        print(f"\nSem linha de base em {args.linha_de_base}; rode com --salvar-linha-de-base para criar uma.")
+        return 0
+
+    regressoes = comparar_com_linha_de_base(resultados, linha_de_base, args.tolerancia)
+    if regressoes:
+        print(f"\nERRO: {len(regressoes)} regressão(ões) acima de {args.tolerancia:.0%}:")
+        for regressao in regressoes:
+            print(f"  - {regressao}")
+        return 1
+    print(f"\nOK: nenhuma regressão acima de {args.tolerancia:.0%} em relação à linha de base.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+Cache em memória compartilhado pelo processo, com validade (TTL) e cópia em disco.
+
+Como o Streamlit roda todas as sessões no mesmo processo, um cache em nível de módulo
+já é compartilhado entre elas; a cópia em disco faz com que o app reiniciado volte
+"quente", sem precisar refazer as consultas caras.
+Os valores precisam ser serializáveis em JSON.
+"""
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Pasta onde os caches persistidos são gravados
+PASTA_CACHE = os.getenv("AGENTE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_agente"))
+
+
+def caminho_cache(nome_arquivo: str) -> str:
+    """Retorna o caminho completo de um arquivo dentro da pasta de cache (a pasta é criada só ao gravar)."""
+    return os.path.join(PASTA_CACHE, nome_arquivo)
+
+
+def gravar_json_atomico(caminho: str, dados):
+    """Grava um JSON em um arquivo temporário e o move para o destino (nunca deixa o arquivo pela metade)."""
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False)
+    os.replace(temporario, caminho)
+
+
+class CachePersistente:
+    """
+    Dicionário thread-safe com TTL por entrada, persistido em um arquivo JSON.
+    - obter(chave): valor se existir e ainda estiver dentro da validade, senão None.
+    - obter_mesmo_expirado(chave): valor mesmo vencido (útil para revalidar em vez de recarregar).
+    - definir(chave, valor) / renovar(chave) / invalidar(chave).
+    - estatisticas(): contadores de acertos e falhas de obter().
+    Com `max_itens`, as entradas menos usadas recentemente são descartadas (LRU).
+    """
+
+    def __init__(self, nome_arquivo: str, ttl_segundos: float, max_itens: int = None):
+        self.caminho = caminho_cache(nome_arquivo)
+        self.ttl_segundos = ttl_segundos
+        self.max_itens = max_itens
+        self._trava = threading.RLock()
+        self._entradas = None  # carregado do disco no primeiro acesso
+        self._acertos = 0
+        self._falhas = 0
+
+    def _carregar(self):
+        if self._entradas is not None:
+            return
+        self._entradas = {}
+        try:
+            with open(self.caminho, "r", encoding="utf-8") as f:
+                self._entradas = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Aviso: cache em disco '{self.caminho}' ignorado ({e}).")
+
+    def _persistir(self):
+        try:
+            gravar_json_atomico(self.caminho, self._entradas)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o cache '{self.caminho}': {e}")
+
+    def obter_mesmo_expirado(self, chave: str):
+        with self._trava:
+            self._carregar()
+            entrada = self._entradas.get(chave)
+            return entrada["valor"] if entrada else None
+
+    def obter(self, chave: str):
+        with self._trava:
+            self._carregar()
+            entrada = self._entradas.get(chave)
+            if not entrada or time.time() - entrada["gravado_em"] > self.ttl_segundos:
+                self._falhas += 1
+                return None
+            self._acertos += 1
+            # Move a entrada para o fim do dicionário: a ordem de inserção é a ordem LRU.
+            # (a nova ordem só vai para o disco na próxima gravação)
+            self._entradas[chave] = self._entradas.pop(chave)
+            return entrada["valor"]
+
+    def definir(self, chave: str, valor):
+        with self._trava:
+            self._carregar()
+            self._entradas.pop(chave, None)
+            self._entradas[chave] = {"valor": valor, "gravado_em": time.time()}
+            if self.max_itens is not None:
+                while len(self._entradas) > self.max_itens:
+                    del self._entradas[next(iter(self._entradas))]
+            self._persistir()
+
+    def renovar(self, chave: str):
+        """Reinicia a validade de uma entrada existente sem trocar o valor."""
+        with self._trava:
+            self._carregar()
+            if chave in self._entradas:
+                self._entradas[chave]["gravado_em"] = time.time()
+                self._persistir()
+
+    def invalidar(self, chave: str = None):
+        """Remove uma entrada (ou todas, se nenhuma chave for informada)."""
+        with self._trava:
+            self._carregar()
+            if chave is None:
+                self._entradas.clear()
+            else:
+                self._entradas.pop(chave, None)
+            self._persistir()
+
+    def estatisticas(self) -> dict:
+        with self._trava:
+            self._carregar()
+            consultas = self._acertos + self._falhas
+            return {
+                "itens": len(self._entradas),
+                "acertos": self._acertos,
+                "falhas": self._falhas,
+                "taxa_acerto": round(self._acertos / consultas, 3) if consultas else 0.0,
+            }
@@ -0,0 +1,76 @@
+"""
+Cache em memória dos dados base de vendas (vendas já com a explosão de kits).
+
+Guarda a maior janela já buscada (sempre terminando ontem) e atende qualquer janela
+menor fatiando pela coluna 'data'. Quando pedem uma janela maior, só os dias que
+faltam são buscados no banco. Na virada do dia o cache é descartado, já que "ontem"
+mudou. Compartilhado por todas as sessões do Streamlit (nível de processo).
+"""
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from tipos_colunas import concatenar
+
+
+class CacheJanelaVendas:
+    """
+    `buscar_periodo(data_inicio, data_fim)` deve devolver um DataFrame com a coluna
+    'data' para o intervalo fechado [data_inicio, data_fim] (ou None se falhar).
+    """
+
+    def __init__(self, buscar_periodo):
+        self.buscar_periodo = buscar_periodo
+        self._trava = threading.Lock()
+        self._limpar()
+        self.buscas_no_banco = 0
+
+    def _limpar(self):
+        self._df = None
+        self._datas = None  # datas em datetime64, ordenadas, para fatiar com searchsorted
+        self._inicio = None
+        self._fim = None
+
+    def _guardar(self, df: pd.DataFrame, inicio: date, fim: date):
+        df = df.sort_values('data', kind='stable').reset_index(drop=True)
+        self._df = df
+        self._datas = pd.to_datetime(df['data']).to_numpy()
+        self._inicio = inicio
+        self._fim = fim
+
+    def obter(self, dias: int, hoje: date = None) -> pd.DataFrame:
+        """
+        Retorna as vendas de [hoje - dias, ontem], buscando no banco apenas o que ainda
+        não está em memória. Retorna None se a busca no banco falhar.
+        """
+        hoje = hoje or date.today()
+        fim = hoje - timedelta(days=1)
+        inicio = hoje - timedelta(days=dias)
+
+        with self._trava:
+            if self._fim != fim:
+                # Virou o dia (ou primeira chamada): o que está em memória não serve mais
+                self._limpar()
+
+            if self._df is None:
+                df_novo = self.buscar_periodo(inicio, fim)
+                self.buscas_no_banco += 1
+                if df_novo is None:
+                    return None
+                self._guardar(df_novo, inicio, fim)
+            elif inicio < self._inicio:
+                # Janela maior do que a guardada: busca só os dias anteriores que faltam
+                df_faltante = self.buscar_periodo(inicio, self._inicio - timedelta(days=1))
+                self.buscas_no_banco += 1
+                if df_faltante is None:
+                    return None
+                self._guardar(concatenar([df_faltante, self._df]), inicio, fim)
+
+            posicao = np.searchsorted(self._datas, np.datetime64(inicio, 'ns'), side='left')
+            return self._df.iloc[posicao:].reset_index(drop=True)
+
+    def invalidar(self):
+        with self._trava:
+            self._limpar()
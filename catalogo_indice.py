@@ -0,0 +1,278 @@
+"""
+Índice do catálogo (produtos_2) em memória, carregado uma vez e compartilhado pelo processo.
+
+Antes, cada análise refazia no banco o JOIN de vendas_detalhes com produtos_2 para a
+"explosão de kits" (item_quantidade * IF(quantidade = 0, 1, quantidade)) e relia os SKUs
+primários (nome, custo, estoque, fornecedor). Agora o catálogo vira arrays compactos:
+- cada `codigo` aponta para a posição do seu sku_primario, o multiplicador do kit e o custo;
+- os SKUs primários (linhas em que codigo = sku_primario) ficam em um DataFrame próprio.
+As vendas são buscadas sem JOIN e explodidas aqui, com um lookup vetorizado (pd.Index,
+por hash); consultar o catálogo não vai mais ao banco.
+
+Atualização: uma "impressão digital" barata da tabela (contagem de linhas + soma dos CRC32
+de cada linha) é conferida no máximo a cada CATALOGO_VERIFICAR_SEGUNDOS; o catálogo só é
+relido quando ela muda. O índice é guardado em disco, então o app reiniciado só confere
+a impressão digital.
+- O estoque (saldoVirtualTotal) fica fora da impressão digital: ele muda a todo momento no
+  ERP e relê-lo não deve recarregar o catálogo inteiro. Quem precisa do estoque atual pede
+  produtos_primarios(forcar_verificacao=True), que relê só o estoque dos SKUs primários.
+- A "impressão dos kits" cobre só o que muda a explosão de kits e o custo (codigo,
+  sku_primario, quantidade, precoCusto). Quando ela muda, `ao_alterar_kits()` é chamada para
+  descartar o que foi calculado com o catálogo antigo; o cubo da Curva ABC a guarda junto
+  com os dias calculados.
+"""
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from cache_local import caminho_cache
+
+CATALOGO_VERIFICAR_SEGUNDOS = float(os.getenv("CATALOGO_VERIFICAR_SEGUNDOS", "60"))
+
+CONSULTA_CATALOGO = """
+    SELECT id, produto_id, codigo, sku_primario, nome, quantidade, saldoVirtualTotal, Fornecedor, precoCusto
+    FROM produtos_2;
+"""
+
+CONSULTA_IMPRESSAO_CATALOGO = """
+    SELECT COUNT(*) AS linhas,
+           COALESCE(SUM(CRC32(CONCAT_WS('|', id, produto_id, codigo, sku_primario, nome, quantidade,
+                                        Fornecedor, precoCusto))), 0) AS soma_crc,
+           COALESCE(SUM(CRC32(CONCAT_WS('|', codigo, sku_primario, quantidade, precoCusto))), 0) AS soma_crc_kits
+    FROM produtos_2;
+"""
+
+CONSULTA_ESTOQUE_PRIMARIOS = """
+    SELECT id, saldoVirtualTotal
+    FROM produtos_2
+    WHERE codigo = sku_primario;
+"""
+
+COLUNAS_PRIMARIOS = ['id', 'produto_id', 'sku_primario', 'nome', 'saldoVirtualTotal', 'Fornecedor', 'precoCusto']
+
+
+def _normalizar_fornecedor(valores) -> pd.Series:
+    # A comparação do MySQL (collation *_ci) ignora maiúsculas e espaços no fim
+    return pd.Series(valores, dtype=object).astype('string').str.strip().str.upper()
+
+
+class _Indice:
+    """Arrays montados a partir de um catálogo lido do banco. Nunca é alterado depois de criado."""
+
+    def __init__(self, catalogo: pd.DataFrame, impressao_digital: str, impressao_kits: str = None):
+        self.catalogo = catalogo
+        self.impressao_digital = impressao_digital
+        self.impressao_kits = impressao_kits  # só codigo, sku_primario, quantidade e precoCusto
+
+        # Em um `codigo` repetido vale a última linha (o JOIN do SQL contaria a venda duas vezes)
+        por_codigo = catalogo.drop_duplicates(subset='codigo', keep='last')
+        self.codigos = pd.Index(por_codigo['codigo'].astype(str).to_numpy(dtype=object))
+        posicao_sku, self.skus = pd.factorize(por_codigo['sku_primario'], sort=True)
+        self.skus = pd.Index(np.asarray(self.skus, dtype=object))
+        self.sku_do_codigo = posicao_sku.astype(np.int32)  # -1: sku_primario nulo
+        quantidade = pd.to_numeric(por_codigo['quantidade'], errors='coerce').to_numpy(dtype=float)
+        self.multiplicador = np.where(quantidade == 0, 1.0, quantidade)  # IF(quantidade = 0, 1, quantidade)
+        self.custo = pd.to_numeric(por_codigo['precoCusto'], errors='coerce').to_numpy(dtype=float)
+
+        # Linhas dos SKUs primários, na ordem do banco (duplicatas mantidas, como no SQL)
+        self.primarios = catalogo.loc[catalogo['codigo'] == catalogo['sku_primario'], COLUNAS_PRIMARIOS].reset_index(drop=True)
+        self.fornecedor_normalizado = _normalizar_fornecedor(self.primarios['Fornecedor'].to_numpy())
+        # sku_primario -> linha em `primarios` (em duplicatas vale a última, como em calcular_sugestoes_compra)
+        self.posicao_primario = {sku: posicao for posicao, sku in enumerate(self.primarios['sku_primario'].tolist())}
+
+
+class IndiceCatalogo:
+    """
+    `buscar_catalogo()` deve devolver o resultado de CONSULTA_CATALOGO, `buscar_impressao()`
+    o de CONSULTA_IMPRESSAO_CATALOGO e `buscar_estoque()` o de CONSULTA_ESTOQUE_PRIMARIOS
+    (DataFrames, ou None se a consulta falhar).
+    `ao_alterar_kits()` é chamada quando o catálogo é relido com outra impressão dos kits.
+    """
+
+    def __init__(self, buscar_catalogo, buscar_impressao, buscar_estoque=None, nome_arquivo: str = "indice_catalogo.pkl",
+                 identificador_banco: str = "", verificar_segundos: float = CATALOGO_VERIFICAR_SEGUNDOS,
+                 ao_alterar_kits=None):
+        self.buscar_catalogo = buscar_catalogo
+        self.buscar_impressao = buscar_impressao
+        self.buscar_estoque = buscar_estoque
+        self.ao_alterar_kits = ao_alterar_kits
+        self.caminho = caminho_cache(nome_arquivo)
+        self.identificador_banco = identificador_banco
+        self.verificar_segundos = verificar_segundos
+        self._trava = threading.Lock()
+        self._carregado_do_disco = False
+        self._indice = None
+        self._verificado_em = 0.0
+        self.contadores = {"carregamentos": 0, "verificacoes": 0, "inalterado": 0}
+
+    # --- Persistência ---
+    def _carregar_do_disco(self):
+        if self._carregado_do_disco:
+            return
+        self._carregado_do_disco = True
+        try:
+            with open(self.caminho, "rb") as f:
+                salvo = pickle.load(f)
+            if salvo.get("identificador_banco") == self.identificador_banco:
+                self._indice = _Indice(salvo["catalogo"], salvo["impressao_digital"], salvo.get("impressao_kits"))
+                print(f"Índice do catálogo carregado do disco ({len(salvo['catalogo'])} produtos).")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Aviso: índice do catálogo em disco ignorado ({e}).")
+
+    def _salvar_no_disco(self):
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+            with open(temporario, "wb") as f:
+                pickle.dump({
+                    "identificador_banco": self.identificador_banco,
+                    "impressao_digital": self._indice.impressao_digital,
+                    "impressao_kits": self._indice.impressao_kits,
+                    "catalogo": self._indice.catalogo,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, self.caminho)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o índice do catálogo em disco: {e}")
+
+    # --- Atualização ---
+    def _ler_impressao_digital(self):
+        """(impressão digital do catálogo, impressão dos kits), ou (None, None) se a consulta falhar."""
+        df = self.buscar_impressao()
+        if df is None or df.empty:
+            return None, None
+        linhas, soma, soma_kits = df.iloc[0, 0], df.iloc[0, 1], df.iloc[0, 2]
+        return f"{int(linhas)}:{int(float(soma or 0))}", f"{int(linhas)}:{int(float(soma_kits or 0))}"
+
+    def obter(self, forcar_verificacao: bool = False):
+        """
+        Índice atual, conferindo a impressão digital do catálogo se o intervalo de verificação
+        passou (ou se `forcar_verificacao`). Sem banco, um índice antigo ainda é devolvido.
+        Retorna None se não houver índice nenhum.
+        """
+        indice = self._indice
+        if indice is not None and not forcar_verificacao and time.monotonic() - self._verificado_em < self.verificar_segundos:
+            return indice
+
+        with self._trava:
+            if self._indice is not None and not forcar_verificacao \
+                    and time.monotonic() - self._verificado_em < self.verificar_segundos:
+                return self._indice  # outra thread acabou de verificar
+            self._carregar_do_disco()
+
+            impressao_digital, impressao_kits = self._ler_impressao_digital()
+            self.contadores["verificacoes"] += 1
+            if impressao_digital is None:
+                return self._indice
+            if self._indice is not None and self._indice.impressao_digital == impressao_digital:
+                self.contadores["inalterado"] += 1
+                self._verificado_em = time.monotonic()
+                return self._indice
+
+            print("--- Catálogo alterado (ou ainda não carregado); lendo produtos_2... ---")
+            catalogo = self.buscar_catalogo()
+            if catalogo is None:
+                return self._indice
+            anterior = self._indice
+            self._indice = _Indice(catalogo.reset_index(drop=True), impressao_digital, impressao_kits)
+            self._verificado_em = time.monotonic()
+            self.contadores["carregamentos"] += 1
+            self._salvar_no_disco()
+            if anterior is not None and anterior.impressao_kits != impressao_kits and self.ao_alterar_kits:
+                print("--- Kits ou custos do catálogo mudaram; descartando vendas já explodidas... ---")
+                self.ao_alterar_kits()
+            return self._indice
+
+    def invalidar(self):
+        """Força a conferência da impressão digital no próximo acesso."""
+        self._verificado_em = 0.0
+
+    # --- Consultas ao índice ---
+    def explodir_vendas(self, df_vendas: pd.DataFrame, coluna_codigo: str = 'item_codigo',
+                        coluna_quantidade: str = 'item_quantidade') -> pd.DataFrame:
+        """
+        Troca o código vendido pelo sku_primario, como o JOIN com produtos_2 fazia no banco.
+        Devolve as demais colunas de `df_vendas` mais 'sku_primario', 'demanda_primario'
+        (quantidade * unidades do kit) e 'faturamento_custo' (quantidade * precoCusto do código vendido).
+        Vendas de códigos fora do catálogo (ou sem sku_primario) são descartadas. None se não houver catálogo.
+        """
+        indice = self.obter()
+        if indice is None:
+            return None
+        codigos = df_vendas[coluna_codigo]
+        if isinstance(codigos.dtype, pd.CategoricalDtype):
+            # Busca cada código distinto uma vez só e espalha pelas linhas com os códigos da categoria
+            posicao_categoria = indice.codigos.get_indexer(codigos.cat.categories.astype(str))
+            codigos_categoria = codigos.cat.codes.to_numpy()
+            posicao = np.where(codigos_categoria >= 0, posicao_categoria[codigos_categoria], -1)
+        else:
+            posicao = indice.codigos.get_indexer(codigos.astype(str).to_numpy(dtype=object))
+        posicao_sku = np.where(posicao >= 0, indice.sku_do_codigo[np.maximum(posicao, 0)], -1)
+        manter = posicao_sku >= 0
+
+        quantidade = pd.to_numeric(df_vendas[coluna_quantidade], errors='coerce').to_numpy(dtype=float)[manter]
+        posicao = posicao[manter]
+        resultado = df_vendas.loc[manter].drop(columns=[coluna_codigo, coluna_quantidade]).reset_index(drop=True)
+        # category sobre todos os SKUs do catálogo: partes buscadas em momentos diferentes concatenam sem conversão
+        resultado['sku_primario'] = pd.Categorical.from_codes(posicao_sku[manter], categories=indice.skus)
+        resultado['demanda_primario'] = quantidade * indice.multiplicador[posicao]
+        resultado['faturamento_custo'] = quantidade * indice.custo[posicao]
+        return resultado
+
+    def produtos_primarios(self, fornecedores=None, forcar_verificacao: bool = False) -> pd.DataFrame:
+        """
+        Linhas dos SKUs primários (id, produto_id, sku_primario, nome, saldoVirtualTotal, Fornecedor, precoCusto).
+        Com `forcar_verificacao`, confere a impressão digital e relê o estoque no banco; sem ela,
+        saldoVirtualTotal é o da última leitura do catálogo.
+        """
+        indice = self.obter(forcar_verificacao)
+        if indice is None:
+            return None
+        if fornecedores is None:
+            primarios = indice.primarios.copy()
+        else:
+            manter = indice.fornecedor_normalizado.isin(_normalizar_fornecedor(list(fornecedores))).to_numpy(dtype=bool)
+            primarios = indice.primarios.loc[manter].reset_index(drop=True)
+        if forcar_verificacao and self.buscar_estoque is not None:
+            primarios = self._com_estoque_atual(primarios)
+        return primarios
+
+    def _com_estoque_atual(self, primarios: pd.DataFrame) -> pd.DataFrame:
+        df_estoque = self.buscar_estoque()
+        if df_estoque is None:
+            print("Aviso: estoque não relido; usando o da última leitura do catálogo.")
+            return primarios
+        estoque = df_estoque.drop_duplicates(subset='id', keep='last').set_index('id')['saldoVirtualTotal']
+        atual = primarios['id'].map(estoque)
+        # Produto que deixou de ser primário desde a leitura do catálogo mantém o estoque antigo
+        primarios['saldoVirtualTotal'] = atual.fillna(primarios['saldoVirtualTotal'])
+        return primarios
+
+    def nomes_primarios(self) -> pd.DataFrame:
+        """sku_primario e nome "oficial" (linha do catálogo em que codigo = sku_primario)."""
+        indice = self.obter()
+        return None if indice is None else indice.primarios[['sku_primario', 'nome']].copy()
+
+    def skus_primarios(self) -> list:
+        """Todos os sku_primario distintos do catálogo (inclusive os que só aparecem em kits)."""
+        indice = self.obter()
+        return None if indice is None else [str(sku) for sku in indice.skus]
+
+    def sku_primario_de(self, codigo: str):
+        """sku_primario de um código (kit ou primário), ou None se o código não estiver no catálogo."""
+        indice = self.obter()
+        if indice is None or codigo not in indice.codigos:
+            return None
+        posicao_sku = indice.sku_do_codigo[indice.codigos.get_loc(codigo)]
+        return None if posicao_sku < 0 else indice.skus[posicao_sku]
+
+    def dados_primario(self, sku_primario: str) -> dict:
+        """Atributos do SKU primário (nome, custo, estoque, fornecedor...), ou None se não houver linha primária."""
+        indice = self.obter()
+        posicao = None if indice is None else indice.posicao_primario.get(sku_primario)
+        return None if posicao is None else indice.primarios.iloc[posicao].to_dict()
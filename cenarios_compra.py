@@ -0,0 +1,152 @@
+"""
+Simulação de cenários ("e se?") da sugestão de compras.
+
+A sugestão de compras usa parâmetros fixos: janela de 30 dias de vendas e cobertura de
+30 dias + prazo de entrega do fornecedor. Para testar outros valores sem refazer as
+consultas, o MotorCenarios recebe uma vez os dados de todos os SKUs (vendas diárias,
+estoque, pedidos em aberto, custo, fornecedor e prazo) e avalia uma grade de parâmetros
+com arrays do NumPy, muitos cenários de uma vez (matriz cenários x SKUs):
+
+    motor.avaliar(janelas_vendas=[30, 60], dias_cobertura=[None, 45, 60],
+                  prazos_fornecedor=[{}, {"KAPAZI IND E COM DE CAPACHOS LTDA": 25}],
+                  crescimentos=[1.0, 1.2])
+
+- dias_cobertura None usa a própria janela de vendas (a regra atual da sugestão).
+- prazos_fornecedor: cada item é um dicionário {fornecedor: prazo em dias} que substitui
+  o prazo cadastrado daqueles fornecedores ({} = prazos cadastrados). Também aceita
+  {rótulo: dicionário}, para a coluna 'prazos' do resultado mostrar o rótulo.
+- crescimentos multiplicam a média diária de vendas (1.2 = vendas 20% maiores).
+A fórmula é a mesma de calcular_sugestoes_compra (com os parâmetros padrão, os totais
+batem com a sugestão de compras).
+"""
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+# Tamanho máximo (cenários x SKUs) das matrizes calculadas de uma vez; grades maiores vão em partes
+CENARIOS_ELEMENTOS_POR_LOTE = int(os.getenv("CENARIOS_ELEMENTOS_POR_LOTE", "4000000"))
+
+
+def _normalizar_fornecedor(nome) -> str:
+    return str(nome).strip().upper()
+
+
+class MotorCenarios:
+    """
+    Recebe:
+      - df_vendas: vendas com as colunas 'data', 'sku_primario' e 'demanda_primario' (já com a explosão de kits).
+      - df_produtos: SKUs primários com 'sku_primario', 'saldoVirtualTotal', 'Fornecedor' e 'precoCusto'.
+      - pedidos_em_aberto: Series com as quantidades em pedidos abertos, indexada pelo SKU.
+      - prazos_entrega: {fornecedor: prazo em dias} cadastrados.
+      - hoje: as janelas de vendas terminam em ontem, como em obter_dados_base_vendas.
+    """
+
+    def __init__(self, df_vendas: pd.DataFrame, df_produtos: pd.DataFrame, pedidos_em_aberto: pd.Series,
+                 prazos_entrega: dict, hoje=None):
+        # Em SKUs duplicados no catálogo vale a última linha, como em calcular_sugestoes_compra
+        df_produtos = df_produtos.drop_duplicates(subset='sku_primario', keep='last')
+        fornecedores = np.array([_normalizar_fornecedor(f) for f in df_produtos['Fornecedor'].tolist()], dtype=object)
+
+        # SKUs ordenados por fornecedor: as somas por fornecedor viram np.add.reduceat sobre fatias contíguas
+        ordem = np.argsort(fornecedores, kind='stable')
+        self.skus = pd.Index(np.asarray(df_produtos['sku_primario'].to_numpy(dtype=object)[ordem], dtype=object))
+        fornecedores = fornecedores[ordem]
+        self.fornecedores, self._inicio_fornecedor = np.unique(fornecedores, return_index=True)
+        self._fornecedor_do_sku = np.searchsorted(self.fornecedores, fornecedores)
+
+        self.estoque = pd.to_numeric(df_produtos['saldoVirtualTotal'], errors='coerce').to_numpy(dtype=float)[ordem]
+        self.custo = np.nan_to_num(pd.to_numeric(df_produtos['precoCusto'], errors='coerce').to_numpy(dtype=float)[ordem])
+        pedidos = pd.Series(pedidos_em_aberto, dtype=float)
+        self.pedidos = self.skus.map(pedidos.groupby(pedidos.index.astype(str)).sum()).to_numpy(dtype=float, na_value=0.0)
+        self.prazos_entrega = {_normalizar_fornecedor(nome): float(dias) for nome, dias in prazos_entrega.items()}
+
+        # Vendas guardadas como (posição do SKU, dias até ontem): qualquer janela sai de um bincount
+        hoje = pd.Timestamp(hoje or pd.Timestamp.today()).normalize()
+        posicao = self.skus.get_indexer(df_vendas['sku_primario'].astype(str).to_numpy(dtype=object))
+        manter = posicao >= 0
+        self._posicao_venda = posicao[manter]
+        self._dias_atras = ((hoje - pd.to_datetime(df_vendas['data'])).dt.days.to_numpy()[manter])
+        self._demanda_venda = pd.to_numeric(df_vendas['demanda_primario'], errors='coerce').to_numpy(dtype=float)[manter]
+        self._demanda_por_janela = {}
+
+    def demanda_na_janela(self, dias: int) -> np.ndarray:
+        """Demanda de cada SKU em [hoje - dias, ontem] (mesma janela de obter_dados_base_vendas)."""
+        if dias not in self._demanda_por_janela:
+            dentro = self._dias_atras <= dias
+            self._demanda_por_janela[dias] = np.bincount(self._posicao_venda[dentro], weights=self._demanda_venda[dentro],
+                                                         minlength=len(self.skus))
+        return self._demanda_por_janela[dias]
+
+    def _prazos(self, substituicoes: dict) -> np.ndarray:
+        """Prazo de entrega de cada SKU (NaN: fornecedor sem prazo, fica fora da compra)."""
+        prazos = {**self.prazos_entrega, **{_normalizar_fornecedor(f): float(d) for f, d in substituicoes.items()}}
+        por_fornecedor = np.array([prazos.get(f, np.nan) for f in self.fornecedores], dtype=float)
+        return por_fornecedor[self._fornecedor_do_sku]
+
+    def avaliar(self, janelas_vendas=(30,), dias_cobertura=(None,), prazos_fornecedor=({},), crescimentos=(1.0,)) -> pd.DataFrame:
+        """
+        Avalia todas as combinações dos parâmetros. Retorna uma linha por cenário e fornecedor com
+        'SKUs' (quantos SKUs seriam comprados), 'Unidades' e 'Gasto' (unidades x preço de custo);
+        o total de cada cenário vai em df.attrs['totais_por_cenario'].
+        """
+        if isinstance(prazos_fornecedor, dict):
+            rotulos_prazos, prazos_fornecedor = list(prazos_fornecedor.keys()), list(prazos_fornecedor.values())
+        else:
+            prazos_fornecedor = list(prazos_fornecedor)
+            rotulos_prazos = [_descrever_prazos(p) for p in prazos_fornecedor]
+        grade = list(itertools.product(janelas_vendas, dias_cobertura, range(len(prazos_fornecedor)), crescimentos))
+        n_cenarios, n_skus, n_fornecedores = len(grade), len(self.skus), len(self.fornecedores)
+
+        janela = np.array([g[0] for g in grade], dtype=float)
+        cobertura = np.array([g[0] if g[1] is None else g[1] for g in grade], dtype=float)
+        opcao_prazo = np.array([g[2] for g in grade], dtype=np.int64)
+        crescimento = np.array([g[3] for g in grade], dtype=float)
+
+        janelas_distintas = sorted(set(janelas_vendas))
+        demandas = np.vstack([self.demanda_na_janela(j) for j in janelas_distintas]) if n_skus else np.zeros((len(janelas_distintas), 0))
+        linha_demanda = np.searchsorted(janelas_distintas, janela)
+        prazos = np.vstack([self._prazos(p) for p in prazos_fornecedor]) if n_skus else np.zeros((len(prazos_fornecedor), 0))
+
+        unidades = np.zeros((n_cenarios, n_fornecedores))
+        gasto = np.zeros((n_cenarios, n_fornecedores))
+        skus_comprados = np.zeros((n_cenarios, n_fornecedores), dtype=np.int64)
+        tamanho_lote = max(1, CENARIOS_ELEMENTOS_POR_LOTE // max(n_skus, 1))
+        for inicio in range(0, n_cenarios if n_skus else 0, tamanho_lote):
+            parte = slice(inicio, inicio + tamanho_lote)
+            media_diaria = demandas[linha_demanda[parte]] / janela[parte, None] * crescimento[parte, None]
+            prazo = prazos[opcao_prazo[parte]]
+            quantidade = (cobertura[parte, None] + prazo) * media_diaria - self.estoque - self.pedidos
+            # Mesmos filtros da sugestão: demanda positiva, fornecedor com prazo e compra > 0
+            comprar = (media_diaria > 0) & ~np.isnan(prazo) & (quantidade > 0)
+            quantidade = np.where(comprar, np.ceil(quantidade), 0.0)
+
+            unidades[parte] = np.add.reduceat(quantidade, self._inicio_fornecedor, axis=1)
+            gasto[parte] = np.add.reduceat(quantidade * self.custo, self._inicio_fornecedor, axis=1)
+            skus_comprados[parte] = np.add.reduceat(comprar.astype(np.int64), self._inicio_fornecedor, axis=1)
+
+        parametros = pd.DataFrame({
+            'cenario': np.arange(n_cenarios),
+            'janela_vendas': janela.astype(np.int64),
+            'dias_cobertura': cobertura,
+            'prazos': [rotulos_prazos[o] for o in opcao_prazo],
+            'crescimento': crescimento,
+        })
+        df = parametros.loc[parametros.index.repeat(n_fornecedores)].reset_index(drop=True)
+        df['Fornecedor'] = np.tile(self.fornecedores, n_cenarios)
+        df['SKUs'] = skus_comprados.ravel()
+        df['Unidades'] = unidades.ravel().astype(np.int64)
+        df['Gasto'] = gasto.ravel().round(2)
+
+        totais = parametros.assign(
+            SKUs=skus_comprados.sum(axis=1), Unidades=unidades.sum(axis=1).astype(np.int64), Gasto=gasto.sum(axis=1).round(2)
+        )
+        df.attrs['totais_por_cenario'] = totais
+        return df
+
+
+def _descrever_prazos(substituicoes: dict) -> str:
+    if not substituicoes:
+        return "cadastrados"
+    return "; ".join(f"{nome}: {dias:g}d" for nome, dias in substituicoes.items())
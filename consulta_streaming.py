@@ -0,0 +1,184 @@
+"""
+Execução em streaming de consultas SQL (cursor sem buffer, lidas em lotes).
+
+pd.read_sql traz o resultado inteiro para a memória antes de devolver qualquer coisa.
+Para o SQL gerado pela IA isso é perigoso: um "liste todas as vendas" pode trazer
+milhões de linhas. Aqui as linhas são lidas do servidor aos poucos (fetchmany em um
+cursor sem buffer), cada lote vira um DataFrame e a leitura para quando passa do
+limite de linhas ou de memória, avisando que o resultado foi truncado.
+
+Uma consulta interrompida no meio (limite atingido, cancelamento pelo usuário ou
+erro) recebe um KILL QUERY por uma conexão separada e a conexão usada é descartada,
+já que ainda teria linhas pendentes e não pode voltar ao pool.
+"""
+import os
+import threading
+
+import mysql.connector
+import pandas as pd
+
+from pool_conexoes import obter_pool
+
+STREAMING_LINHAS_POR_LOTE = int(os.getenv("STREAMING_LINHAS_POR_LOTE", "5000"))
+STREAMING_MAX_LINHAS = int(os.getenv("STREAMING_MAX_LINHAS", "200000"))
+STREAMING_MAX_MB = float(os.getenv("STREAMING_MAX_MB", "200"))
+
+
+class ConsultaEmStreaming:
+    """
+    Consulta lida em lotes. Use como context manager e percorra lotes():
+
+        with ConsultaEmStreaming(query) as consulta:
+            for df_lote in consulta.lotes():
+                ...
+        if consulta.truncada:
+            print(consulta.motivo_truncamento)
+
+    cancelar() pode ser chamado de outra thread enquanto os lotes estão sendo lidos.
+    """
+
+    def __init__(self, query: str, pool=None, linhas_por_lote: int = STREAMING_LINHAS_POR_LOTE,
+                 max_linhas: int = STREAMING_MAX_LINHAS, max_bytes: float = STREAMING_MAX_MB * 1024 * 1024):
+        self.query = query
+        self.pool = pool or obter_pool()
+        self.linhas_por_lote = linhas_por_lote
+        self.max_linhas = max_linhas
+        self.max_bytes = max_bytes
+
+        self.linhas_lidas = 0
+        self.bytes_lidos = 0
+        self.truncada = False
+        self.motivo_truncamento = None
+        self.cancelada = False
+        self.colunas = []
+
+        self._conexao = None
+        self._cursor = None
+        self._id_conexao = None
+        self._terminou = False
+        self._trava = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.fechar()
+
+    def _abrir(self):
+        self._conexao = self.pool.obter()
+        self._id_conexao = self._conexao.connection_id
+        self._cursor = self._conexao.cursor(buffered=False)
+        self._cursor.execute(self.query)
+
+    def _truncar(self, motivo: str):
+        self.truncada = True
+        self.motivo_truncamento = motivo
+        print(f"Aviso: resultado truncado. {motivo}")
+
+    def lotes(self):
+        """Gera um DataFrame por lote de linhas, respeitando os limites de linhas e de memória."""
+        if self.cancelada:
+            return  # cancelada antes mesmo de começar
+        try:
+            self._abrir()
+        except mysql.connector.Error:
+            if self.cancelada:
+                return
+            raise
+        if self._cursor.description is None:
+            self._terminou = True  # comando sem resultado (não é um SELECT)
+            return
+        self.colunas = [descricao[0] for descricao in self._cursor.description]
+
+        while not self.cancelada:
+            try:
+                linhas = self._cursor.fetchmany(self.linhas_por_lote)
+            except mysql.connector.Error:
+                if self.cancelada:
+                    break  # a leitura foi interrompida pelo KILL QUERY do cancelamento
+                raise
+            if not linhas:
+                self._terminou = True
+                break
+
+            restantes = self.max_linhas - self.linhas_lidas
+            if restantes <= 0:
+                self._truncar(f"Limite de {self.max_linhas} linhas atingido.")
+                break
+            if len(linhas) > restantes:
+                linhas = linhas[:restantes]
+                self._truncar(f"Limite de {self.max_linhas} linhas atingido.")
+
+            df_lote = pd.DataFrame.from_records(linhas, columns=self.colunas, coerce_float=True)
+            bytes_lote = int(df_lote.memory_usage(deep=True).sum())
+            if self.linhas_lidas and self.bytes_lidos + bytes_lote > self.max_bytes:
+                self._truncar(f"Limite de {self.max_bytes / (1024 * 1024):.0f} MB em memória atingido.")
+                break
+
+            self.linhas_lidas += len(df_lote)
+            self.bytes_lidos += bytes_lote
+            yield df_lote
+            if self.truncada:
+                break
+
+    def _matar_consulta(self):
+        """Interrompe a consulta no servidor usando uma conexão avulsa (a do pool está ocupada lendo)."""
+        if self._id_conexao is None:
+            return
+        try:
+            conexao_kill = mysql.connector.connect(**self.pool.parametros_conexao)
+            try:
+                cursor = conexao_kill.cursor()
+                cursor.execute(f"KILL QUERY {int(self._id_conexao)}")
+                cursor.close()
+            finally:
+                conexao_kill.close()
+        except Exception as e:
+            print(f"Aviso: não foi possível interromper a consulta no servidor: {e}")
+
+    def cancelar(self):
+        """Pede o cancelamento da consulta; a leitura dos lotes para na sequência."""
+        with self._trava:
+            if self.cancelada or self._terminou:
+                return
+            self.cancelada = True
+        print("Consulta cancelada pelo usuário.")
+        self._matar_consulta()
+
+    def fechar(self):
+        """Libera a conexão. Se ainda havia linhas pendentes, a consulta é morta e a conexão descartada."""
+        if self._conexao is None:
+            return
+        conexao, self._conexao = self._conexao, None
+        if self._terminou:
+            try:
+                self._cursor.close()
+            except Exception:
+                conexao.invalidar()
+        else:
+            if not self.cancelada:
+                self._matar_consulta()
+            conexao.invalidar()
+        conexao.close()
+        self._id_conexao = None  # o id pode ser reaproveitado pelo servidor; não matar mais nada com ele
+
+
+def ler_em_streaming(query: str, ao_receber_lote=None, ao_iniciar=None, **limites):
+    """
+    Lê a consulta inteira em lotes e devolve (DataFrame, consulta).
+      - ao_iniciar(consulta): chamada antes da leitura; permite guardar a consulta para cancelá-la.
+      - ao_receber_lote(df_lote, linhas_lidas): chamada a cada lote recebido.
+    O DataFrame contém no máximo os limites configurados; confira consulta.truncada.
+    """
+    lotes = []
+    with ConsultaEmStreaming(query, **limites) as consulta:
+        if ao_iniciar:
+            ao_iniciar(consulta)
+        for df_lote in consulta.lotes():
+            lotes.append(df_lote)
+            if ao_receber_lote:
+                ao_receber_lote(df_lote, consulta.linhas_lidas)
+
+    if not lotes:
+        return pd.DataFrame(columns=consulta.colunas), consulta
+    return pd.concat(lotes, ignore_index=True), consulta
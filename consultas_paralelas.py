@@ -0,0 +1,76 @@
+"""
+Execução concorrente de consultas (ou funções) independentes.
+
+As consultas são de I/O (o tempo é gasto esperando o MySQL), então threads bastam:
+cada tarefa pega sua própria conexão do pool (pool_conexoes.py). Os resultados voltam
+na mesma ordem das tarefas e o erro de uma tarefa não derruba as outras.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from pool_conexoes import POOL_TAMANHO
+
+
+class ResultadoTarefa:
+    """Resultado de uma tarefa: `valor` se deu certo, ou `erro` com a exceção levantada."""
+
+    def __init__(self, valor=None, erro: BaseException = None):
+        self.valor = valor
+        self.erro = erro
+
+    @property
+    def ok(self) -> bool:
+        return self.erro is None
+
+    def obter(self):
+        """Retorna o valor ou relança o erro da tarefa."""
+        if self.erro is not None:
+            raise self.erro
+        return self.valor
+
+
+# Executor compartilhado pelo processo; não adianta ter mais threads que conexões no pool
+_executor = None
+_trava_executor = threading.Lock()
+
+
+def _obter_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _trava_executor:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=POOL_TAMANHO, thread_name_prefix="consulta")
+    return _executor
+
+
+def executar_em_paralelo(tarefas: list) -> list:
+    """
+    Executa as funções (sem argumentos) de `tarefas` ao mesmo tempo.
+    Retorna uma lista de ResultadoTarefa na mesma ordem das tarefas.
+    Obs: não chame executar_em_paralelo de dentro de uma tarefa (o executor é compartilhado).
+    """
+    if len(tarefas) <= 1:
+        futuros = None
+    else:
+        executor = _obter_executor()
+        # Cada tarefa roda com uma cópia do contexto atual, para o rastreamento saber a que resposta ela pertence
+        futuros = [executor.submit(contextvars.copy_context().run, tarefa) for tarefa in tarefas]
+
+    resultados = []
+    for indice, tarefa in enumerate(tarefas):
+        try:
+            valor = futuros[indice].result() if futuros else tarefa()
+            resultados.append(ResultadoTarefa(valor=valor))
+        except Exception as e:
+            print(f"Erro na tarefa paralela {indice + 1}/{len(tarefas)}: {e}")
+            resultados.append(ResultadoTarefa(erro=e))
+    return resultados
+
+
+def executar_consultas_em_paralelo(queries: list, executar_consulta) -> list:
+    """
+    Atalho para rodar várias consultas SQL independentes com `executar_consulta`.
+    Retorna uma lista de ResultadoTarefa, um por consulta, na ordem recebida.
+    """
+    return executar_em_paralelo([lambda query=query: executar_consulta(query) for query in queries])
@@ -0,0 +1,213 @@
+"""
+Cubo diário SKU x dia com o faturamento a preço de custo, usado pela Curva ABC.
+
+Em vez de rodar um GROUP BY pesado em vendas_detalhes a cada análise, o cubo guarda
+o total diário de cada sku_primario (SUM(item_quantidade * precoCusto)), persistido em
+disco e atualizado de forma incremental: só os dias que ainda não estão no cubo são
+buscados. Os últimos dias já carregados são reprocessados uma vez por dia, porque a
+situação dos pedidos recentes ainda muda no ERP. Os dias guardados usam o custo e a
+explosão de kits do catálogo da época; se a impressão dos kits do catálogo muda (codigo,
+sku_primario, quantidade e precoCusto; ver catalogo_indice.py), o cubo é refeito.
+Mudanças de estoque, nome ou fornecedor não mexem no cubo.
+
+A soma de qualquer janela [data_inicio, data_fim] sai de somas acumuladas por SKU:
+  total = acumulado(data_fim) - acumulado(data_inicio - 1)
+o que permite responder janelas arbitrárias e comparativas em milissegundos.
+"""
+import os
+import pickle
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from cache_local import caminho_cache
+from tipos_colunas import concatenar
+
+# Quantos dias finais do cubo são buscados de novo (uma vez por dia) para pegar mudanças de situação
+CUBO_DIAS_REPROCESSAR = int(os.getenv("CUBO_DIAS_REPROCESSAR", "3"))
+
+# Valores menores que isso são resíduo de ponto flutuante da subtração de acumulados
+_TOLERANCIA = 1e-6
+
+
+class CuboCustoDiario:
+    """
+    `buscar_periodo(data_inicio, data_fim)` deve devolver um DataFrame com as colunas
+    'data', 'sku_primario' e 'faturamento_custo' já agregadas por dia e SKU para o
+    intervalo fechado [data_inicio, data_fim] (ou None se a consulta falhar).
+    """
+
+    def __init__(self, buscar_periodo, nome_arquivo: str = "cubo_custo_diario.pkl", identificador_banco: str = ""):
+        self.buscar_periodo = buscar_periodo
+        self.caminho = caminho_cache(nome_arquivo)
+        self.identificador_banco = identificador_banco
+        self._trava = threading.RLock()
+        self._carregado = False
+        self._dados = None       # DataFrame longo: data (datetime64), sku_primario, faturamento_custo
+        self._inicio = None      # primeiro dia coberto pelo cubo
+        self._fim = None         # último dia coberto pelo cubo
+        self._reprocessado_em = None
+        self._impressao_catalogo = None  # impressão dos kits do catálogo com que os dias foram calculados
+        self._indices = None
+
+    # --- Persistência ---
+    def _carregar_do_disco(self):
+        if self._carregado:
+            return
+        self._carregado = True
+        try:
+            with open(self.caminho, "rb") as f:
+                salvo = pickle.load(f)
+            if salvo.get("identificador_banco") != self.identificador_banco:
+                return
+            self._dados, self._inicio, self._fim = salvo["dados"], salvo["inicio"], salvo["fim"]
+            self._reprocessado_em = salvo.get("reprocessado_em")
+            self._impressao_catalogo = salvo.get("impressao_catalogo")
+            print(f"Cubo de custo diário carregado do disco ({self._inicio} a {self._fim}).")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Aviso: cubo em disco ignorado ({e}).")
+
+    def _salvar_no_disco(self):
+        temporario = f"{self.caminho}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+            with open(temporario, "wb") as f:
+                pickle.dump({
+                    "identificador_banco": self.identificador_banco,
+                    "dados": self._dados,
+                    "inicio": self._inicio,
+                    "fim": self._fim,
+                    "reprocessado_em": self._reprocessado_em,
+                    "impressao_catalogo": self._impressao_catalogo,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, self.caminho)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o cubo em disco: {e}")
+
+    # --- Atualização incremental ---
+    def _buscar(self, inicio: date, fim: date) -> pd.DataFrame:
+        df = self.buscar_periodo(inicio, fim)
+        if df is None:
+            raise RuntimeError(f"Falha ao buscar o período {inicio} a {fim} para o cubo.")
+        df = df.loc[df['sku_primario'].notna(), ['data', 'sku_primario', 'faturamento_custo']].copy()
+        df['data'] = pd.to_datetime(df['data'])
+        df['faturamento_custo'] = pd.to_numeric(df['faturamento_custo'], errors='coerce').fillna(0.0).astype(float)
+        return df
+
+    def _substituir_periodo(self, df_novo: pd.DataFrame, inicio: date, fim: date):
+        if self._dados is not None:
+            datas = self._dados['data']
+            fora = (datas < pd.Timestamp(inicio)) | (datas > pd.Timestamp(fim))
+            df_novo = concatenar([self._dados[fora], df_novo])
+        self._dados = df_novo
+        self._inicio = inicio if self._inicio is None else min(self._inicio, inicio)
+        self._fim = fim if self._fim is None else max(self._fim, fim)
+        self._indices = None
+
+    def atualizar(self, inicio: date, fim: date, hoje: date = None, impressao_catalogo: str = None):
+        """
+        Garante que o cubo cubra [inicio, fim] (limitado a ontem), buscando só o que falta.
+        Com `impressao_catalogo` (impressão dos kits do índice do catálogo) diferente da usada
+        no cubo, os dias guardados são descartados.
+        """
+        hoje = hoje or date.today()
+        fim = min(fim, hoje - timedelta(days=1))
+        if fim < inicio:
+            return
+
+        with self._trava:
+            self._carregar_do_disco()
+            alterado = False
+
+            if self._dados is not None and impressao_catalogo is not None \
+                    and impressao_catalogo != self._impressao_catalogo:
+                print("--- Catálogo alterado desde a montagem do cubo da Curva ABC; refazendo o cubo... ---")
+                self._dados = self._inicio = self._fim = self._indices = None
+
+            if self._dados is None:
+                self._substituir_periodo(self._buscar(inicio, fim), inicio, fim)
+                self._reprocessado_em = hoje
+                self._impressao_catalogo = impressao_catalogo
+                alterado = True
+            else:
+                if self._reprocessado_em != hoje:
+                    # Reprocessa os últimos dias do cubo, cuja situação ainda pode ter mudado
+                    inicio_reprocessar = max(self._inicio, self._fim - timedelta(days=CUBO_DIAS_REPROCESSAR - 1))
+                    if CUBO_DIAS_REPROCESSAR > 0:
+                        self._substituir_periodo(self._buscar(inicio_reprocessar, self._fim), inicio_reprocessar, self._fim)
+                    self._reprocessado_em = hoje
+                    alterado = True
+                if inicio < self._inicio:
+                    fim_faltante = self._inicio - timedelta(days=1)
+                    self._substituir_periodo(self._buscar(inicio, fim_faltante), inicio, fim_faltante)
+                    alterado = True
+                if fim > self._fim:
+                    inicio_faltante = self._fim + timedelta(days=1)
+                    self._substituir_periodo(self._buscar(inicio_faltante, fim), inicio_faltante, fim)
+                    alterado = True
+
+            if alterado:
+                self._salvar_no_disco()
+
+    # --- Consulta por janela ---
+    def _preparar_indices(self):
+        """Ordena o cubo por (SKU, dia) e calcula o acumulado de cada SKU."""
+        if self._indices is not None:
+            return self._indices
+        codigos, skus = pd.factorize(self._dados['sku_primario'], sort=True)
+        dias = self._dados['data'].to_numpy('datetime64[D]').astype(np.int64)
+        deslocamento = np.int64(dias.max() - dias.min() + 2) if len(dias) else np.int64(1)
+        base_dia = dias.min() - 1 if len(dias) else 0
+
+        chaves = codigos.astype(np.int64) * deslocamento + (dias - base_dia)
+        ordem = np.argsort(chaves, kind='stable')
+        chaves = chaves[ordem]
+        valores = self._dados['faturamento_custo'].to_numpy(dtype=float)[ordem]
+        codigos_ordenados = codigos[ordem]
+
+        # Acumulado dentro de cada SKU (somar por grupo evita perder precisão com totais gigantes)
+        acumulado = pd.Series(valores).groupby(codigos_ordenados).cumsum().to_numpy()
+        primeira_posicao = np.searchsorted(codigos_ordenados, np.arange(len(skus)), side='left')
+
+        self._indices = {
+            "skus": np.asarray(skus, dtype=object),
+            "chaves": chaves,
+            "acumulado": acumulado,
+            "primeira_posicao": primeira_posicao,
+            "deslocamento": deslocamento,
+            "base_dia": base_dia,
+        }
+        return self._indices
+
+    def faturamento_por_sku(self, data_inicio: date, data_fim: date) -> pd.DataFrame:
+        """
+        Soma de faturamento_custo por sku_primario na janela [data_inicio, data_fim],
+        calculada pelos acumulados do cubo (sem ir ao banco).
+        Retorna só os SKUs com faturamento > 0, como o HAVING da consulta original.
+        """
+        with self._trava:
+            if self._dados is None or self._dados.empty:
+                return pd.DataFrame(columns=['sku_primario', 'faturamento_custo'])
+            ind = self._preparar_indices()
+
+        n_skus = len(ind["skus"])
+        codigos = np.arange(n_skus, dtype=np.int64)
+        dia_inicio = np.datetime64(data_inicio, 'D').astype(np.int64) - ind["base_dia"]
+        dia_fim = np.datetime64(data_fim, 'D').astype(np.int64) - ind["base_dia"]
+        # Janela depois do último dia: dia_inicio passa do fim e a subtração dá zero
+        dia_inicio = np.clip(dia_inicio, 0, ind["deslocamento"])
+        dia_fim = np.clip(dia_fim, -1, ind["deslocamento"] - 1)
+
+        def acumulado_ate(dia_relativo):
+            # Última posição de cada SKU com dia <= dia_relativo
+            posicao = np.searchsorted(ind["chaves"], codigos * ind["deslocamento"] + dia_relativo, side='right') - 1
+            tem_vendas = posicao >= ind["primeira_posicao"]
+            return np.where(tem_vendas, ind["acumulado"][np.maximum(posicao, 0)], 0.0)
+
+        totais = acumulado_ate(dia_fim) - acumulado_ate(dia_inicio - 1)
+        manter = totais > _TOLERANCIA
+        return pd.DataFrame({'sku_primario': ind["skus"][manter], 'faturamento_custo': totais[manter]})
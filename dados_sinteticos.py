@@ -0,0 +1,268 @@
+"""
+Dados sintéticos para medir o agente sem tocar no MySQL de produção.
+
+- gerar_banco_sintetico() cria um arquivo SQLite com as mesmas tabelas e colunas que
+  as rotinas do agente consultam: vendas_detalhes, produtos_2 (com kits apontando para
+  o sku_primario e a quantidade de unidades do kit) e pedido_compras.
+  Os dados imitam o formato real: poucos SKUs vendem muito (distribuição de Zipf),
+  fim de semana vende menos, há vendas canceladas e fornecedores fora da lista de compras.
+- PoolSQLite é um substituto do pool MySQL: com pool_conexoes.definir_pool(PoolSQLite(caminho)),
+  executar_consulta() e as demais funções do agente passam a ler o banco sintético.
+  As funções IF(), CRC32() e CONCAT_WS() do MySQL, usadas pelo agente, são registradas em cada conexão.
+
+Escala: `linhas_vendas` vai de dezenas de milhares a dezenas de milhões; o catálogo cresce
+junto (1 SKU primário a cada 200 linhas de venda, entre 200 e 50.000).
+"""
+import os
+import sqlite3
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+
+from pool_conexoes import POOL_TAMANHO, PoolConexoes
+
+DIAS_HISTORICO_PADRAO = 400  # cobre a comparação da Curva ABC (2 x 90 dias) e a previsão (180 dias)
+LINHAS_POR_LOTE_INSERCAO = 200_000
+FORNECEDOR_FORA_DA_LISTA = "FORNECEDOR SEM PRAZO CADASTRADO LTDA"
+
+SITUACOES_VENDA = ["Aprovado", "Em Aberto", "Em andamento", "Cancelado"]
+PROBABILIDADES_SITUACAO_VENDA = [0.82, 0.07, 0.06, 0.05]
+SITUACOES_PEDIDO = ["em aberto", "em andamento", "atendido", "cancelado"]
+PROBABILIDADES_SITUACAO_PEDIDO = [0.35, 0.15, 0.4, 0.1]
+
+# O MySQL devolve as colunas DATE como datetime.date; o substituto faz o mesmo (e aceita datas como parâmetro)
+sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()))
+sqlite3.register_adapter(date, date.isoformat)
+
+_TABELAS = """
+    CREATE TABLE produtos_2 (
+        id INTEGER PRIMARY KEY, produto_id INTEGER, codigo TEXT, sku_primario TEXT, nome TEXT,
+        quantidade INTEGER, saldoVirtualTotal INTEGER, Fornecedor TEXT, precoCusto REAL
+    );
+    CREATE TABLE vendas_detalhes (
+        numero INTEGER, data DATE, item_codigo TEXT, item_descricao TEXT,
+        item_quantidade INTEGER, valorBase REAL, situacao_desc TEXT
+    );
+    CREATE TABLE pedido_compras (
+        id INTEGER PRIMARY KEY, data DATE, codigo TEXT, quantidade INTEGER, situacao TEXT
+    );
+    CREATE TABLE benchmark_info (chave TEXT PRIMARY KEY, valor TEXT);
+"""
+
+_INDICES = """
+    CREATE INDEX idx_vendas_data ON vendas_detalhes (data);
+    CREATE INDEX idx_produtos_codigo ON produtos_2 (codigo);
+    CREATE INDEX idx_produtos_sku_primario ON produtos_2 (sku_primario);
+    CREATE INDEX idx_pedidos_situacao ON pedido_compras (situacao);
+"""
+
+
+def _se(condicao, valor_verdadeiro, valor_falso):
+    """IF(condição, a, b) do MySQL."""
+    return valor_verdadeiro if condicao else valor_falso
+
+
+def _crc32(valor):
+    """CRC32(texto) do MySQL (impressão digital do catálogo)."""
+    return None if valor is None else zlib.crc32(str(valor).encode("utf-8"))
+
+
+def _concat_ws(separador, *valores):
+    """CONCAT_WS(separador, ...) do MySQL: valores nulos são ignorados."""
+    return separador.join(str(valor) for valor in valores if valor is not None)
+
+
+class _ConexaoSQLite(sqlite3.Connection):
+    """Conexão SQLite com os métodos que o pool usa para checar conexões MySQL."""
+
+    def is_connected(self) -> bool:
+        return True
+
+    def ping(self, reconnect: bool = False):
+        self.execute("SELECT 1")
+
+
+def conectar_sqlite(caminho: str) -> sqlite3.Connection:
+    """Abre o banco sintético com datas convertidas para datetime.date e as funções do MySQL registradas."""
+    conexao = sqlite3.connect(caminho, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+                              factory=_ConexaoSQLite)
+    conexao.create_function("IF", 3, _se, deterministic=True)
+    conexao.create_function("CRC32", 1, _crc32, deterministic=True)
+    conexao.create_function("CONCAT_WS", -1, _concat_ws, deterministic=True)
+    return conexao
+
+
+class PoolSQLite(PoolConexoes):
+    """
+    Pool com a mesma interface do pool MySQL, mas sobre um arquivo SQLite.
+    Cada conexão é usada por uma thread de cada vez (o pool garante isso), então o
+    acesso concorrente das consultas paralelas do agente funciona como no MySQL.
+    """
+
+    dialeto = "sqlite"
+
+    def __init__(self, caminho: str, tamanho: int = POOL_TAMANHO):
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"Banco sintético não encontrado: {caminho}")
+        # Conexões locais não caem nem envelhecem: sem ping e sem reciclagem
+        super().__init__(tamanho=tamanho, reciclar_segundos=float("inf"), ping_apos_segundos=float("inf"),
+                         caminho=caminho)
+
+    def _criar_conexao(self):
+        conexao = conectar_sqlite(self.parametros_conexao["caminho"])
+        with self._trava:
+            self._contadores["criadas"] += 1
+        return conexao
+
+
+def _pesos_zipf(quantidade: int, expoente: float, rng) -> np.ndarray:
+    """Probabilidades de venda por item: poucos itens concentram a maior parte (em ordem aleatória)."""
+    pesos = 1.0 / np.arange(1, quantidade + 1) ** expoente
+    rng.shuffle(pesos)
+    return pesos / pesos.sum()
+
+
+def _pesos_dias(dias: int, ultimo_dia: date) -> np.ndarray:
+    """Sazonalidade semanal (fim de semana vende menos) com leve tendência de alta."""
+    datas = [ultimo_dia - timedelta(days=dias - 1 - i) for i in range(dias)]
+    semana = np.array([0.7 if d.weekday() >= 5 else 1.0 for d in datas])
+    tendencia = np.linspace(0.85, 1.15, dias)
+    pesos = semana * tendencia
+    return pesos / pesos.sum()
+
+
+def _gerar_catalogo(produtos_primarios: int, fornecedores: list, rng) -> dict:
+    """Colunas de produtos_2: SKUs primários e kits (cada kit aponta para um primário e quantas unidades leva)."""
+    n_kits = produtos_primarios // 4
+    total = produtos_primarios + n_kits
+
+    skus = np.array([f"SKU{i:06d}" for i in range(produtos_primarios)], dtype=object)
+    # ~10% dos produtos são de fornecedores fora da lista de compras do agente
+    opcoes_fornecedor = np.array(list(fornecedores) + [FORNECEDOR_FORA_DA_LISTA], dtype=object)
+    pesos_fornecedor = np.full(len(opcoes_fornecedor), 0.9 / len(fornecedores))
+    pesos_fornecedor[-1] = 0.1
+    fornecedor_primario = rng.choice(opcoes_fornecedor, size=produtos_primarios, p=pesos_fornecedor)
+    custo_primario = np.round(rng.lognormal(mean=3.0, sigma=0.8, size=produtos_primarios), 2)
+
+    primario_do_kit = rng.integers(0, produtos_primarios, size=n_kits)
+    unidades_kit = rng.integers(2, 13, size=n_kits)
+
+    sku_primario = np.concatenate([skus, skus[primario_do_kit]])
+    # No cadastro real, boa parte dos primários tem quantidade 0 (que vale 1 na explosão de kits)
+    quantidade = np.concatenate([rng.choice([0, 1], size=produtos_primarios), unidades_kit])
+    codigo = np.concatenate([skus, np.array([f"KIT{j:06d}-{u}" for j, u in enumerate(unidades_kit)], dtype=object)])
+    return {
+        "id": np.arange(1, total + 1),
+        "produto_id": np.arange(1, total + 1) + 16_000_000_000,
+        "codigo": codigo,
+        "sku_primario": sku_primario,
+        "nome": np.array([f"Produto sintético {c}" for c in codigo], dtype=object),
+        "quantidade": quantidade,
+        # Kits não têm estoque próprio; o saldo fica no primário
+        "saldoVirtualTotal": np.concatenate([rng.integers(0, 500, size=produtos_primarios), np.zeros(n_kits, dtype=int)]),
+        "Fornecedor": np.concatenate([fornecedor_primario, fornecedor_primario[primario_do_kit]]),
+        "precoCusto": np.concatenate([custo_primario, np.round(custo_primario[primario_do_kit] * unidades_kit, 2)]),
+    }
+
+
+def _inserir(conexao, tabela: str, colunas: dict):
+    nomes = list(colunas)
+    valores = zip(*(colunas[nome].tolist() for nome in nomes))
+    conexao.executemany(f"INSERT INTO {tabela} ({', '.join(nomes)}) VALUES ({', '.join('?' * len(nomes))})", valores)
+
+
+def gerar_banco_sintetico(caminho: str, linhas_vendas: int, produtos_primarios: int = None,
+                          dias: int = DIAS_HISTORICO_PADRAO, semente: int = 42, fornecedores: list = None,
+                          ultimo_dia: date = None, ao_progredir=None) -> dict:
+    """
+    Cria (ou recria) o banco sintético em `caminho` e devolve os metadados gravados em benchmark_info.
+      - linhas_vendas: linhas de vendas_detalhes (10 mil a 50 milhões).
+      - produtos_primarios: tamanho do catálogo (padrão: proporcional às vendas).
+      - ultimo_dia: último dia com vendas (padrão: ontem, como no banco de produção).
+      - ao_progredir(linhas_gravadas, linhas_vendas): chamada a cada lote inserido.
+    A mesma semente gera sempre os mesmos dados (para a mesma data de referência).
+    """
+    if fornecedores is None:
+        from agente_dados import DADOS_FORNECEDORES
+        fornecedores = list(DADOS_FORNECEDORES)
+    rng = np.random.default_rng(semente)
+    produtos_primarios = produtos_primarios or int(np.clip(linhas_vendas // 200, 200, 50_000))
+    ultimo_dia = ultimo_dia or date.today() - timedelta(days=1)
+
+    # Grava em um arquivo temporário: um banco pela metade nunca fica no caminho final
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    conexao = sqlite3.connect(temporario)
+    try:
+        conexao.execute("PRAGMA journal_mode = OFF")
+        conexao.execute("PRAGMA synchronous = OFF")
+        conexao.executescript(_TABELAS)
+
+        catalogo = _gerar_catalogo(produtos_primarios, fornecedores, rng)
+        _inserir(conexao, "produtos_2", catalogo)
+
+        # Vendas: cada linha é um item de um pedido (~3 itens por pedido)
+        pesos_itens = _pesos_zipf(len(catalogo["codigo"]), 1.1, rng)
+        pesos_dias = _pesos_dias(dias, ultimo_dia)
+        datas_texto = np.array([(ultimo_dia - timedelta(days=dias - 1 - i)).isoformat() for i in range(dias)], dtype=object)
+        preco_venda = np.round(catalogo["precoCusto"] * 1.8, 2)
+        gravadas = 0
+        while gravadas < linhas_vendas:
+            tamanho = min(LINHAS_POR_LOTE_INSERCAO, linhas_vendas - gravadas)
+            itens = rng.choice(len(pesos_itens), size=tamanho, p=pesos_itens)
+            quantidades = rng.geometric(0.6, size=tamanho)
+            _inserir(conexao, "vendas_detalhes", {
+                "numero": (np.arange(gravadas, gravadas + tamanho) // 3) + 1,
+                "data": datas_texto[rng.choice(dias, size=tamanho, p=pesos_dias)],
+                "item_codigo": catalogo["codigo"][itens],
+                "item_descricao": catalogo["nome"][itens],
+                "item_quantidade": quantidades,
+                "valorBase": np.round(quantidades * preco_venda[itens], 2),
+                "situacao_desc": rng.choice(np.array(SITUACOES_VENDA, dtype=object), size=tamanho, p=PROBABILIDADES_SITUACAO_VENDA),
+            })
+            gravadas += tamanho
+            if ao_progredir:
+                ao_progredir(gravadas, linhas_vendas)
+
+        # Pedidos de compra: ~30% dos SKUs primários têm algum pedido, alguns já atendidos ou cancelados
+        n_pedidos = max(1, int(produtos_primarios * 0.3))
+        skus_pedido = rng.choice(catalogo["sku_primario"][:produtos_primarios], size=n_pedidos, replace=False)
+        _inserir(conexao, "pedido_compras", {
+            "id": np.arange(1, n_pedidos + 1),
+            "data": datas_texto[rng.integers(max(dias - 60, 0), dias, size=n_pedidos)],
+            "codigo": skus_pedido,
+            "quantidade": rng.integers(5, 300, size=n_pedidos),
+            "situacao": rng.choice(np.array(SITUACOES_PEDIDO, dtype=object), size=n_pedidos, p=PROBABILIDADES_SITUACAO_PEDIDO),
+        })
+
+        conexao.executescript(_INDICES)
+
+        # O SKU primário com mais vendas é o alvo natural da previsão
+        sku_mais_vendido = conexao.execute("""
+            SELECT p.sku_primario FROM vendas_detalhes v JOIN produtos_2 p ON v.item_codigo = p.codigo
+            GROUP BY p.sku_primario ORDER BY SUM(v.item_quantidade) DESC LIMIT 1
+        """).fetchone()[0]
+        info = {
+            "linhas_vendas": linhas_vendas, "produtos_primarios": produtos_primarios,
+            "produtos_total": len(catalogo["codigo"]), "pedidos_compra": n_pedidos,
+            "dias": dias, "ultimo_dia": ultimo_dia.isoformat(), "semente": semente,
+            "sku_mais_vendido": sku_mais_vendido,
+        }
+        conexao.executemany("INSERT INTO benchmark_info (chave, valor) VALUES (?, ?)", [(k, str(v)) for k, v in info.items()])
+        conexao.commit()
+    finally:
+        conexao.close()
+    os.replace(temporario, caminho)
+    return info
+
+
+def ler_info_banco(caminho: str) -> dict:
+    """Metadados gravados por gerar_banco_sintetico() (todos como texto)."""
+    conexao = sqlite3.connect(caminho)
+    try:
+        return dict(conexao.execute("SELECT chave, valor FROM benchmark_info").fetchall())
+    finally:
+        conexao.close()
@@ -0,0 +1,247 @@
+"""
+Envio concorrente de pedidos de compra para a API v3 do Bling.
+
+- Uma única requests.Session com keep-alive é compartilhada por todos os envios
+  (reaproveita as conexões TLS em vez de abrir uma por pedido).
+- Os pedidos de fornecedores diferentes são enviados em paralelo (threads), mas todos
+  passam por um "balde de fichas" que respeita o limite de requisições por segundo do Bling.
+- Respostas 429 e 5xx (e falhas ao conectar) são repetidas com espera exponencial,
+  respeitando o cabeçalho Retry-After quando ele vem; 401 renova o token uma vez.
+  Conexão caída depois do envio (ex: "Connection aborted" numa conexão keep-alive
+  reaproveitada) não é repetida: o pedido pode ter sido criado.
+- O endereço da API vem de BLING_API_URL, então dá para apontar para um servidor falso local nos testes.
+"""
+import json
+import os
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from rastreamento import medir_etapa
+
+BLING_API_URL = os.getenv("BLING_API_URL", "https://api.bling.com.br/Api/v3").rstrip("/")
+BLING_REQUISICOES_POR_SEGUNDO = float(os.getenv("BLING_REQUISICOES_POR_SEGUNDO", "3"))
+BLING_ENVIO_WORKERS = int(os.getenv("BLING_ENVIO_WORKERS", "4"))
+BLING_MAX_TENTATIVAS = int(os.getenv("BLING_MAX_TENTATIVAS", "4"))
+BLING_TIMEOUT_SEGUNDOS = float(os.getenv("BLING_TIMEOUT_SEGUNDOS", "30"))
+BLING_ESPERA_BASE_SEGUNDOS = 1.0
+
+COLUNAS_RESULTADO_ENVIO = ['Fornecedor', 'Itens', 'Status', 'Tentativas', 'Código HTTP', 'Id Pedido', 'Erro']
+
+
+class BaldeDeFichas:
+    """
+    Limitador de taxa (token bucket) thread-safe: no máximo `taxa` requisições por
+    segundo em média, com rajadas de até `capacidade`.
+    """
+
+    def __init__(self, taxa: float = BLING_REQUISICOES_POR_SEGUNDO, capacidade: float = None):
+        self.taxa = taxa
+        self.capacidade = capacidade or taxa
+        self._fichas = self.capacidade
+        self._atualizado_em = time.monotonic()
+        self._trava = threading.Lock()
+
+    def consumir(self):
+        """Bloqueia até haver uma ficha disponível e a consome."""
+        while True:
+            with self._trava:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado_em) * self.taxa)
+                self._atualizado_em = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+
+_sessao_http = None
+_balde_global = None
+_trava_globais = threading.Lock()
+
+
+def obter_sessao_http() -> requests.Session:
+    """Sessão HTTP do processo, com pool de conexões keep-alive do tamanho do número de workers."""
+    global _sessao_http
+    if _sessao_http is None:
+        with _trava_globais:
+            if _sessao_http is None:
+                sessao = requests.Session()
+                adaptador = HTTPAdapter(pool_connections=2, pool_maxsize=max(BLING_ENVIO_WORKERS, 1))
+                sessao.mount("https://", adaptador)
+                sessao.mount("http://", adaptador)
+                _sessao_http = sessao
+    return _sessao_http
+
+
+def obter_balde_bling() -> BaldeDeFichas:
+    """Limitador de taxa compartilhado por todos os envios ao Bling no processo."""
+    global _balde_global
+    if _balde_global is None:
+        with _trava_globais:
+            if _balde_global is None:
+                _balde_global = BaldeDeFichas()
+    return _balde_global
+
+
+def montar_payload_pedido(id_fornecedor: int, produtos_para_comprar: list) -> dict:
+    """Monta o corpo do pedido de compra no formato da API v3 do Bling."""
+    itens_formatados = []
+    for produto in produtos_para_comprar:
+        itens_formatados.append({
+            "produto": {
+                "id": produto['id'],
+                "codigo": produto['sku']
+            },
+            "descricao": produto['nome'],
+            "quantidade": produto['quantidade'],
+            "valor": produto['preco'],
+            "unidade": "un",  # Unidade padrão, pode ser ajustada se necessário
+        })
+    return {
+        "fornecedor": {"id": id_fornecedor},
+        "itens": itens_formatados,
+        "observacoes": f"Pedido gerado em {datetime.now().strftime('%d/%m/%Y %H:%M')} pelo Agente Cientista de Dados."
+    }
+
+
+def _tempo_de_espera(tentativa: int, resposta=None) -> float:
+    """Espera antes da próxima tentativa: Retry-After se vier na resposta, senão exponencial com jitter."""
+    if resposta is not None:
+        retry_after = resposta.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                pass
+    return BLING_ESPERA_BASE_SEGUNDOS * (2 ** tentativa) * (0.5 + random.random() / 2)
+
+
+def _falhou_antes_de_enviar(erro: requests.exceptions.ConnectionError) -> bool:
+    """Só falhas ao abrir a conexão (tempo esgotado, DNS, conexão recusada) garantem que nada foi enviado."""
+    if isinstance(erro, requests.exceptions.ConnectTimeout):
+        return True
+    motivo = getattr(erro.args[0], "reason", None) if erro.args else None
+    return isinstance(motivo, (ConnectTimeoutError, NewConnectionError))
+
+
+def enviar_pedido(nome_fornecedor: str, id_fornecedor: int, produtos_para_comprar: list,
+                  obter_token, renovar_token, sessao: requests.Session = None, balde: BaldeDeFichas = None,
+                  url_base: str = BLING_API_URL, max_tentativas: int = BLING_MAX_TENTATIVAS) -> dict:
+    """
+    Envia o pedido de um fornecedor e devolve uma linha da tabela de resultado.
+      - obter_token(): devolve o access token atual (ou None).
+      - renovar_token(token_rejeitado): renova e devolve o novo access token (ou None); chamado uma vez em caso de 401.
+    """
+    sessao = sessao or obter_sessao_http()
+    balde = balde or obter_balde_bling()
+    resultado = {
+        'Fornecedor': nome_fornecedor, 'Itens': len(produtos_para_comprar), 'Status': 'falha',
+        'Tentativas': 0, 'Código HTTP': None, 'Id Pedido': None, 'Erro': None,
+    }
+
+    access_token = obter_token()
+    if not access_token:
+        resultado['Erro'] = "Sem token de acesso ao Bling."
+        return resultado
+
+    corpo = json.dumps(montar_payload_pedido(id_fornecedor, produtos_para_comprar))
+    url_api = f"{url_base.rstrip('/')}/pedidos/compras"
+    token_renovado = False
+    tentativa = 0
+
+    while tentativa < max_tentativas:
+        resultado['Tentativas'] += 1
+        headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+        balde.consumir()
+        try:
+            print(f"Tentativa {resultado['Tentativas']}: Enviando pedido para {nome_fornecedor}...")
+            with medir_etapa("bling_pedido", fornecedor=nome_fornecedor, tamanho_prompt=len(corpo)) as etapa:
+                response = sessao.post(url_api, data=corpo, headers=headers, timeout=BLING_TIMEOUT_SEGUNDOS)
+                etapa.registrar(codigo_http=response.status_code, tamanho_resposta=len(response.content))
+        except requests.exceptions.ConnectionError as e:
+            if _falhou_antes_de_enviar(e):
+                # Falhou ao conectar: o pedido não chegou ao Bling, então é seguro repetir
+                resultado['Erro'] = f"Erro de conexão: {e}"
+                time.sleep(_tempo_de_espera(tentativa))
+                tentativa += 1
+                continue
+            # Conexão caiu depois do envio: o pedido pode ter sido criado; repetir poderia duplicá-lo
+            resultado['Erro'] = f"Conexão interrompida (verifique no Bling se o pedido foi criado): {e}"
+            print(f"ERRO ao enviar pedido para {nome_fornecedor}: {e}")
+            return resultado
+        except requests.exceptions.RequestException as e:
+            # Ex: tempo de resposta esgotado. O pedido pode ter sido criado; repetir poderia duplicá-lo
+            resultado['Erro'] = f"Erro na requisição (verifique no Bling se o pedido foi criado): {e}"
+            print(f"ERRO ao enviar pedido para {nome_fornecedor}: {e}")
+            return resultado
+
+        resultado['Código HTTP'] = response.status_code
+        if response.status_code in (200, 201):
+            try:
+                resultado['Id Pedido'] = response.json().get('data', {}).get('id')
+            except ValueError:
+                pass
+            resultado['Status'] = 'criado'
+            resultado['Erro'] = None
+            print(f"SUCESSO: Pedido de compra para '{nome_fornecedor}' criado.")
+            return resultado
+
+        if response.status_code == 401 and not token_renovado:
+            # Não consome uma das tentativas de repetição: o pedido nem foi avaliado pela API
+            print("Token expirado. Tentando renovar...")
+            token_renovado = True
+            access_token = renovar_token(access_token)
+            if not access_token:
+                resultado['Erro'] = "Falha ao renovar o token."
+                return resultado
+            continue
+
+        resultado['Erro'] = f"{response.status_code} - {response.text[:500]}"
+        if response.status_code == 429 or response.status_code >= 500:
+            print(f"Bling respondeu {response.status_code} para {nome_fornecedor}; tentando de novo em instantes.")
+            time.sleep(_tempo_de_espera(tentativa, response))
+            tentativa += 1
+            continue
+
+        print(f"ERRO: A API retornou um status inesperado ({response.status_code}).")
+        print("Resposta da API:", response.text)
+        return resultado
+
+    print(f"Falha ao criar o pedido para {nome_fornecedor} após todas as tentativas.")
+    return resultado
+
+
+def enviar_pedidos_em_paralelo(pedidos_por_fornecedor: dict, ids_fornecedores: dict, obter_token, renovar_token,
+                               max_workers: int = BLING_ENVIO_WORKERS, **opcoes) -> pd.DataFrame:
+    """
+    Envia os pedidos de todos os fornecedores ao mesmo tempo (limitados pelo balde de fichas).
+    Recebe {fornecedor: [produtos]} e {fornecedor: id_no_bling}; retorna a tabela de
+    resultado com uma linha por fornecedor, na ordem recebida.
+    """
+    if not pedidos_por_fornecedor:
+        return pd.DataFrame(columns=COLUNAS_RESULTADO_ENVIO)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pedidos_por_fornecedor)), thread_name_prefix="bling") as executor:
+        futuros = [
+            executor.submit(contextvars.copy_context().run, enviar_pedido, nome, ids_fornecedores[nome], produtos,
+                            obter_token, renovar_token, **opcoes)
+            for nome, produtos in pedidos_por_fornecedor.items()
+        ]
+        resultados = []
+        for nome, futuro in zip(pedidos_por_fornecedor, futuros):
+            try:
+                resultados.append(futuro.result())
+            except Exception as e:
+                resultados.append({'Fornecedor': nome, 'Itens': len(pedidos_por_fornecedor[nome]), 'Status': 'falha',
+                                   'Tentativas': 0, 'Código HTTP': None, 'Id Pedido': None, 'Erro': str(e)})
+    return pd.DataFrame(resultados, columns=COLUNAS_RESULTADO_ENVIO)
@@ -0,0 +1,209 @@
+"""
+Guarda de custo para o SQL gerado pela IA, aplicada antes de executar a consulta.
+
+1. Só consultas de leitura passam: um único comando (nenhum ';' no meio), SELECT ou
+   WITH ... SELECT, sem INTO OUTFILE/DUMPFILE nem travas (FOR UPDATE, LOCK IN SHARE MODE).
+   O EXPLAIN só roda depois dessa checagem, porque a conexão aceita vários comandos por chamada.
+2. Roda EXPLAIN FORMAT=JSON e estima quantas linhas o MySQL vai examinar
+   (somando, em cada junção, linhas produzidas até ali × linhas examinadas por busca).
+3. Acima do limite configurado:
+   - consultas simples (sem agregação, ordenação ou LIMIT) recebem um LIMIT automático,
+     o que faz o MySQL parar de ler cedo;
+   - as demais são rejeitadas, com o motivo para mostrar na interface.
+4. Toda consulta aprovada recebe a dica MAX_EXECUTION_TIME, que faz o próprio MySQL
+   abortar a consulta se ela passar do tempo.
+
+A função que roda o EXPLAIN é recebida como parâmetro, então a guarda pode ser testada
+com um banco substituto (ou um plano fixo) sem tocar no MySQL de produção.
+Os exemplos das funções abaixo rodam com `python -m doctest guarda_custo_sql.py`.
+"""
+import os
+import re
+
+GUARDA_MAX_LINHAS_EXAMINADAS = int(os.getenv("GUARDA_MAX_LINHAS_EXAMINADAS", "5000000"))
+GUARDA_ACAO = os.getenv("GUARDA_ACAO", "limitar")  # "limitar" (quando possível) ou "rejeitar"
+GUARDA_LIMIT_AUTOMATICO = int(os.getenv("GUARDA_LIMIT_AUTOMATICO", "10000"))
+GUARDA_MAX_EXECUCAO_MS = int(os.getenv("GUARDA_MAX_EXECUCAO_MS", "30000"))
+
+PADRAO_LEITURA = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+PADRAO_NAO_LIMITAVEL = re.compile(
+    r"\b(GROUP\s+BY|ORDER\s+BY|LIMIT|DISTINCT|UNION|HAVING|COUNT|SUM|AVG|MIN|MAX)\b", re.IGNORECASE
+)
+PADRAO_ESCRITA_OU_TRAVA = re.compile(
+    r"\b(INTO\s+(OUTFILE|DUMPFILE)|FOR\s+(UPDATE|SHARE)|LOCK\s+IN\s+SHARE\s+MODE)\b", re.IGNORECASE
+)
+# Literais e comentários (inclusive as dicas /*+ ... */), que não contam na análise da estrutura
+PADRAO_LITERAIS_E_COMENTARIOS = re.compile(
+    r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|`[^`]*`|--[^\n]*|#[^\n]*|/\*.*?\*/", re.DOTALL
+)
+PADRAO_COMANDO = re.compile(r"\b(SELECT|INSERT|UPDATE|DELETE|REPLACE|TABLE|VALUES|CALL|DO|HANDLER|SET)\b", re.IGNORECASE)
+
+
+class AvaliacaoConsulta:
+    """
+    Resultado da guarda:
+      - permitida: se a consulta pode ser executada.
+      - query: a consulta a executar (com LIMIT e/ou MAX_EXECUTION_TIME aplicados).
+      - linhas_estimadas: estimativa de linhas examinadas pelo MySQL (None se não deu para estimar).
+      - acao: 'aprovada', 'limitada' ou 'rejeitada'.
+      - motivo: explicação para mostrar ao usuário.
+    """
+
+    def __init__(self, permitida: bool, query: str, linhas_estimadas=None, acao: str = "aprovada", motivo: str = ""):
+        self.permitida = permitida
+        self.query = query
+        self.linhas_estimadas = linhas_estimadas
+        self.acao = acao
+        self.motivo = motivo
+
+    def descricao(self) -> str:
+        estimativa = f"~{self.linhas_estimadas:,} linhas examinadas (estimativa do EXPLAIN)" if self.linhas_estimadas is not None else "custo não estimado"
+        return f"{estimativa}. {self.motivo}".strip()
+
+
+def _linhas_de_um_loop(itens: list) -> float:
+    """Linhas examinadas em uma junção: cada tabela é buscada uma vez para cada linha produzida antes dela."""
+    total = 0.0
+    produzidas = 1.0
+    for item in itens:
+        tabela = item.get("table", {}) if isinstance(item, dict) else {}
+        total += produzidas * float(tabela.get("rows_examined_per_scan", 0))
+        produzidas = float(tabela.get("rows_produced_per_join", produzidas))
+        total += _somar_linhas(tabela, ignorar_tabela=True)  # subconsultas materializadas, etc.
+    return total
+
+
+def _somar_linhas(no, ignorar_tabela: bool = False) -> float:
+    if isinstance(no, list):
+        return sum(_somar_linhas(item) for item in no)
+    if not isinstance(no, dict):
+        return 0.0
+    total = 0.0
+    for chave, valor in no.items():
+        if chave == "nested_loop" and isinstance(valor, list):
+            total += _linhas_de_um_loop(valor)
+        elif chave == "table" and isinstance(valor, dict) and not ignorar_tabela:
+            # Consulta de uma tabela só: o bloco tem "table" direto, sem nested_loop
+            total += float(valor.get("rows_examined_per_scan", 0))
+            total += _somar_linhas(valor, ignorar_tabela=True)
+        elif isinstance(valor, (dict, list)):
+            total += _somar_linhas(valor)
+    return total
+
+
+def estimar_linhas_examinadas(plano: dict) -> int:
+    """Estimativa de linhas examinadas a partir do JSON de EXPLAIN FORMAT=JSON."""
+    return int(round(_somar_linhas(plano)))
+
+
+def _esqueleto(query: str) -> str:
+    """A consulta com literais e comentários trocados por espaços (as posições continuam as mesmas)."""
+    return PADRAO_LITERAIS_E_COMENTARIOS.sub(lambda m: " " * len(m.group(0)), query)
+
+
+def _comando_principal(esqueleto: str):
+    """
+    Posição e nome do comando de nível 0 (fora de parênteses). Em WITH ... é o comando
+    depois da lista de CTEs, e não o SELECT de dentro de uma delas. (None, None) se não houver.
+    """
+    profundidade = 0
+    for encontrado in re.finditer(r"[()]|\b\w+\b", esqueleto):
+        texto = encontrado.group(0)
+        if texto == "(":
+            profundidade += 1
+        elif texto == ")":
+            profundidade -= 1
+        elif profundidade == 0 and PADRAO_COMANDO.fullmatch(texto):
+            return encontrado.start(), texto.upper()
+    return None, None
+
+
+def motivo_nao_leitura(query: str):
+    """
+    Motivo pelo qual a consulta não é uma leitura segura, ou None se ela for.
+
+    >>> motivo_nao_leitura("SELECT nome FROM produtos_2 WHERE nome = 'a;b' -- ok; sem problema") is None
+    True
+    >>> motivo_nao_leitura("WITH x AS (SELECT 1) SELECT * FROM x") is None
+    True
+    >>> motivo_nao_leitura("SELECT * FROM vendas_detalhes; DROP TABLE vendas_detalhes")
+    'A consulta deve ter um único comando.'
+    >>> motivo_nao_leitura("WITH x AS (SELECT 1) DELETE FROM vendas_detalhes")
+    'Apenas consultas de leitura (SELECT) podem ser executadas.'
+    >>> motivo_nao_leitura("UPDATE produtos_2 SET nome = 'x'")
+    'Apenas consultas de leitura (SELECT) podem ser executadas.'
+    >>> motivo_nao_leitura("SELECT * FROM produtos_2 INTO OUTFILE '/tmp/p.csv'")
+    'Consultas não podem gravar arquivos nem travar linhas (INTO OUTFILE/DUMPFILE, FOR UPDATE, LOCK IN SHARE MODE).'
+    >>> motivo_nao_leitura("SELECT * FROM produtos_2 INTO DUMPFILE '/tmp/p'") is None
+    False
+    >>> motivo_nao_leitura("SELECT * FROM produtos_2 FOR UPDATE") is None
+    False
+    >>> motivo_nao_leitura("SELECT * FROM produtos_2 LOCK IN SHARE MODE") is None
+    False
+    """
+    esqueleto = _esqueleto(query.strip().rstrip(";"))
+    if ";" in esqueleto:
+        return "A consulta deve ter um único comando."
+    _, comando = _comando_principal(esqueleto)
+    if not PADRAO_LEITURA.match(esqueleto) or comando != "SELECT":
+        return "Apenas consultas de leitura (SELECT) podem ser executadas."
+    if PADRAO_ESCRITA_OU_TRAVA.search(esqueleto):
+        return ("Consultas não podem gravar arquivos nem travar linhas "
+                "(INTO OUTFILE/DUMPFILE, FOR UPDATE, LOCK IN SHARE MODE).")
+    return None
+
+
+def aplicar_tempo_maximo(query: str, max_execucao_ms: int = GUARDA_MAX_EXECUCAO_MS) -> str:
+    """
+    Adiciona a dica /*+ MAX_EXECUTION_TIME(ms) */ ao SELECT principal da consulta
+    (o MySQL ignora a dica no SELECT de dentro de uma CTE).
+
+    >>> aplicar_tempo_maximo("WITH x AS (SELECT 1 AS a) SELECT a FROM x", 500)
+    'WITH x AS (SELECT 1 AS a) SELECT /*+ MAX_EXECUTION_TIME(500) */ a FROM x'
+    >>> aplicar_tempo_maximo("SELECT '(' AS p, (SELECT 1) AS q", 500)
+    "SELECT /*+ MAX_EXECUTION_TIME(500) */ '(' AS p, (SELECT 1) AS q"
+    """
+    if not max_execucao_ms or "MAX_EXECUTION_TIME" in query.upper():
+        return query
+    posicao, comando = _comando_principal(_esqueleto(query))
+    if comando != "SELECT":
+        return query
+    fim = posicao + len("SELECT")
+    return f"{query[:fim]} /*+ MAX_EXECUTION_TIME({int(max_execucao_ms)}) */{query[fim:]}"
+
+
+def avaliar_consulta(query: str, explicar, max_linhas: int = GUARDA_MAX_LINHAS_EXAMINADAS, acao: str = GUARDA_ACAO,
+                     limite_automatico: int = GUARDA_LIMIT_AUTOMATICO,
+                     max_execucao_ms: int = GUARDA_MAX_EXECUCAO_MS) -> AvaliacaoConsulta:
+    """
+    Avalia a consulta antes de executá-la.
+    `explicar(query)` deve devolver o plano (dict) de EXPLAIN FORMAT=JSON da consulta.
+    """
+    query = query.strip().rstrip(";").strip()
+    # Antes do EXPLAIN: um "; DROP ..." no fim rodaria já no EXPLAIN
+    motivo = motivo_nao_leitura(query)
+    if motivo:
+        return AvaliacaoConsulta(False, query, acao="rejeitada", motivo=motivo)
+
+    try:
+        linhas_estimadas = estimar_linhas_examinadas(explicar(query))
+    except Exception as e:
+        print(f"Erro ao analisar a consulta com EXPLAIN: {e}")
+        return AvaliacaoConsulta(False, query, acao="rejeitada", motivo=f"Não foi possível analisar a consulta: {e}")
+
+    print(f"Guarda de custo: ~{linhas_estimadas:,} linhas examinadas (limite: {max_linhas:,}).")
+    if linhas_estimadas <= max_linhas:
+        return AvaliacaoConsulta(True, aplicar_tempo_maximo(query, max_execucao_ms), linhas_estimadas)
+
+    if acao == "limitar" and not PADRAO_NAO_LIMITAVEL.search(query):
+        query_limitada = f"{query} LIMIT {int(limite_automatico)}"
+        return AvaliacaoConsulta(
+            True, aplicar_tempo_maximo(query_limitada, max_execucao_ms), linhas_estimadas, acao="limitada",
+            motivo=f"A consulta examinaria mais de {max_linhas:,} linhas; o resultado foi limitado às primeiras {limite_automatico:,}.",
+        )
+
+    return AvaliacaoConsulta(
+        False, query, linhas_estimadas, acao="rejeitada",
+        motivo=f"A consulta examinaria ~{linhas_estimadas:,} linhas (limite: {max_linhas:,}). "
+               "Tente restringir o período ou adicionar filtros à pergunta.",
+    )
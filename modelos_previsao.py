@@ -0,0 +1,166 @@
+"""
+Armazém de modelos de previsão (Prophet) já ajustados, persistido em disco.
+
+Cada entrada é identificada pelo SKU, pela janela de histórico e pelo horizonte da
+previsão, e guarda o modelo serializado, a previsão gerada, a "marca d'água" dos dados
+(última data do histórico) e um hash do histórico usado.
+- Histórico idêntico ao da entrada: a previsão guardada é devolvida na hora.
+- Histórico mudou (chegaram dias novos): o novo ajuste parte dos parâmetros do modelo
+  anterior (warm start), o que converge bem mais rápido que um ajuste do zero.
+- O armazém tem tamanho máximo em disco; as entradas usadas há mais tempo saem primeiro.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from cache_local import caminho_cache
+from rastreamento import medir_etapa
+
+MODELOS_MAX_MB = float(os.getenv("MODELOS_MAX_MB", "200"))
+MODELOS_MAX_MEMORIA = int(os.getenv("MODELOS_MAX_MEMORIA", "32"))
+
+
+def _hash_historico(df_historico: pd.DataFrame) -> str:
+    valores = pd.util.hash_pandas_object(df_historico[['ds', 'y']].astype({'ds': 'datetime64[ns]', 'y': float}), index=False)
+    return hashlib.sha256(valores.to_numpy().tobytes()).hexdigest()
+
+
+def _parametros_iniciais(modelo) -> dict:
+    """Parâmetros de um modelo ajustado no formato aceito por Prophet.fit(init=...)."""
+    iniciais = {}
+    for nome in ['k', 'm', 'sigma_obs']:
+        iniciais[nome] = modelo.params[nome][0][0]
+    for nome in ['delta', 'beta']:
+        iniciais[nome] = modelo.params[nome][0]
+    return iniciais
+
+
+def _novo_modelo():
+    from prophet import Prophet
+    return Prophet(weekly_seasonality=True, daily_seasonality=False)
+
+
+class ArmazemModelos:
+    def __init__(self, pasta: str = None, max_bytes: float = MODELOS_MAX_MB * 1024 * 1024,
+                 max_memoria: int = MODELOS_MAX_MEMORIA):
+        self.pasta = pasta or caminho_cache("modelos_previsao")
+        self.max_bytes = max_bytes
+        self.max_memoria = max_memoria
+        self._memoria = OrderedDict()  # LRU das entradas mais recentes, evita reler o disco
+        self._trava = threading.Lock()
+        self.contadores = {"acertos": 0, "warm_start": 0, "ajuste_do_zero": 0}
+
+    def _arquivo(self, chave: str) -> str:
+        return os.path.join(self.pasta, hashlib.sha1(chave.encode()).hexdigest() + ".pkl")
+
+    def _ler(self, chave: str):
+        with self._trava:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                entrada = self._memoria[chave]
+                arquivo = self._arquivo(chave)
+                if os.path.exists(arquivo):
+                    os.utime(arquivo)  # marca como usado recentemente
+                return entrada
+        arquivo = self._arquivo(chave)
+        try:
+            with open(arquivo, "rb") as f:
+                entrada = pickle.load(f)
+            os.utime(arquivo)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Aviso: modelo em disco ignorado ({e}).")
+            return None
+        self._guardar_em_memoria(chave, entrada)
+        return entrada
+
+    def _guardar_em_memoria(self, chave: str, entrada: dict):
+        with self._trava:
+            self._memoria[chave] = entrada
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def _gravar(self, chave: str, entrada: dict):
+        self._guardar_em_memoria(chave, entrada)
+        arquivo = self._arquivo(chave)
+        temporario = f"{arquivo}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            with open(temporario, "wb") as f:
+                pickle.dump(entrada, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, arquivo)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o modelo em disco: {e}")
+        self._despejar_excesso()
+
+    def _despejar_excesso(self):
+        """Apaga os modelos usados há mais tempo até o armazém caber em `max_bytes`."""
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if nome.endswith(".pkl"):
+                caminho = os.path.join(self.pasta, nome)
+                try:
+                    estado = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                arquivos.append((estado.st_mtime, estado.st_size, caminho))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(caminho)
+                total -= tamanho
+            except FileNotFoundError:
+                pass
+
+    def obter_previsao(self, sku: str, df_historico: pd.DataFrame, dias_historico: int, dias_previsao: int) -> pd.DataFrame:
+        """
+        Retorna o DataFrame de previsão completo do Prophet (histórico + dias futuros)
+        para o SKU, reaproveitando o modelo guardado sempre que possível.
+        """
+        from prophet.serialize import model_from_json, model_to_json
+
+        chave = f"{sku}|{dias_historico}|{dias_previsao}"
+        hash_atual = _hash_historico(df_historico)
+        marca_dagua = pd.to_datetime(df_historico['ds']).max()
+
+        entrada = self._ler(chave)
+        if entrada and entrada["hash_historico"] == hash_atual:
+            self.contadores["acertos"] += 1
+            print(f"Previsão de {sku} reaproveitada do armazém de modelos (dados inalterados).")
+            return entrada["forecast"].copy()
+
+        with medir_etapa("prophet_ajuste", sku=sku, linhas=len(df_historico)) as etapa:
+            m = _novo_modelo()
+            if entrada:
+                try:
+                    iniciais = _parametros_iniciais(model_from_json(entrada["modelo_json"]))
+                    m.fit(df_historico, init=iniciais)
+                    self.contadores["warm_start"] += 1
+                    etapa.registrar(tipo="warm_start")
+                    print(f"Modelo de {sku} reajustado a partir do anterior (dados até {marca_dagua:%Y-%m-%d}).")
+                except Exception as e:
+                    # Ex: número de pontos de mudança diferente do modelo antigo; ajusta do zero
+                    print(f"Warm start indisponível para {sku} ({e}); ajustando do zero.")
+                    m = _novo_modelo()
+                    entrada = None
+            if not entrada:
+                m.fit(df_historico)
+                self.contadores["ajuste_do_zero"] += 1
+                etapa.registrar(tipo="ajuste_do_zero")
+
+            forecast = m.predict(m.make_future_dataframe(periods=dias_previsao))
+        self._gravar(chave, {
+            "marca_dagua": marca_dagua,
+            "hash_historico": hash_atual,
+            "modelo_json": model_to_json(m),
+            "forecast": forecast,
+        })
+        return forecast.copy()
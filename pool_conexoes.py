@@ -0,0 +1,267 @@
+"""
+Pool de conexões MySQL compartilhado por todo o processo.
+
+Todas as consultas do agente (e todas as sessões do Streamlit, que rodam no mesmo
+processo) pegam conexões emprestadas daqui em vez de abrir uma conexão nova a cada
+chamada. O pool faz:
+- limite de conexões simultâneas (tamanho configurável);
+- pre-ping das conexões que ficaram ociosas por algum tempo antes de entregá-las;
+- reciclagem de conexões antigas (evita erros de 'MySQL server has gone away');
+- contadores de uso para diagnóstico.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_HOST = os.getenv("DB_HOST")
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_NAME = os.getenv("DB_NAME")
+
+# Parâmetros do pool (todos podem ser sobrescritos no .env)
+POOL_TAMANHO = int(os.getenv("DB_POOL_TAMANHO", "5"))
+POOL_RECICLAR_SEGUNDOS = int(os.getenv("DB_POOL_RECICLAR_SEGUNDOS", "1800"))
+POOL_PING_APOS_SEGUNDOS = int(os.getenv("DB_POOL_PING_APOS_SEGUNDOS", "10"))
+POOL_TIMEOUT_SEGUNDOS = float(os.getenv("DB_POOL_TIMEOUT_SEGUNDOS", "30"))
+
+
+class PoolEsgotadoError(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo limite."""
+
+
+class ConexaoDoPool:
+    """
+    Envelope de uma conexão emprestada do pool.
+    Repassa tudo para a conexão real; a diferença é que close() devolve a conexão
+    ao pool em vez de fechá-la de verdade.
+    """
+
+    def __init__(self, pool, conexao, criada_em: float):
+        self._pool = pool
+        self._conexao = conexao
+        self.criada_em = criada_em
+        self._devolvida = False
+        self._invalida = False
+
+    def __getattr__(self, nome):
+        return getattr(self._conexao, nome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def conexao_bruta(self):
+        return self._conexao
+
+    @property
+    def dialeto(self) -> str:
+        """Dialeto SQL do banco por trás do pool (decide o marcador de parâmetros, ver sql_parametrizado.py)."""
+        return self._pool.dialeto
+
+    def invalidar(self):
+        """Marca a conexão para ser descartada (e não reaproveitada) ao ser devolvida."""
+        self._invalida = True
+
+    def close(self):
+        if self._devolvida:
+            return
+        self._devolvida = True
+        self._pool.devolver(self)
+
+
+class PoolConexoes:
+    """
+    Pool de conexões thread-safe. Use `with pool.conexao() as conexao:` ou
+    obter()/close() para pegar e devolver conexões.
+    """
+
+    dialeto = "mysql"
+
+    def __init__(self, tamanho: int = POOL_TAMANHO, reciclar_segundos: int = POOL_RECICLAR_SEGUNDOS,
+                 ping_apos_segundos: int = POOL_PING_APOS_SEGUNDOS, timeout_segundos: float = POOL_TIMEOUT_SEGUNDOS,
+                 **parametros_conexao):
+        self.tamanho = tamanho
+        self.reciclar_segundos = reciclar_segundos
+        self.ping_apos_segundos = ping_apos_segundos
+        self.timeout_segundos = timeout_segundos
+        self.parametros_conexao = parametros_conexao or {
+            "host": DB_HOST, "user": DB_USER, "password": DB_PASSWORD, "database": DB_NAME
+        }
+
+        self._trava = threading.Lock()
+        self._vagas = threading.BoundedSemaphore(tamanho)
+        self._ociosas = []  # pilha de (conexao, criada_em, devolvida_em); LIFO mantém as conexões "quentes"
+        self._em_uso = 0
+        self._contadores = {
+            "criadas": 0,
+            "reutilizadas": 0,
+            "recicladas": 0,
+            "descartadas_ping": 0,
+            "descartadas_erro": 0,
+            "esperas": 0,
+            "pico_em_uso": 0,
+        }
+
+    def _criar_conexao(self):
+        conexao = mysql.connector.connect(**self.parametros_conexao)
+        # Sem autocommit, uma conexão reaproveitada ficaria presa ao snapshot da
+        # primeira leitura (REPEATABLE READ) e nunca veria dados novos.
+        conexao.autocommit = True
+        with self._trava:
+            self._contadores["criadas"] += 1
+        print("Nova conexão com o MySQL aberta para o pool.")
+        return conexao
+
+    @staticmethod
+    def _fechar_silenciosamente(conexao):
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    def _conexao_saudavel(self, conexao, devolvida_em: float) -> bool:
+        if time.monotonic() - devolvida_em < self.ping_apos_segundos:
+            return True
+        try:
+            conexao.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def obter(self) -> ConexaoDoPool:
+        """
+        Empresta uma conexão do pool, esperando no máximo `timeout_segundos`
+        caso todas estejam em uso.
+        """
+        if not self._vagas.acquire(blocking=False):
+            with self._trava:
+                self._contadores["esperas"] += 1
+            if not self._vagas.acquire(timeout=self.timeout_segundos):
+                raise PoolEsgotadoError(
+                    f"Nenhuma conexão livre após {self.timeout_segundos}s (tamanho do pool: {self.tamanho})."
+                )
+
+        try:
+            while True:
+                with self._trava:
+                    item = self._ociosas.pop() if self._ociosas else None
+
+                if item is None:
+                    conexao, criada_em = self._criar_conexao(), time.monotonic()
+                    break
+
+                conexao, criada_em, devolvida_em = item
+                if time.monotonic() - criada_em > self.reciclar_segundos:
+                    self._fechar_silenciosamente(conexao)
+                    with self._trava:
+                        self._contadores["recicladas"] += 1
+                    continue
+                if not self._conexao_saudavel(conexao, devolvida_em):
+                    self._fechar_silenciosamente(conexao)
+                    with self._trava:
+                        self._contadores["descartadas_ping"] += 1
+                    continue
+
+                with self._trava:
+                    self._contadores["reutilizadas"] += 1
+                break
+        except Exception:
+            self._vagas.release()
+            raise
+
+        with self._trava:
+            self._em_uso += 1
+            self._contadores["pico_em_uso"] = max(self._contadores["pico_em_uso"], self._em_uso)
+        return ConexaoDoPool(self, conexao, criada_em)
+
+    def devolver(self, conexao_pool: ConexaoDoPool):
+        """Recebe de volta uma conexão emprestada. Chamado por ConexaoDoPool.close()."""
+        conexao = conexao_pool.conexao_bruta
+        descartar = conexao_pool._invalida
+        if not descartar:
+            try:
+                if conexao.is_connected():
+                    if conexao.in_transaction:
+                        conexao.rollback()
+                else:
+                    descartar = True
+            except Exception:
+                descartar = True
+
+        with self._trava:
+            self._em_uso -= 1
+            if descartar:
+                self._contadores["descartadas_erro"] += 1
+            else:
+                self._ociosas.append((conexao, conexao_pool.criada_em, time.monotonic()))
+        if descartar:
+            self._fechar_silenciosamente(conexao)
+        self._vagas.release()
+
+    @contextmanager
+    def conexao(self):
+        """Context manager que empresta uma conexão e a devolve ao final do bloco."""
+        conexao = self.obter()
+        try:
+            yield conexao
+        except mysql.connector.errors.OperationalError:
+            # Erro de conexão (queda, timeout...): não vale a pena reaproveitar.
+            conexao.invalidar()
+            raise
+        finally:
+            conexao.close()
+
+    def estatisticas(self) -> dict:
+        """Retorna os contadores de uso do pool."""
+        with self._trava:
+            return {
+                "tamanho": self.tamanho,
+                "em_uso": self._em_uso,
+                "ociosas": len(self._ociosas),
+                **self._contadores,
+            }
+
+    def fechar_todas(self):
+        """Fecha todas as conexões ociosas (as emprestadas são fechadas ao serem devolvidas)."""
+        with self._trava:
+            ociosas, self._ociosas = self._ociosas, []
+        for conexao, _, _ in ociosas:
+            self._fechar_silenciosamente(conexao)
+
+
+_pool_global = None
+_trava_pool_global = threading.Lock()
+
+
+def obter_pool() -> PoolConexoes:
+    """
+    Retorna o pool do processo, criando-o na primeira chamada.
+    Como o Streamlit roda todas as sessões no mesmo processo, elas compartilham este pool.
+    """
+    global _pool_global
+    if _pool_global is None:
+        with _trava_pool_global:
+            if _pool_global is None:
+                _pool_global = PoolConexoes()
+    return _pool_global
+
+
+def definir_pool(pool):
+    """
+    Troca o pool do processo (ex: por um banco substituto nos benchmarks, ver dados_sinteticos.py).
+    O novo pool precisa oferecer obter()/devolver()/conexao(); o anterior tem as conexões ociosas fechadas.
+    """
+    global _pool_global
+    with _trava_pool_global:
+        anterior, _pool_global = _pool_global, pool
+    if anterior is not None and anterior is not pool:
+        anterior.fechar_todas()
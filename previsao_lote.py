@@ -0,0 +1,97 @@
+"""
+Previsão de vendas em lote: vários SKUs ajustados em paralelo com o Prophet.
+
+O ajuste do Prophet é pesado em CPU, então cada SKU roda em um processo separado
+(ProcessPoolExecutor). Este módulo não importa nada pesado no topo para que os
+processos filhos subam rápido (o Prophet só é importado dentro do worker).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+COLUNAS_PREVISAO = ['sku_primario', 'ds', 'yhat', 'yhat_lower', 'yhat_upper']
+
+
+def preparar_historicos(df_vendas_base: pd.DataFrame, skus=None, min_dias_historico: int = 15) -> dict:
+    """
+    Separa o DataFrame de vendas base em uma série temporal (ds, y) por SKU.
+    Só entram SKUs com pelo menos `min_dias_historico` dias com venda.
+    """
+    if df_vendas_base is None or df_vendas_base.empty:
+        return {}
+    df = df_vendas_base
+    if skus is not None:
+        df = df[df['sku_primario'].isin(list(skus))]
+
+    df_diario = (
+        df.groupby(['sku_primario', 'data'], sort=True, observed=True)['demanda_primario'].sum()
+        .reset_index()
+        .rename(columns={'data': 'ds', 'demanda_primario': 'y'})
+    )
+    historicos = {}
+    for sku, df_sku in df_diario.groupby('sku_primario', sort=True, observed=True):
+        if len(df_sku) >= min_dias_historico:
+            historicos[sku] = df_sku[['ds', 'y']].reset_index(drop=True)
+    return historicos
+
+
+def ajustar_previsao_sku(sku: str, df_historico: pd.DataFrame, dias_previsao: int) -> pd.DataFrame:
+    """
+    Ajusta um Prophet para um SKU e devolve só os dias futuros previstos.
+    Roda dentro dos processos filhos, por isso é uma função de módulo (precisa ser "picklável").
+    """
+    import logging
+    from prophet import Prophet
+
+    logging.getLogger("cmdstanpy").setLevel(logging.WARNING)
+
+    m = Prophet(weekly_seasonality=True, daily_seasonality=False)
+    m.fit(df_historico)
+    future = m.make_future_dataframe(periods=dias_previsao)
+    forecast = m.predict(future)
+
+    df_previsao = forecast[['ds', 'yhat', 'yhat_lower', 'yhat_upper']].tail(dias_previsao).copy()
+    df_previsao.insert(0, 'sku_primario', sku)
+    return df_previsao
+
+
+def gerar_previsoes_em_lote(historicos: dict, dias_previsao: int = 30, max_workers: int = None, ao_progredir=None):
+    """
+    Ajusta um modelo por SKU em paralelo (um processo por núcleo, por padrão).
+
+    Recebe:
+      - historicos: {sku: DataFrame(ds, y)}, como devolvido por preparar_historicos.
+      - ao_progredir: função opcional chamada como ao_progredir(concluidos, total, sku) a cada SKU terminado.
+    Retorna (df_previsoes, df_falhas):
+      - df_previsoes: tabela longa com sku_primario, ds, yhat, yhat_lower, yhat_upper.
+      - df_falhas: SKUs que falharam e o erro de cada um (uma falha não interrompe os demais).
+    """
+    total = len(historicos)
+    previsoes, falhas = [], []
+    if total == 0:
+        return pd.DataFrame(columns=COLUNAS_PREVISAO), pd.DataFrame(columns=['sku_primario', 'erro'])
+
+    max_workers = max_workers or os.cpu_count() or 1
+    concluidos = 0
+    with ProcessPoolExecutor(max_workers=min(max_workers, total)) as executor:
+        futuros = {
+            executor.submit(ajustar_previsao_sku, sku, df_historico, dias_previsao): sku
+            for sku, df_historico in historicos.items()
+        }
+        for futuro in as_completed(futuros):
+            sku = futuros[futuro]
+            try:
+                previsoes.append(futuro.result())
+            except Exception as e:
+                print(f"Falha na previsão do SKU {sku}: {e}")
+                falhas.append({'sku_primario': sku, 'erro': str(e)})
+            concluidos += 1
+            if ao_progredir:
+                ao_progredir(concluidos, total, sku)
+
+    df_previsoes = (
+        pd.concat(previsoes, ignore_index=True).sort_values(['sku_primario', 'ds'], kind='stable').reset_index(drop=True)
+        if previsoes else pd.DataFrame(columns=COLUNAS_PREVISAO)
+    )
+    return df_previsoes, pd.DataFrame(falhas, columns=['sku_primario', 'erro'])
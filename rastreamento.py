@@ -0,0 +1,201 @@
+"""
+Rastreamento das etapas do agente (tempo, linhas, bytes, tamanho de prompt/resposta).
+
+Cada etapa medida (roteamento, leitura do esquema, geração de SQL, consulta, resumo,
+ajuste do Prophet, chamadas ao Bling...) vira uma linha JSON em um arquivo de log.
+As etapas de uma mesma resposta do chat compartilham o mesmo id de rastro, e podem
+ser coletadas em memória para a interface mostrar os tempos daquela resposta.
+
+Uso:
+    @rastrear("executar_consulta")          # mede a função inteira
+    def executar_consulta(...): ...
+
+    with medir_etapa("bling_pedido", fornecedor=nome) as etapa:
+        ...
+        etapa.registrar(codigo_http=201)
+
+    registrar_na_etapa(tamanho_prompt=len(prompt))   # anota dados na etapa aberta mais interna
+
+Para ver os percentis de tempo por etapa:
+    python rastreamento.py [--ultimas 5000]
+"""
+import argparse
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from cache_local import caminho_cache
+
+RASTREAMENTO_ATIVO = os.getenv("RASTREAMENTO_ATIVO", "1") == "1"
+RASTREAMENTO_ARQUIVO = os.getenv("RASTREAMENTO_ARQUIVO", caminho_cache("rastreamento.jsonl"))
+RASTREAMENTO_MAX_MB = float(os.getenv("RASTREAMENTO_MAX_MB", "50"))
+
+# Etapas abertas no contexto atual (a última é a mais interna) e o rastro da resposta em andamento.
+# Threads novas não herdam contextvars: use contextvars.copy_context().run ao disparar trabalho em outra thread.
+_etapas_abertas = contextvars.ContextVar("etapas_abertas", default=())
+_rastro_atual = contextvars.ContextVar("rastro_atual", default=None)
+_trava_arquivo = threading.Lock()
+
+
+class Etapa:
+    def __init__(self, nome: str, atributos: dict):
+        self.nome = nome
+        self.dados = dict(atributos)
+
+    def registrar(self, **dados):
+        """Anota dados na etapa (linhas, bytes, tamanho_prompt, tamanho_resposta...)."""
+        self.dados.update(dados)
+
+
+def _gravar(registro: dict):
+    if not RASTREAMENTO_ATIVO:
+        return
+    linha = json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+    with _trava_arquivo:
+        try:
+            os.makedirs(os.path.dirname(RASTREAMENTO_ARQUIVO), exist_ok=True)
+            if os.path.exists(RASTREAMENTO_ARQUIVO) and os.path.getsize(RASTREAMENTO_ARQUIVO) > RASTREAMENTO_MAX_MB * 1024 * 1024:
+                os.replace(RASTREAMENTO_ARQUIVO, f"{RASTREAMENTO_ARQUIVO}.1")  # guarda só um arquivo antigo
+            with open(RASTREAMENTO_ARQUIVO, "a", encoding="utf-8") as f:
+                f.write(linha)
+        except OSError as e:
+            print(f"Aviso: não foi possível gravar o rastreamento: {e}")
+
+
+@contextmanager
+def medir_etapa(nome: str, **atributos):
+    """Mede o bloco como uma etapa; erros são registrados e relançados."""
+    etapa = Etapa(nome, atributos)
+    abertas = _etapas_abertas.get()
+    token = _etapas_abertas.set(abertas + (etapa,))
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield etapa
+    except BaseException as e:
+        erro = e
+        raise
+    finally:
+        _etapas_abertas.reset(token)
+        rastro = _rastro_atual.get()
+        registro = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "rastro": rastro["id"] if rastro else None,
+            "etapa": nome,
+            "nivel": len(abertas),
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+            "ok": erro is None,
+            **etapa.dados,
+        }
+        if erro is not None:
+            registro["erro"] = f"{type(erro).__name__}: {erro}"
+        if rastro is not None:
+            rastro["registros"].append(registro)
+        _gravar(registro)
+
+
+def registrar_na_etapa(**dados):
+    """Anota dados na etapa aberta mais interna (não faz nada se nenhuma estiver aberta)."""
+    abertas = _etapas_abertas.get()
+    if abertas:
+        abertas[-1].registrar(**dados)
+
+
+def _volume(resultado) -> dict:
+    if isinstance(resultado, pd.DataFrame):
+        return {"linhas": len(resultado), "bytes": int(resultado.memory_usage(index=True).sum())}
+    if isinstance(resultado, str):
+        return {"tamanho_resposta": len(resultado)}
+    return {}
+
+
+def rastrear(nome: str = None):
+    """Decorador: mede a função como uma etapa e registra linhas/bytes (DataFrame) ou tamanho (texto) do retorno."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            with medir_etapa(nome or funcao.__name__) as etapa:
+                resultado = funcao(*args, **kwargs)
+                etapa.dados = {**_volume(resultado), **etapa.dados}  # o que a função anotou tem prioridade
+                return resultado
+        return envoltorio
+    return decorador
+
+
+@contextmanager
+def rastro_da_resposta():
+    """Agrupa as etapas de uma resposta sob um mesmo id e devolve a lista de registros coletados."""
+    rastro = {"id": uuid.uuid4().hex[:12], "registros": []}
+    token = _rastro_atual.set(rastro)
+    try:
+        yield rastro["registros"]
+    finally:
+        _rastro_atual.reset(token)
+
+
+def ler_rastreamento(caminho: str = None, ultimas: int = None) -> pd.DataFrame:
+    """Lê o log de rastreamento (opcionalmente só as últimas N linhas)."""
+    caminho = caminho or RASTREAMENTO_ARQUIVO
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            linhas = f.readlines()
+    except FileNotFoundError:
+        return pd.DataFrame()
+    if ultimas:
+        linhas = linhas[-ultimas:]
+    registros = []
+    for linha in linhas:
+        try:
+            registros.append(json.loads(linha))
+        except json.JSONDecodeError:
+            continue  # linha cortada (ex: processo encerrado no meio da gravação)
+    return pd.DataFrame(registros)
+
+
+def agregar_rastreamento(df: pd.DataFrame) -> pd.DataFrame:
+    """Percentis de duração e volumes médios por etapa."""
+    if df.empty:
+        return pd.DataFrame()
+    for coluna in ["linhas", "bytes", "tamanho_prompt", "tamanho_resposta"]:
+        if coluna not in df.columns:
+            df[coluna] = float("nan")
+    agrupado = df.groupby("etapa")
+    resumo = pd.DataFrame({
+        "chamadas": agrupado.size(),
+        "erros": agrupado["ok"].apply(lambda ok: int((~ok.astype(bool)).sum())),
+        "p50_ms": agrupado["duracao_ms"].quantile(0.50),
+        "p90_ms": agrupado["duracao_ms"].quantile(0.90),
+        "p99_ms": agrupado["duracao_ms"].quantile(0.99),
+        "max_ms": agrupado["duracao_ms"].max(),
+        "linhas_media": agrupado["linhas"].mean(),
+        "bytes_media": agrupado["bytes"].mean(),
+        "prompt_medio": agrupado["tamanho_prompt"].mean(),
+        "resposta_media": agrupado["tamanho_resposta"].mean(),
+    })
+    return resumo.sort_values("p90_ms", ascending=False).round(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Percentis de tempo por etapa do agente.")
+    parser.add_argument("--arquivo", default=RASTREAMENTO_ARQUIVO)
+    parser.add_argument("--ultimas", type=int, default=None, help="considera só as últimas N etapas registradas")
+    args = parser.parse_args()
+
+    resumo = agregar_rastreamento(ler_rastreamento(args.arquivo, args.ultimas))
+    if resumo.empty:
+        print(f"Nenhum registro em {args.arquivo}.")
+        return
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(resumo.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""
+Réplica analítica local (DuckDB) de vendas_detalhes, produtos_2 e pedido_compras.
+
+As análises (Curva ABC, demanda, previsões) fazem GROUP BYs pesados; com a réplica
+ligada, elas leem um arquivo DuckDB local em vez do MySQL que também atende a
+sincronização do ERP. O SQL gerado pelo Gemini continua no MySQL: ele pode usar funções
+que existem nos dois bancos com resultados diferentes (DAYOFWEEK, WEEK, DATE_FORMAT...).
+
+Sincronização (incremental):
+- vendas_detalhes: pela "marca d'água" da coluna `data`. Cada rodada apaga e busca de
+  novo os últimos REPLICA_DIAS_REPROCESSAR dias (vendas recentes ainda mudam de situação)
+  e tudo o que veio depois.
+- produtos_2 e pedido_compras: pela chave primária. O MySQL calcula um hash de cada linha;
+  só as linhas novas ou alteradas são trazidas, e as que sumiram são apagadas.
+Cada tabela é sincronizada em uma transação: as leituras nunca veem a réplica pela metade.
+
+Roteamento: consultar_na_replica(query, parametros=...) devolve o DataFrame lido da réplica, ou None
+quando a consulta deve ir ao MySQL (réplica desligada ou atrasada, consulta que não é
+de leitura, tabela fora da réplica, comparação de texto com LIKE/REGEXP, ou SQL que o
+DuckDB não entende).
+Como no MySQL (collation *_ci), o texto é comparado sem diferenciar maiúsculas e acentos
+(=, IN, GROUP BY); o LIKE do DuckDB não segue essa regra, por isso fica no MySQL.
+Os tipos do resultado são os mesmos do pd.read_sql sobre o MySQL (datas como datetime.date,
+decimais como float), então caches alimentados pelas duas fontes continuam compatíveis.
+
+O DuckDB é opcional (pip install duckdb) e só é importado quando a réplica é usada.
+Só um processo pode abrir o arquivo para escrita: com o app rodando, a sincronização
+periódica roda dentro dele; `python replica_analitica.py` serve para sincronizar com o app parado.
+"""
+import argparse
+import os
+import re
+import threading
+import time
+from datetime import date, timedelta
+
+import pandas as pd
+
+from cache_local import caminho_cache
+from guarda_custo_sql import motivo_nao_leitura
+from pool_conexoes import obter_pool
+from sql_parametrizado import montar_consulta
+
+REPLICA_ATIVA = os.getenv("REPLICA_ATIVA", "0") == "1"
+REPLICA_ARQUIVO = os.getenv("REPLICA_ARQUIVO", caminho_cache("replica.duckdb"))
+REPLICA_MAX_ATRASO_MINUTOS = float(os.getenv("REPLICA_MAX_ATRASO_MINUTOS", "30"))
+REPLICA_SINCRONIZAR_MINUTOS = float(os.getenv("REPLICA_SINCRONIZAR_MINUTOS", "10"))
+REPLICA_DIAS_REPROCESSAR = int(os.getenv("REPLICA_DIAS_REPROCESSAR", "3"))
+REPLICA_LOTE_LINHAS = int(os.getenv("REPLICA_LOTE_LINHAS", "50000"))
+
+# Como cada tabela é sincronizada: por marca d'água (coluna de data) ou por chave primária
+TABELAS_REPLICADAS = {
+    "vendas_detalhes": {"marca_dagua": "data"},
+    "produtos_2": {"chave": "id"},
+    "pedido_compras": {"chave": "id"},  # assumindo que a chave primária de pedido_compras se chama 'id'
+}
+
+# Tipos do MySQL (information_schema.COLUMNS.DATA_TYPE) -> tipos do DuckDB; o resto vira VARCHAR
+TIPOS_DUCKDB = {
+    "tinyint": "BIGINT", "smallint": "BIGINT", "mediumint": "BIGINT", "int": "BIGINT", "bigint": "BIGINT",
+    "year": "BIGINT", "decimal": "DOUBLE", "float": "DOUBLE", "double": "DOUBLE",
+    "date": "DATE", "datetime": "TIMESTAMP", "timestamp": "TIMESTAMP",
+}
+
+# Comparações de texto que o DuckDB faz diferenciando maiúsculas mesmo com a collation padrão
+PADRAO_TEXTO_DIVERGENTE = re.compile(r"\b(?:NOT\s+)?(?:LIKE|REGEXP|RLIKE)\b", re.IGNORECASE)
+PADRAO_TABELAS = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?(?:\s*\.\s*`?(\w+)`?)?", re.IGNORECASE)
+TAMANHO_LOTE_CHAVES = 1000
+
+
+def tabelas_da_consulta(query: str) -> set:
+    """Tabelas citadas depois de FROM/JOIN (com esquema, 'esquema.tabela')."""
+    return {f"{a}.{b}" if b else a for a, b in PADRAO_TABELAS.findall(query)}
+
+
+class ReplicaAnalitica:
+    def __init__(self, arquivo: str = REPLICA_ARQUIVO, max_atraso_minutos: float = REPLICA_MAX_ATRASO_MINUTOS,
+                 dias_reprocessar: int = REPLICA_DIAS_REPROCESSAR, lote_linhas: int = REPLICA_LOTE_LINHAS, pool=None):
+        self.arquivo = arquivo
+        self.max_atraso_minutos = max_atraso_minutos
+        self.dias_reprocessar = dias_reprocessar
+        self.lote_linhas = lote_linhas
+        self._pool = pool  # None: usa o pool do processo no momento da sincronização
+
+        self._conexao = None
+        self._trava = threading.Lock()  # abertura da conexão
+        self._trava_sincronizacao = threading.Lock()  # uma sincronização por vez
+        self._thread_periodica = None
+        self.ultimo_erro = None
+        self.contadores = {"consultas_replica": 0, "consultas_mysql": 0, "erros_replica": 0, "sincronizacoes": 0}
+
+    # --- conexão ---
+    def _duckdb(self):
+        """Conexão DuckDB do processo (aberta na primeira chamada). Cada thread deve usar .cursor() dela."""
+        if self._conexao is None:
+            with self._trava:
+                if self._conexao is None:
+                    import duckdb
+
+                    os.makedirs(os.path.dirname(os.path.abspath(self.arquivo)), exist_ok=True)
+                    conexao = duckdb.connect(self.arquivo)
+                    conexao.execute("""
+                        CREATE TABLE IF NOT EXISTS _replica_estado (
+                            tabela VARCHAR PRIMARY KEY, marca_dagua VARCHAR, linhas BIGINT, sincronizado_em DOUBLE
+                        )
+                    """)
+                    conexao.execute("CREATE TABLE IF NOT EXISTS _replica_hashes (tabela VARCHAR, chave VARCHAR, hash VARCHAR)")
+                    # = e IN sem diferenciar maiúsculas e acentos, como a collation *_ci do MySQL
+                    conexao.execute("SET default_collation = 'nocase.noaccent'")
+                    # Funções do MySQL que o DuckDB não tem com o mesmo nome. DATE_FORMAT e CRC32 ficam de fora
+                    # de propósito e a consulta cai para o MySQL: os códigos de formato são outros (%i, %M, %W),
+                    # e o texto dos números no CONCAT_WS não é o do MySQL, então a soma de CRC32 nunca bateria
+                    conexao.execute("DROP MACRO IF EXISTS date_format")  # criadas por versões anteriores
+                    conexao.execute("DROP MACRO IF EXISTS crc32")
+                    conexao.execute("CREATE OR REPLACE MACRO curdate() AS current_date")
+                    self._conexao = conexao
+        return self._conexao
+
+    # --- atraso ---
+    def estado(self) -> dict:
+        """{tabela: {'marca_dagua', 'linhas', 'sincronizado_em'}} das tabelas já sincronizadas."""
+        cursor = self._duckdb().cursor()
+        try:
+            linhas = cursor.execute("SELECT tabela, marca_dagua, linhas, sincronizado_em FROM _replica_estado").fetchall()
+        finally:
+            cursor.close()
+        return {tabela: {"marca_dagua": marca, "linhas": n, "sincronizado_em": em} for tabela, marca, n, em in linhas}
+
+    def atraso_segundos(self, estado: dict = None):
+        """Tempo desde a sincronização mais antiga entre as tabelas (None se alguma nunca foi sincronizada)."""
+        estado = self.estado() if estado is None else estado
+        if any(tabela not in estado for tabela in TABELAS_REPLICADAS):
+            return None
+        return time.time() - min(estado[tabela]["sincronizado_em"] for tabela in TABELAS_REPLICADAS)
+
+    def atualizada(self) -> bool:
+        atraso = self.atraso_segundos()
+        return atraso is not None and atraso <= self.max_atraso_minutos * 60
+
+    def situacao(self) -> dict:
+        """Resumo para a interface: se está em dia, o atraso em minutos e até que dia há vendas."""
+        try:
+            estado = self.estado()
+        except Exception as e:
+            return {"atualizada": False, "atraso_minutos": None, "vendas_ate": None, "erro": str(e)}
+        atraso = self.atraso_segundos(estado)
+        return {
+            "atualizada": atraso is not None and atraso <= self.max_atraso_minutos * 60,
+            "atraso_minutos": None if atraso is None else round(atraso / 60, 1),
+            "vendas_ate": estado.get("vendas_detalhes", {}).get("marca_dagua"),
+            "erro": self.ultimo_erro,
+        }
+
+    # --- leitura ---
+    def pode_atender(self, query: str) -> bool:
+        """Consulta de leitura (ver guarda_custo_sql), só sobre tabelas replicadas, sem LIKE/REGEXP, e réplica em dia."""
+        if motivo_nao_leitura(query) is not None or PADRAO_TEXTO_DIVERGENTE.search(query):
+            return False
+        tabelas = tabelas_da_consulta(query)
+        if not tabelas or not tabelas <= set(TABELAS_REPLICADAS):
+            return False
+        return self.atualizada()
+
+    def consultar(self, query: str, max_linhas: int = None, parametros: dict = None):
+        """
+        Executa a consulta na réplica, com os :parametros ligados (ver sql_parametrizado).
+        Com `max_linhas`, lê no máximo esse número de linhas e devolve (df, truncada);
+        sem ele, devolve só o DataFrame.
+        """
+        # O DuckDB lida bem com IN longos: nenhuma lista vai para tabela temporária
+        sql, valores, _ = montar_consulta(query.strip().rstrip(";"), parametros, "duckdb")
+        cursor = self._duckdb().cursor()
+        try:
+            cursor.execute(sql, list(valores))
+            colunas = [descricao[0] for descricao in cursor.description]
+            if max_linhas is None:
+                return pd.DataFrame.from_records(cursor.fetchall(), columns=colunas, coerce_float=True)
+            linhas = cursor.fetchmany(max_linhas + 1)
+            truncada = len(linhas) > max_linhas
+            return pd.DataFrame.from_records(linhas[:max_linhas], columns=colunas, coerce_float=True), truncada
+        finally:
+            cursor.close()
+
+    # --- sincronização ---
+    def _colunas_mysql(self, conexao, tabela: str) -> list:
+        """[(coluna, tipo DuckDB)] na ordem da tabela no MySQL."""
+        cursor = conexao.cursor()
+        try:
+            cursor.execute(
+                "SELECT COLUMN_NAME, DATA_TYPE FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION",
+                (tabela,),
+            )
+            return [(coluna, TIPOS_DUCKDB.get(str(tipo).lower(), "VARCHAR")) for coluna, tipo in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def _criar_tabela(self, duck, tabela: str, colunas: list):
+        definicao = ", ".join(f'"{coluna}" {tipo}' for coluna, tipo in colunas)
+        duck.execute(f'CREATE TABLE IF NOT EXISTS "{tabela}" ({definicao})')
+
+    @staticmethod
+    def _inserir(duck, tabela: str, lote: pd.DataFrame, colunas: list):
+        # Colunas de texto no MySQL podem vir com tipos variados (ex: TIME vira timedelta); o DuckDB recebe texto
+        for coluna, tipo in colunas:
+            if tipo == "VARCHAR" and lote[coluna].dtype == object:
+                lote[coluna] = lote[coluna].map(lambda v: v if v is None or isinstance(v, str) else str(v))
+        duck.register("_lote_replica", lote)
+        try:
+            duck.execute(f'INSERT INTO "{tabela}" BY NAME SELECT * FROM _lote_replica')
+        finally:
+            duck.unregister("_lote_replica")
+
+    @staticmethod
+    def _gravar_estado(duck, tabela: str, marca_dagua=None):
+        linhas = duck.execute(f'SELECT COUNT(*) FROM "{tabela}"').fetchone()[0]
+        duck.execute("DELETE FROM _replica_estado WHERE tabela = ?", [tabela])
+        duck.execute("INSERT INTO _replica_estado VALUES (?, ?, ?, ?)",
+                     [tabela, None if marca_dagua is None else str(marca_dagua), linhas, time.time()])
+
+    def _sincronizar_por_marca_dagua(self, conexao, duck, tabela: str, coluna: str) -> int:
+        colunas = self._colunas_mysql(conexao, tabela)
+        marca = duck.execute("SELECT marca_dagua FROM _replica_estado WHERE tabela = ?", [tabela]).fetchone()
+        inicio = date.fromisoformat(marca[0][:10]) - timedelta(days=self.dias_reprocessar) if marca and marca[0] else None
+
+        query = f"SELECT * FROM `{tabela}`" + (f" WHERE `{coluna}` >= %s" if inicio else "")
+        duck.execute("BEGIN TRANSACTION")
+        try:
+            self._criar_tabela(duck, tabela, colunas)
+            if inicio:
+                duck.execute(f'DELETE FROM "{tabela}" WHERE "{coluna}" >= ?', [inicio])
+            trazidas = 0
+            for lote in pd.read_sql(query, conexao, params=(inicio,) if inicio else None, chunksize=self.lote_linhas):
+                self._inserir(duck, tabela, lote, colunas)
+                trazidas += len(lote)
+            nova_marca = duck.execute(f'SELECT MAX("{coluna}") FROM "{tabela}"').fetchone()[0]
+            self._gravar_estado(duck, tabela, nova_marca)
+            duck.execute("COMMIT")
+        except BaseException:
+            duck.execute("ROLLBACK")
+            raise
+        return trazidas
+
+    def _sincronizar_por_chave(self, conexao, duck, tabela: str, chave: str) -> int:
+        colunas = self._colunas_mysql(conexao, tabela)
+        lista_colunas = ", ".join(f"`{coluna}`" for coluna, _ in colunas)
+        hashes_mysql = pd.read_sql(
+            f"SELECT CAST(`{chave}` AS CHAR) AS chave, MD5(CONCAT_WS('|', {lista_colunas})) AS hash FROM `{tabela}`", conexao
+        )
+        hashes_replica = duck.execute("SELECT chave, hash FROM _replica_hashes WHERE tabela = ?", [tabela]).df()
+
+        comparacao = hashes_mysql.merge(hashes_replica, on="chave", how="outer", suffixes=("", "_replica"), indicator=True)
+        origem = comparacao["_merge"]
+        mudou = (origem == "both") & (comparacao["hash"] != comparacao["hash_replica"])
+        alteradas = comparacao.loc[(origem == "left_only") | mudou, "chave"]  # buscar no MySQL
+        apagar = comparacao.loc[(origem == "right_only") | mudou, "chave"]  # tirar da réplica
+
+        duck.execute("BEGIN TRANSACTION")
+        try:
+            self._criar_tabela(duck, tabela, colunas)
+            if len(apagar):
+                duck.register("_chaves_apagar", pd.DataFrame({"chave": apagar.to_numpy(dtype=object)}))
+                duck.execute(f'DELETE FROM "{tabela}" WHERE CAST("{chave}" AS VARCHAR) IN (SELECT chave FROM _chaves_apagar)')
+                duck.unregister("_chaves_apagar")
+            chaves = alteradas.tolist()
+            for i in range(0, len(chaves), TAMANHO_LOTE_CHAVES):
+                parte = chaves[i:i + TAMANHO_LOTE_CHAVES]
+                marcadores = ", ".join(["%s"] * len(parte))
+                lote = pd.read_sql(f"SELECT * FROM `{tabela}` WHERE `{chave}` IN ({marcadores})", conexao, params=tuple(parte))
+                self._inserir(duck, tabela, lote, colunas)
+            duck.execute("DELETE FROM _replica_hashes WHERE tabela = ?", [tabela])
+            duck.register("_hashes_novos", hashes_mysql.assign(tabela=tabela)[["tabela", "chave", "hash"]])
+            duck.execute("INSERT INTO _replica_hashes SELECT * FROM _hashes_novos")
+            duck.unregister("_hashes_novos")
+            self._gravar_estado(duck, tabela)
+            duck.execute("COMMIT")
+        except BaseException:
+            duck.execute("ROLLBACK")
+            raise
+        return len(chaves)
+
+    def sincronizar(self) -> dict:
+        """Traz do MySQL o que mudou em cada tabela; devolve {tabela: linhas trazidas}."""
+        with self._trava_sincronizacao:
+            duck = self._duckdb().cursor()
+            trazidas = {}
+            try:
+                with (self._pool or obter_pool()).conexao() as conexao:
+                    for tabela, config in TABELAS_REPLICADAS.items():
+                        inicio = time.perf_counter()
+                        if "marca_dagua" in config:
+                            trazidas[tabela] = self._sincronizar_por_marca_dagua(conexao, duck, tabela, config["marca_dagua"])
+                        else:
+                            trazidas[tabela] = self._sincronizar_por_chave(conexao, duck, tabela, config["chave"])
+                        print(f"Réplica: {tabela} sincronizada ({trazidas[tabela]} linhas trazidas em {time.perf_counter() - inicio:.1f}s).")
+                self.ultimo_erro = None
+                self.contadores["sincronizacoes"] += 1
+            except Exception as e:
+                self.ultimo_erro = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                duck.close()
+            return trazidas
+
+    def iniciar_sincronizacao_periodica(self, intervalo_minutos: float = REPLICA_SINCRONIZAR_MINUTOS):
+        """Sincroniza agora e depois a cada `intervalo_minutos`, em uma thread de fundo (só uma por processo)."""
+        with self._trava:
+            if self._thread_periodica is not None:
+                return
+
+            def laco():
+                while True:
+                    try:
+                        self.sincronizar()
+                    except Exception as e:
+                        print(f"Erro ao sincronizar a réplica analítica: {e}")
+                    time.sleep(intervalo_minutos * 60)
+
+            self._thread_periodica = threading.Thread(target=laco, name="sincronizacao_replica", daemon=True)
+            self._thread_periodica.start()
+
+
+_replica_global = None
+_trava_replica_global = threading.Lock()
+
+
+def obter_replica() -> ReplicaAnalitica:
+    """Réplica analítica do processo (o arquivo só é aberto no primeiro uso)."""
+    global _replica_global
+    if _replica_global is None:
+        with _trava_replica_global:
+            if _replica_global is None:
+                _replica_global = ReplicaAnalitica()
+    return _replica_global
+
+
+def consultar_na_replica(query: str, max_linhas: int = None, parametros: dict = None):
+    """
+    Executa a consulta na réplica se ela estiver ligada, em dia e souber responder.
+    Devolve None quando a consulta deve ir ao MySQL. Com `max_linhas`, devolve (df, truncada).
+    """
+    if not REPLICA_ATIVA:
+        return None
+    replica = obter_replica()
+    try:
+        if not replica.pode_atender(query):
+            replica.contadores["consultas_mysql"] += 1
+            return None
+        resultado = replica.consultar(query, max_linhas=max_linhas, parametros=parametros)
+    except Exception as e:
+        # SQL que só o MySQL entende, duckdb não instalado, arquivo travado por outro processo...
+        print(f"Réplica analítica não atendeu a consulta ({type(e).__name__}: {e}); usando o MySQL.")
+        replica.contadores["erros_replica"] += 1
+        return None
+    replica.contadores["consultas_replica"] += 1
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza a réplica analítica local com o MySQL (com o app parado).")
+    parser.add_argument("--arquivo", default=REPLICA_ARQUIVO)
+    args = parser.parse_args()
+
+    replica = ReplicaAnalitica(arquivo=args.arquivo)
+    replica.sincronizar()
+    situacao = replica.situacao()
+    print(f"Réplica em {args.arquivo}: vendas até {situacao['vendas_ate']}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Resumo compacto de um DataFrame para mandar ao Gemini.
+
+Mandar a tabela inteira em markdown faz o prompt (e o custo/tempo da resposta)
+crescer com o número de linhas. Aqui a tabela vira um "digest" com tamanho limitado:
+esquema, quantidade de linhas, estatísticas por coluna, as maiores e menores linhas
+pela coluna de valor e os totais por grupo. Se ainda assim passar do orçamento, as
+seções vão sendo encolhidas até caber.
+
+Os tokens são estimados pelo número de caracteres (~4 caracteres por token), o que
+basta para manter o prompt dentro de um teto sem chamar a API só para contar tokens.
+"""
+import math
+import os
+
+import pandas as pd
+
+RESUMO_ORCAMENTO_TOKENS = int(os.getenv("RESUMO_ORCAMENTO_TOKENS", "3000"))
+CARACTERES_POR_TOKEN = 4
+MAX_GRUPOS_POR_COLUNA = 10
+MAX_CARDINALIDADE_GRUPO = 50
+
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def _coluna_de_valor(df: pd.DataFrame):
+    """Última coluna numérica (mesma convenção das consultas geradas: a última coluna é a de valor)."""
+    numericas = [coluna for coluna in df.columns if pd.api.types.is_numeric_dtype(df[coluna]) and not pd.api.types.is_bool_dtype(df[coluna])]
+    return numericas[-1] if numericas else None
+
+
+def _estatisticas_colunas(df: pd.DataFrame) -> str:
+    linhas = []
+    for coluna in df.columns:
+        serie = df[coluna]
+        nulos = int(serie.isna().sum())
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            linhas.append(
+                f"- {coluna} ({serie.dtype}): soma={serie.sum():,.2f}, média={serie.mean():,.2f}, "
+                f"mín={serie.min():,.2f}, máx={serie.max():,.2f}, nulos={nulos}"
+            )
+        elif pd.api.types.is_datetime64_any_dtype(serie):
+            linhas.append(f"- {coluna} ({serie.dtype}): de {serie.min()} até {serie.max()}, nulos={nulos}")
+        else:
+            frequentes = serie.astype(str).value_counts().head(3)
+            mais_comuns = ", ".join(f"{valor} ({qtd})" for valor, qtd in frequentes.items())
+            linhas.append(f"- {coluna} ({serie.dtype}): {serie.nunique()} valores distintos, nulos={nulos}; mais comuns: {mais_comuns}")
+    return "\n".join(linhas)
+
+
+def _totais_por_grupo(df: pd.DataFrame, coluna_valor: str, max_grupos: int) -> str:
+    """Soma da coluna de valor para cada coluna de texto com poucas categorias."""
+    secoes = []
+    for coluna in df.columns:
+        if coluna == coluna_valor or pd.api.types.is_numeric_dtype(df[coluna]):
+            continue
+        if not 1 < df[coluna].nunique() <= MAX_CARDINALIDADE_GRUPO:
+            continue
+        totais = df.groupby(coluna, dropna=False)[coluna_valor].sum().sort_values(ascending=False)
+        linhas = [f"  - {grupo}: {total:,.2f}" for grupo, total in totais.head(max_grupos).items()]
+        if len(totais) > max_grupos:
+            linhas.append(f"  - (outros {len(totais) - max_grupos} grupos: {totais.iloc[max_grupos:].sum():,.2f})")
+        secoes.append(f"Total de '{coluna_valor}' por '{coluna}':\n" + "\n".join(linhas))
+    return "\n".join(secoes)
+
+
+def _montar(df: pd.DataFrame, coluna_valor, k: int, max_grupos: int) -> str:
+    partes = [
+        f"Linhas: {len(df)} | Colunas: {len(df.columns)}",
+        "Estatísticas por coluna:\n" + _estatisticas_colunas(df),
+    ]
+    if k:
+        if coluna_valor is not None:
+            ordenado = df.sort_values(coluna_valor, ascending=False, kind="stable")
+            partes.append(f"{k} maiores linhas por '{coluna_valor}':\n" + ordenado.head(k).to_markdown(index=False))
+            partes.append(f"{k} menores linhas por '{coluna_valor}':\n" + ordenado.tail(k).iloc[::-1].to_markdown(index=False))
+        else:
+            partes.append(f"Primeiras {k} linhas:\n" + df.head(k).to_markdown(index=False))
+    if max_grupos and coluna_valor is not None:
+        grupos = _totais_por_grupo(df, coluna_valor, max_grupos)
+        if grupos:
+            partes.append(grupos)
+    return "\n\n".join(partes)
+
+
+def montar_resumo_resultado(df: pd.DataFrame, orcamento_tokens: int = RESUMO_ORCAMENTO_TOKENS) -> str:
+    """
+    Devolve um texto que descreve o DataFrame cabendo em `orcamento_tokens`.
+    Vai reduzindo as linhas de exemplo e os grupos até caber; em último caso corta o texto.
+    """
+    coluna_valor = _coluna_de_valor(df)
+    for k, max_grupos in [(10, MAX_GRUPOS_POR_COLUNA), (5, 5), (3, 3), (1, 0), (0, 0)]:
+        resumo = _montar(df, coluna_valor, k, max_grupos)
+        if estimar_tokens(resumo) <= orcamento_tokens:
+            return resumo
+    return resumo[:orcamento_tokens * CARACTERES_POR_TOKEN]
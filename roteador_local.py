@@ -0,0 +1,149 @@
+"""
+Roteador de intenções local (regras + expressões regulares).
+
+Resolve as perguntas "óbvias" do chat em microssegundos, sem chamar o Gemini:
+  - 'qual a curva abc dos últimos 30 dias?'      -> analise_abc_simples
+  - 'compare a evolução da curva A'              -> analise_abc_comparativa
+  - 'previsão de vendas do sku sec_varal_preto'  -> previsao_vendas
+  - 'qual o faturamento de ontem?'               -> pergunta_aberta_sql
+Cada classificação vem com uma confiança (0 a 1); abaixo do limite configurado,
+quem chama deve consultar o Gemini.
+"""
+import re
+import threading
+
+from util_texto import remover_acentos
+
+PADRAO_ABC = re.compile(r"\b(curva\s*abc|abc)\b|\bcurva\s+[abc]\b")
+# Verbos só em formas inteiras: 'cai\w*' pegaria "caixas"
+PADRAO_COMPARATIVO = re.compile(
+    r"\b(compar\w*|evolu\w*|mudan\w*|mudou|mudaram|variac\w*|subiu|subiram|subindo|caiu|cairam|caindo|anterior|versus|vs)\b"
+)
+PADRAO_CURVA = re.compile(r"\bcurva\s+([abc])\b")
+PADRAO_PREVISAO = re.compile(r"\b(previs\w*|prever|preve|projec\w*|forecast)\b")
+PADRAO_DADOS = re.compile(
+    r"\b(faturamento|fatur\w*|vend\w*|pedidos?|itens|ticket|receita|total|quant\w*|produtos?|clientes?|lojas?|canal|canais)\b"
+)
+# Datas, anos, meses e intervalos explícitos ("em 2024", "de 01/01 a 31/03", "desde março")
+PADRAO_DATA_EXPLICITA = re.compile(
+    r"\b\d{1,2}/\d{1,2}(/\d{2,4})?\b|\b\d{4}-\d{2}(-\d{2})?\b|\b(19|20)\d{2}\b|\bdesde\b"
+    r"|\b(janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro)\b"
+)
+PADRAO_ULTIMOS_N = re.compile(r"\bultim[oa]s?\s+(\d+)\s+(dias?|semanas?|mes(?:es)?|anos?)\b")
+PADRAO_SKU_EXPLICITO = re.compile(r"\b(?:sku|produto|item|codigo)\s*[:#]?\s*([\w\-./]+)")
+# Tokens com cara de código: têm letra e também dígito ou '_' (ex: 'sec_varal_preto', 'cx123')
+PADRAO_TOKEN_SKU = re.compile(r"(?<![\w\-./])(?=[\w\-./]*[a-z])(?=[\w\-./]*[_\d])[\w\-./]+")
+
+DIAS_POR_UNIDADE = {"dia": 1, "semana": 7, "mes": 30, "ano": 365}
+PERIODOS_NOMEADOS = [
+    (re.compile(r"\b(ultim[oa] semana|semana passada)\b"), 7),
+    (re.compile(r"\b(ultimo mes|mes passado)\b"), 30),
+    (re.compile(r"\b(ultimo )?trimestre\b"), 90),
+    (re.compile(r"\b(ultimo )?semestre\b"), 180),
+    (re.compile(r"\b(ultimo ano|ano passado)\b"), 365),
+]
+
+# Palavras que aparecem depois de "produto"/"sku" mas não são códigos
+PALAVRAS_IGNORADAS = {"o", "a", "do", "da", "de", "para", "pro", "sku", "produto", "item", "codigo"}
+
+
+def _extrair_periodo_dias(texto: str):
+    encontrado = PADRAO_ULTIMOS_N.search(texto)
+    if encontrado:
+        quantidade, unidade = int(encontrado.group(1)), encontrado.group(2)
+        for prefixo, dias in DIAS_POR_UNIDADE.items():
+            if unidade.startswith(prefixo):
+                return quantidade * dias
+    for padrao, dias in PERIODOS_NOMEADOS:
+        if padrao.search(texto):
+            return dias
+    return None
+
+
+def _extrair_sku(pergunta_original: str, texto: str, skus_conhecidos: dict):
+    """
+    Procura um SKU na pergunta. Retorna (sku, confirmado_no_catalogo).
+    `skus_conhecidos` mapeia o SKU em minúsculas para a grafia original do catálogo.
+    """
+    candidatos = [m.group(1) for m in PADRAO_SKU_EXPLICITO.finditer(texto)]
+    candidatos += PADRAO_TOKEN_SKU.findall(texto)
+    candidatos = [c.strip(".,;:!?/") for c in candidatos if c.strip(".,;:!?/") not in PALAVRAS_IGNORADAS]
+
+    if skus_conhecidos:
+        for candidato in candidatos:
+            if candidato in skus_conhecidos:
+                return skus_conhecidos[candidato], True
+        return None, False
+
+    # Sem catálogo: devolve o candidato como o usuário escreveu (sem acento/minúsculas)
+    for candidato in candidatos:
+        posicao = remover_acentos(pergunta_original).lower().find(candidato)
+        if posicao >= 0:
+            return remover_acentos(pergunta_original)[posicao:posicao + len(candidato)], False
+    return None, False
+
+
+def classificar_localmente(pergunta_usuario: str, skus_conhecidos: dict = None):
+    """
+    Classifica a pergunta usando apenas regras locais.
+    Retorna (analise, confianca), onde `analise` tem o mesmo formato da resposta do
+    roteador do Gemini: {'intencao': ..., 'periodo_dias': ..., 'curva': ..., 'sku_primario': ...}.
+    """
+    texto = remover_acentos(pergunta_usuario).lower()
+    analise = {}
+
+    periodo = _extrair_periodo_dias(texto)
+    if periodo:
+        analise["periodo_dias"] = periodo
+    curva = PADRAO_CURVA.search(texto)
+    if curva:
+        analise["curva"] = curva.group(1).upper()
+
+    if PADRAO_ABC.search(texto):
+        # Período que o roteador local não sabe converter em periodo_dias: o app usaria a janela
+        # padrão sem avisar, então o Gemini decide
+        periodo_nao_entendido = not periodo and PADRAO_DATA_EXPLICITA.search(texto)
+        if PADRAO_COMPARATIVO.search(texto):
+            analise["intencao"] = "analise_abc_comparativa"
+            return analise, 0.5 if periodo_nao_entendido else 0.9
+        analise["intencao"] = "analise_abc_simples"
+        if periodo_nao_entendido:
+            return analise, 0.5
+        return analise, 0.95 if "abc" in texto else 0.85
+
+    if PADRAO_PREVISAO.search(texto):
+        analise["intencao"] = "previsao_vendas"
+        sku, confirmado = _extrair_sku(pergunta_usuario, texto, skus_conhecidos)
+        if sku:
+            analise["sku_primario"] = sku
+        if confirmado:
+            return analise, 0.95
+        if skus_conhecidos and not sku and not PADRAO_TOKEN_SKU.search(texto):
+            # Nenhum código na pergunta: o app vai pedir o SKU ao usuário, o Gemini não ajudaria
+            return analise, 0.85
+        # Há um candidato que não conseguimos confirmar no catálogo: melhor deixar o Gemini decidir
+        return analise, 0.5
+
+    if PADRAO_DADOS.search(texto):
+        analise["intencao"] = "pergunta_aberta_sql"
+        return analise, 0.85
+
+    return {"intencao": "pergunta_aberta_sql"}, 0.3
+
+
+# --- Métricas de roteamento (compartilhadas pelo processo) ---
+_trava_metricas = threading.Lock()
+_metricas = {"total": 0, "local": 0, "gemini": 0}
+
+
+def registrar_roteamento(local: bool):
+    with _trava_metricas:
+        _metricas["total"] += 1
+        _metricas["local" if local else "gemini"] += 1
+
+
+def estatisticas_roteamento() -> dict:
+    """Quantas perguntas foram roteadas localmente e qual a fração do total."""
+    with _trava_metricas:
+        total = _metricas["total"]
+        return {**_metricas, "fracao_local": round(_metricas["local"] / total, 3) if total else 0.0}
@@ -0,0 +1,218 @@
+"""
+Consultas com parâmetros ligados (bind), em vez de valores colados no texto do SQL.
+
+    executar_parametrizada(conexao, '''
+        SELECT codigo, SUM(quantidade) FROM pedido_compras
+        WHERE data >= :inicio AND codigo IN :skus GROUP BY codigo
+    ''', {"inicio": date(2024, 1, 1), "skus": ["SKU1", "SKU2"]})
+
+- Os valores nunca entram no texto do SQL: aspas em nomes de fornecedor ou SKUs vindos
+  do chat não quebram a consulta nem abrem espaço para injeção de SQL.
+- Listas viram IN (%s, %s, ...) de qualquer tamanho, inclusive um só item (IN de lista
+  vazia não casa com nada). O número de marcadores é arredondado para a próxima potência
+  de 2, repetindo o último valor, para que listas de tamanhos parecidos gerem o mesmo SQL.
+  Listas maiores que SQL_LIMITE_LISTA_EXPANDIDA vão para uma tabela temporária de chaves.
+- No MySQL a consulta é preparada no servidor (cursor prepared=True). Os cursores preparados
+  ficam guardados na própria conexão (as SQL_PREPARADAS_POR_CONEXAO consultas mais recentes),
+  então a mesma consulta executada de novo naquela conexão não é reanalisada pelo MySQL.
+- Dentro de textos entre aspas e comentários, ':nome' não é tratado como parâmetro.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from rastreamento import registrar_na_etapa
+
+SQL_LIMITE_LISTA_EXPANDIDA = int(os.getenv("SQL_LIMITE_LISTA_EXPANDIDA", "1000"))
+SQL_PREPARADAS_POR_CONEXAO = int(os.getenv("SQL_PREPARADAS_POR_CONEXAO", "32"))
+
+MARCADORES = {"mysql": "%s", "sqlite": "?", "duckdb": "?"}
+
+# Literais, identificadores entre crases e comentários são copiados como estão; o resto procura :nome
+PADRAO_PARAMETROS = re.compile(
+    r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`|--[^\n]*|#[^\n]*|/\*.*?\*/|(?<![:\w]):(\w+)",
+    re.DOTALL,
+)
+
+_metricas = {"preparadas": 0, "reaproveitadas": 0, "tabelas_de_chaves": 0}
+_trava_metricas = threading.Lock()
+
+
+def _valor_python(valor):
+    """Converte tipos do NumPy/pandas para os tipos que os conectores sabem enviar."""
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    return valor
+
+
+def _e_lista(valor) -> bool:
+    return isinstance(valor, (list, tuple, set, frozenset, np.ndarray, pd.Series, pd.Index))
+
+
+def montar_consulta(sql: str, parametros: dict = None, dialeto: str = "mysql", limite_lista: int = None):
+    """
+    Troca cada :nome pelo marcador do dialeto e devolve (sql, valores, tabelas_de_chaves).
+    `tabelas_de_chaves` traz {nome_da_tabela_temporaria: valores} das listas acima de `limite_lista`,
+    que o executor precisa criar antes de rodar a consulta.
+    """
+    if not parametros:
+        return sql, (), {}
+    marcador = MARCADORES[dialeto]
+    valores = []
+    tabelas_de_chaves = {}
+
+    def substituir(encontrado):
+        nome = encontrado.group(1)
+        if nome is None:
+            return encontrado.group(0)
+        if nome not in parametros:
+            raise KeyError(f"Parâmetro ':{nome}' não informado.")
+        valor = parametros[nome]
+        if not _e_lista(valor):
+            valores.append(_valor_python(valor))
+            return marcador
+
+        lista = list(dict.fromkeys(_valor_python(v) for v in valor))  # sem repetidos, na ordem
+        if not lista:
+            return "(NULL)"
+        if limite_lista is not None and len(lista) > limite_lista:
+            tabela = f"_chaves_{nome}"
+            tabelas_de_chaves[tabela] = lista
+            return f"(SELECT valor FROM {tabela})"
+        tamanho = 1 << (len(lista) - 1).bit_length()
+        lista += [lista[-1]] * (tamanho - len(lista))
+        valores.extend(lista)
+        return "(" + ", ".join([marcador] * tamanho) + ")"
+
+    return PADRAO_PARAMETROS.sub(substituir, sql), tuple(valores), tabelas_de_chaves
+
+
+def _criar_tabela_de_chaves(cursor, dialeto: str, tabela: str, valores: list):
+    inteiros = all(isinstance(v, int) and not isinstance(v, bool) for v in valores)
+    cursor.execute(_sql_apagar_tabela(dialeto, tabela))
+    tipo = 'BIGINT' if inteiros else 'VARCHAR(255)'
+    # No MySQL o índice não é único: na collation *_ci, 'SKU1' e 'sku1 ' seriam chave duplicada
+    # (a lista só tira os repetidos exatos), e o IN (SELECT ...) não se importa com repetições
+    indice = "INDEX (valor)" if dialeto == "mysql" else "PRIMARY KEY (valor)"
+    cursor.execute(f"CREATE TEMPORARY TABLE {tabela} (valor {tipo}, {indice})")
+    cursor.executemany(f"INSERT INTO {tabela} (valor) VALUES ({MARCADORES[dialeto]})", [(v,) for v in valores])
+
+
+def _sql_apagar_tabela(dialeto: str, tabela: str) -> str:
+    # TEMPORARY garante que o MySQL nunca apague uma tabela de verdade com o mesmo nome
+    return f"DROP TEMPORARY TABLE IF EXISTS {tabela}" if dialeto == "mysql" else f"DROP TABLE IF EXISTS temp.{tabela}"
+
+
+def _cursor_preparado(conexao, sql: str):
+    """
+    Cursor preparado para `sql`, reaproveitado do cache da conexão quando possível.
+    Devolve (cursor, sql_guardado): o conector só reaproveita a preparação se receber
+    o MESMO objeto de texto usado da primeira vez (comparação por identidade).
+    """
+    bruta = getattr(conexao, "conexao_bruta", conexao)
+    cache = getattr(bruta, "_consultas_preparadas", None)
+    if cache is None:
+        cache = OrderedDict()
+        try:
+            bruta._consultas_preparadas = cache
+        except AttributeError:
+            cache = None  # conexão sem atributos livres: prepara sem guardar
+
+    if cache is not None and sql in cache:
+        cache.move_to_end(sql)
+        with _trava_metricas:
+            _metricas["reaproveitadas"] += 1
+        registrar_na_etapa(consulta_preparada="reaproveitada")
+        return cache[sql]
+
+    item = (bruta.cursor(prepared=True), sql)
+    with _trava_metricas:
+        _metricas["preparadas"] += 1
+    registrar_na_etapa(consulta_preparada="nova")
+    if cache is not None:
+        cache[sql] = item
+        while len(cache) > SQL_PREPARADAS_POR_CONEXAO:
+            _, (cursor_antigo, _) = cache.popitem(last=False)
+            try:
+                cursor_antigo.close()  # libera a consulta preparada no servidor
+            except Exception:
+                pass
+    return item
+
+
+def _descartar_preparada(conexao, sql: str):
+    cache = getattr(getattr(conexao, "conexao_bruta", conexao), "_consultas_preparadas", None)
+    if cache and sql in cache:
+        cursor, _ = cache.pop(sql)
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+def executar_parametrizada(conexao, sql: str, parametros: dict = None) -> pd.DataFrame:
+    """
+    Executa a consulta com os parâmetros ligados e devolve um DataFrame com os mesmos
+    tipos do pd.read_sql (decimais convertidos para float). Os erros do banco são relançados.
+    O dialeto vem da conexão do pool (conexao.dialeto); conexões sem ele são tratadas como MySQL.
+    """
+    dialeto = getattr(conexao, "dialeto", "mysql")
+    sql_final, valores, tabelas_de_chaves = montar_consulta(
+        sql.strip().rstrip(";"), parametros, dialeto, SQL_LIMITE_LISTA_EXPANDIDA
+    )
+    preparada = dialeto == "mysql" and SQL_PREPARADAS_POR_CONEXAO > 0
+
+    if tabelas_de_chaves:
+        cursor_auxiliar = conexao.cursor()
+        for tabela, chaves in tabelas_de_chaves.items():
+            _criar_tabela_de_chaves(cursor_auxiliar, dialeto, tabela, chaves)
+        with _trava_metricas:
+            _metricas["tabelas_de_chaves"] += len(tabelas_de_chaves)
+    try:
+        if preparada:
+            cursor, sql_final = _cursor_preparado(conexao, sql_final)
+        else:
+            cursor = conexao.cursor()
+        try:
+            cursor.execute(sql_final, valores)
+            linhas = cursor.fetchall()
+            colunas = [descricao[0] for descricao in cursor.description]
+        except Exception:
+            if preparada:
+                _descartar_preparada(conexao, sql_final)
+            raise
+        finally:
+            if not preparada:
+                cursor.close()
+    finally:
+        if tabelas_de_chaves:
+            for tabela in tabelas_de_chaves:
+                try:
+                    cursor_auxiliar.execute(_sql_apagar_tabela(dialeto, tabela))
+                except Exception:
+                    pass  # a tabela temporária some de qualquer jeito quando a conexão fecha
+            cursor_auxiliar.close()
+
+    return pd.DataFrame.from_records(linhas, columns=colunas, coerce_float=True)
+
+
+def como_data(valor) -> date:
+    """Data (sem hora) a partir de date, datetime, Timestamp ou texto 'AAAA-MM-DD'."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return pd.Timestamp(valor).date()
+
+
+def estatisticas_consultas() -> dict:
+    """Quantas consultas foram preparadas, quantas reaproveitaram a preparação e quantas listas foram para tabela temporária."""
+    with _trava_metricas:
+        return dict(_metricas)
@@ -1,32 +1,22 @@
-import mysql.connector
-import pandas as pd
-import os
-from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from pool_conexoes import obter_pool
+from sql_parametrizado import executar_parametrizada
 
-# --- Configurações e Conexão (sem alterações) ---
-load_dotenv()
-DB_HOST = os.getenv("DB_HOST")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_NAME = os.getenv("DB_NAME")
-
+# --- Configurações e Conexão (via pool compartilhado, ver pool_conexoes.py) ---
 def conectar_bd():
     try:
-        conexao = mysql.connector.connect(host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME)
-        return conexao
+        return obter_pool().obter()
     except Exception as e:
         print(f"Erro ao conectar ao MySQL: {e}")
         return None
 
-def executar_consulta(query: str):
+def executar_consulta(query: str, parametros: dict = None):
     conexao = conectar_bd()
     if conexao:
         try:
-            return pd.read_sql(query, conexao)
+            return executar_parametrizada(conexao, query, parametros)
         finally:
-            if conexao.is_connected():
-                conexao.close()
+            conexao.close()  # devolve ao pool
     return None
 
 # --- Nova Função de Cálculo de Demanda (MODO DEBUG) ---
@@ -36,11 +26,11 @@ def calcular_demanda_por_sku_primario(dias: int) -> dict:
     Versão com depuração detalhada.
     """
     print(f"\n--- [MODO DEBUG] Calculando demanda para os últimos {dias} dias ---")
-    data_inicio = (datetime.now() - timedelta(days=dias)).strftime('%Y-%m-%d')
-    data_fim = datetime.now().strftime('%Y-%m-%d')
+    data_inicio = (datetime.now() - timedelta(days=dias)).date()
+    data_fim = datetime.now().date()
 
     # MUDANÇA: Usando LEFT JOIN para não perder nenhuma venda durante a análise.
-    query = f"""
+    query = """
         SELECT 
             v.item_codigo AS codigo_vendido,
             v.item_quantidade AS qtd_vendida,
@@ -53,10 +43,10 @@ def calcular_demanda_por_sku_primario(dias: int) -> dict:
             produtos_2 p ON v.item_codigo = p.codigo
         WHERE 
             v.situacao_desc IN ('Aprovado', 'Em Aberto', 'Em andamento')
-            AND v.data BETWEEN '{data_inicio}' AND '{data_fim}';
+            AND v.data BETWEEN :data_inicio AND :data_fim;
     """
     
-    df_vendas_bruto = executar_consulta(query)
+    df_vendas_bruto = executar_consulta(query, {"data_inicio": data_inicio, "data_fim": data_fim})
 
     if df_vendas_bruto is None or df_vendas_bruto.empty:
         print("[DEBUG] Nenhuma venda encontrada no período de análise.")
@@ -101,4 +91,5 @@ if __name__ == '__main__':
         primeiros_50_itens = list(demanda_calculada.items())[:50]
         print(dict(primeiros_50_itens))
     else:
-        print("Nenhuma demanda foi calculada.")
\ No newline at end of file
+        print("Nenhuma demanda foi calculada.")
+    print(f"\nUso do pool de conexões: {obter_pool().estatisticas()}")
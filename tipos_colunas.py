@@ -0,0 +1,106 @@
+"""
+Tipos compactos para os DataFrames das consultas analíticas conhecidas.
+
+O resultado cru de uma consulta traz SKUs, fornecedores e situações como objetos Python
+(uma string por linha), datas como datetime.date e, conforme a fonte, números como Decimal.
+Para as consultas que o agente conhece, cada coluna ganha um tipo definido em
+TIPOS_POR_CONSULTA:
+- textos repetidos (sku_primario, item_codigo, Fornecedor, situacao_desc) viram category;
+- datas viram datetime64[ns];
+- quantidades e custos viram float64, e colunas inteiras viram int32 (ou int64 quando
+  os valores não cabem; float64 quando há nulos ou frações, ex: estoque fracionado).
+Colunas fora do esquema da consulta seguem TIPOS_POR_COLUNA; as demais ficam como vieram.
+
+Com o rastreamento ligado, a memória antes e depois de cada conversão é anotada na etapa
+aberta e somada em estatisticas_tipos().
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from rastreamento import RASTREAMENTO_ATIVO, registrar_na_etapa
+
+# Tipos valem para qualquer consulta conhecida que traga a coluna
+TIPOS_POR_COLUNA = {
+    "data": "datetime64[ns]",
+    "sku_primario": "category",
+    "item_codigo": "category",
+    "Fornecedor": "category",
+    "situacao_desc": "category",
+}
+
+TIPOS_POR_CONSULTA = {
+    "vendas_por_codigo": {"item_quantidade": "float64"},
+    "catalogo": {
+        "id": "int64", "produto_id": "int64", "codigo": "object", "nome": "object",
+        "quantidade": "int32", "saldoVirtualTotal": "int32", "precoCusto": "float64",
+    },
+    "pedidos_em_aberto": {"codigo": "category", "pedidos_em_aberto": "float64"},
+}
+
+_metricas = {"consultas": 0, "bytes_antes": 0, "bytes_depois": 0}
+_trava_metricas = threading.Lock()
+
+
+def _converter_coluna(coluna: pd.Series, tipo: str) -> pd.Series:
+    if tipo == "object" or str(coluna.dtype) == tipo:
+        return coluna
+    if tipo == "category":
+        return coluna.astype("category")
+    if tipo.startswith("datetime64"):
+        return pd.to_datetime(coluna).astype(tipo)
+
+    numeros = pd.to_numeric(coluna, errors="coerce")  # Decimal e textos numéricos viram float
+    if tipo.startswith("int"):
+        if numeros.isna().any() or not (numeros % 1 == 0).all():
+            return numeros.astype("float64")  # int truncaria as frações
+        limites = np.iinfo(tipo)
+        if len(numeros) and (numeros.min() < limites.min or numeros.max() > limites.max):
+            tipo = "int64"
+    return numeros.astype(tipo)
+
+
+def aplicar_tipos(df: pd.DataFrame, consulta: str) -> pd.DataFrame:
+    """Converte as colunas de `df` para os tipos definidos para a consulta `consulta` (ver TIPOS_POR_CONSULTA)."""
+    if df is None:
+        return None
+    tipos = {**TIPOS_POR_COLUNA, **TIPOS_POR_CONSULTA[consulta]}
+    bytes_antes = int(df.memory_usage(index=True, deep=True).sum()) if RASTREAMENTO_ATIVO else 0
+
+    df = df.assign(**{
+        coluna: _converter_coluna(df[coluna], tipos[coluna]) for coluna in df.columns if coluna in tipos
+    })
+
+    if RASTREAMENTO_ATIVO:
+        bytes_depois = int(df.memory_usage(index=True, deep=True).sum())
+        registrar_na_etapa(tipos=consulta, memoria_antes_mb=round(bytes_antes / 2**20, 2),
+                           memoria_depois_mb=round(bytes_depois / 2**20, 2))
+        with _trava_metricas:
+            _metricas["consultas"] += 1
+            _metricas["bytes_antes"] += bytes_antes
+            _metricas["bytes_depois"] += bytes_depois
+    return df
+
+
+def concatenar(frames: list) -> pd.DataFrame:
+    """
+    pd.concat que mantém as colunas category: quando as partes têm categorias diferentes,
+    todas passam a usar a união delas (o pd.concat puro cairia para object).
+    """
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame()
+    for coluna in frames[0].columns:
+        partes = [df[coluna] for df in frames if coluna in df.columns]
+        if len(partes) == len(frames) and all(isinstance(p.dtype, pd.CategoricalDtype) for p in partes) \
+                and any(p.dtype != partes[0].dtype for p in partes):
+            categorias = pd.api.types.union_categoricals(partes, ignore_order=True).categories
+            frames = [df.assign(**{coluna: df[coluna].cat.set_categories(categorias)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def estatisticas_tipos() -> dict:
+    """Memória somada dos resultados antes e depois da conversão de tipos (só com o rastreamento ligado)."""
+    with _trava_metricas:
+        return dict(_metricas)
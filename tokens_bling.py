@@ -0,0 +1,181 @@
+"""
+Gerenciador dos tokens OAuth do Bling.
+
+- O access token fica em memória junto com a hora em que expira; o arquivo de tokens
+  só é lido na primeira vez (ou quando outro processo pode ter renovado o token).
+- O token é renovado ANTES de expirar (margem configurável), em vez de esperar um 401.
+- Renovação "single-flight": se várias threads precisarem renovar ao mesmo tempo, só
+  uma chama a API; as outras esperam e usam o token novo. Isso importa porque o Bling
+  troca o refresh token a cada renovação: duas renovações simultâneas invalidariam uma à outra.
+- O arquivo de tokens é gravado de forma atômica e sob uma trava de arquivo
+  (fcntl no Linux/Mac, msvcrt no Windows), que também vale entre processos.
+- Os caminhos dos arquivos vêm do .env (BLING_TOKENS_ARQUIVO e BLING_CREDENCIAIS_ARQUIVO).
+"""
+import base64
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from cache_local import gravar_json_atomico
+from envio_pedidos_bling import BLING_API_URL, BLING_TIMEOUT_SEGUNDOS, obter_sessao_http
+from rastreamento import medir_etapa
+
+load_dotenv()
+
+_PASTA_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "credenciais_bling")
+BLING_TOKENS_ARQUIVO = os.path.abspath(os.getenv("BLING_TOKENS_ARQUIVO", os.path.join(_PASTA_PADRAO, "tokens.json")))
+BLING_CREDENCIAIS_ARQUIVO = os.path.abspath(os.getenv("BLING_CREDENCIAIS_ARQUIVO", os.path.join(_PASTA_PADRAO, "refresh_token.json")))
+BLING_MARGEM_RENOVACAO_SEGUNDOS = float(os.getenv("BLING_MARGEM_RENOVACAO_SEGUNDOS", "300"))
+
+if os.name == "nt":
+    import msvcrt
+
+    def _travar(arquivo):
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_LOCK, 1)  # tenta por ~10s antes de desistir
+
+    def _destravar(arquivo):
+        arquivo.seek(0)
+        msvcrt.locking(arquivo.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _travar(arquivo):
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX)
+
+    def _destravar(arquivo):
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def trava_de_arquivo(caminho: str):
+    """Trava exclusiva entre processos, usando um arquivo '<caminho>.lock' ao lado do arquivo protegido."""
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(f"{caminho}.lock", "a+") as arquivo_trava:
+        _travar(arquivo_trava)
+        try:
+            yield
+        finally:
+            _destravar(arquivo_trava)
+
+
+class GerenciadorTokens:
+    def __init__(self, arquivo_tokens: str = BLING_TOKENS_ARQUIVO, arquivo_credenciais: str = BLING_CREDENCIAIS_ARQUIVO,
+                 margem_segundos: float = BLING_MARGEM_RENOVACAO_SEGUNDOS, url_token: str = None, sessao=None,
+                 timeout_segundos: float = BLING_TIMEOUT_SEGUNDOS):
+        self.url_token = url_token or f"{BLING_API_URL}/oauth/token"
+        self.sessao = sessao  # None: usa a sessão HTTP compartilhada com o envio de pedidos
+        self.timeout_segundos = timeout_segundos
+        self.arquivo_tokens = arquivo_tokens
+        self.arquivo_credenciais = arquivo_credenciais
+        self.margem_segundos = margem_segundos
+
+        self._tokens = None  # cópia em memória do arquivo de tokens
+        self._trava = threading.Lock()  # protege a renovação (single-flight dentro do processo)
+        self.contadores = {"renovacoes": 0, "leituras_arquivo": 0}
+
+    # --- arquivo ---
+    def ler_tokens(self):
+        """Lê o arquivo de tokens (None se não existir)."""
+        try:
+            with open(self.arquivo_tokens, "r") as f:
+                tokens = json.load(f)
+        except FileNotFoundError:
+            print("Erro: Arquivo de tokens não encontrado!")
+            return None
+        self.contadores["leituras_arquivo"] += 1
+        return tokens
+
+    def salvar_tokens(self, tokens: dict):
+        """Grava os tokens atomicamente, sob a trava de arquivo, e atualiza a cópia em memória."""
+        with trava_de_arquivo(self.arquivo_tokens):
+            gravar_json_atomico(self.arquivo_tokens, tokens)
+        self._tokens = tokens
+
+    # --- validade ---
+    def _valido(self, tokens) -> bool:
+        """Token presente e fora da margem de renovação. Sem 'expira_em' (arquivo antigo), vale até um 401."""
+        if not tokens or "access_token" not in tokens:
+            return False
+        expira_em = tokens.get("expira_em")
+        return expira_em is None or expira_em - self.margem_segundos > time.time()
+
+    # --- uso ---
+    def obter_access_token(self):
+        """Access token válido, renovando antes se estiver perto de expirar. None se não for possível obter um."""
+        tokens = self._tokens
+        if self._valido(tokens):
+            return tokens["access_token"]
+        with self._trava:
+            if self._tokens is None:
+                self._tokens = self.ler_tokens()
+            if self._valido(self._tokens):
+                return self._tokens["access_token"]
+            return self._renovar_travado()
+
+    def renovar(self, token_rejeitado: str = None):
+        """
+        Renova o token. Se `token_rejeitado` (o token que levou um 401) já foi trocado
+        por outra thread ou processo, devolve o token novo sem chamar a API de novo.
+        Sem `token_rejeitado`, a renovação é sempre feita.
+        """
+        with self._trava:
+            return self._renovar_travado(token_rejeitado, forcar=token_rejeitado is None)
+
+    def _renovar_travado(self, token_rejeitado: str = None, forcar: bool = False):
+        with trava_de_arquivo(self.arquivo_tokens):
+            # Outro processo (ou outra thread, antes de nós) pode ter acabado de renovar
+            tokens = self.ler_tokens()
+            if not forcar and self._valido(tokens) and tokens["access_token"] != token_rejeitado:
+                self._tokens = tokens
+                return tokens["access_token"]
+            if not tokens or "refresh_token" not in tokens:
+                print("Erro: Refresh token não encontrado!")
+                return None
+
+            novos_tokens = self._chamar_api_renovacao(tokens["refresh_token"])
+            if novos_tokens is None:
+                return None
+            gravar_json_atomico(self.arquivo_tokens, novos_tokens)
+            self._tokens = novos_tokens
+            self.contadores["renovacoes"] += 1
+            print("Token renovado com sucesso.")
+            return novos_tokens.get("access_token")
+
+    def _chamar_api_renovacao(self, refresh_token: str):
+        try:
+            with open(self.arquivo_credenciais, "r") as f:
+                credenciais = json.load(f)
+            client_id = credenciais.get("client_id")
+            client_secret = credenciais.get("client_secret")
+            credenciais_base64 = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+
+            headers = {
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "1.0",
+                "Authorization": f"Basic {credenciais_base64}"
+            }
+            dados = {
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token
+            }
+            sessao = self.sessao or obter_sessao_http()
+            with medir_etapa("bling_renovar_token") as etapa:
+                response = sessao.post(self.url_token, headers=headers, data=dados, timeout=self.timeout_segundos)
+                etapa.registrar(codigo_http=response.status_code)
+
+            if response.status_code == 200:
+                token_info = response.json()
+                # Guarda quando o token expira, para renovar antes disso nas próximas chamadas
+                if "expires_in" in token_info:
+                    token_info["expira_em"] = time.time() + float(token_info["expires_in"])
+                return token_info
+            print(f"Erro na renovação do token: {response.status_code} - {response.text}")
+            return None
+        except Exception as e:
+            print(f"Um erro inesperado ocorreu durante a renovação do token: {e}")
+            return None
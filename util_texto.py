@@ -0,0 +1,47 @@
+"""
+Funções de normalização de texto usadas para comparar perguntas dos usuários.
+"""
+import re
+import unicodedata
+
+
+def remover_acentos(texto: str) -> str:
+    """'Previsão' -> 'Previsao'."""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def _normalizar_numero(match) -> str:
+    """Converte números no formato brasileiro ou americano para uma forma única: '1.000,50' -> '1000.5'."""
+    numero = match.group(0)
+    if "," in numero and "." in numero:
+        # O último separador é o decimal
+        if numero.rfind(",") > numero.rfind("."):
+            numero = numero.replace(".", "").replace(",", ".")
+        else:
+            numero = numero.replace(",", "")
+    elif "," in numero:
+        partes = numero.split(",")
+        # '1,000' (milhar) vs '1,5' (decimal)
+        separa_milhar = all(len(parte) == 3 for parte in partes[1:])
+        numero = "".join(partes) if separa_milhar else numero.replace(",", ".")
+    elif numero.count(".") > 1 or (numero.count(".") == 1 and len(numero.split(".")[1]) == 3):
+        # '1.000' e '1.000.000' são separadores de milhar no padrão brasileiro
+        numero = numero.replace(".", "")
+
+    if "." in numero:
+        numero = numero.rstrip("0").rstrip(".")
+    return numero
+
+
+def normalizar_pergunta(pergunta: str) -> str:
+    """
+    Deixa uma pergunta em forma canônica para servir de chave de cache:
+    minúsculas, sem acentos, espaços colapsados, números em um único formato
+    e sem pontuação final. Ex: '  Faturamento de ONTEM? ' -> 'faturamento de ontem'.
+    """
+    texto = remover_acentos(pergunta).lower()
+    # Só números "soltos": dígitos dentro de um SKU (ex: 'abc_01') ficam intactos
+    texto = re.sub(r"(?<![\w.,])(\d[\d.,]*\d|\d)(?![\w])", _normalizar_numero, texto)
+    texto = re.sub(r"\s+", " ", texto).strip()
+    return texto.rstrip("?!.;: ")
@@ -0,0 +1,82 @@
+"""
+Verifica o custo de importação dos módulos do agente.
+
+Roda `python -X importtime -c "import <modulo>"` em um processo limpo, mostra os
+módulos mais caros (tempo acumulado) e falha se:
+  - o tempo total passar do orçamento, ou
+  - alguma dependência pesada que deveria ser carregada só sob demanda
+    (Prophet, Plotly, Gemini...) tiver sido importada.
+
+Uso:
+    python verificar_tempo_importacao.py                 # agente_dados, orçamento padrão
+    python verificar_tempo_importacao.py agente_dados --orcamento-ms 800 --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ORCAMENTO_PADRAO_MS = float(os.getenv("ORCAMENTO_IMPORTACAO_MS", "1500"))
+
+# Pacotes que não podem ser carregados só por importar o módulo
+PACOTES_PESADOS = ["prophet", "plotly", "cmdstanpy", "google.generativeai", "streamlit", "duckdb"]
+
+PADRAO_LINHA = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def medir_importacao(modulo: str) -> list:
+    """
+    Importa `modulo` em um processo novo e devolve a lista de
+    (nome_modulo, tempo_proprio_us, tempo_acumulado_us, profundidade).
+    """
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falha ao importar '{modulo}':\n{resultado.stderr[-2000:]}")
+
+    medicoes = []
+    for linha in resultado.stderr.splitlines():
+        encontrado = PADRAO_LINHA.match(linha)
+        if encontrado:
+            proprio, acumulado, recuo, nome = encontrado.groups()
+            medicoes.append((nome, int(proprio), int(acumulado), len(recuo) // 2))
+    return medicoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modulo", nargs="?", default="agente_dados")
+    parser.add_argument("--orcamento-ms", type=float, default=ORCAMENTO_PADRAO_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    medicoes = medir_importacao(args.modulo)
+    total_ms = sum(proprio for _, proprio, _, _ in medicoes) / 1000
+
+    print(f"Importação de '{args.modulo}': {total_ms:.0f} ms (orçamento: {args.orcamento_ms:.0f} ms)\n")
+    print(f"{'acumulado (ms)':>15} {'próprio (ms)':>13}  módulo")
+    # Só os pacotes de primeiro nível dão uma visão útil do custo por dependência
+    primeiro_nivel = [m for m in medicoes if m[3] <= 1]
+    for nome, proprio, acumulado, _ in sorted(primeiro_nivel, key=lambda m: m[2], reverse=True)[:args.top]:
+        print(f"{acumulado / 1000:>15.1f} {proprio / 1000:>13.1f}  {nome}")
+
+    importados = {nome for nome, _, _, _ in medicoes}
+    pesados = [p for p in PACOTES_PESADOS if p in importados]
+
+    ok = True
+    if pesados:
+        ok = False
+        print(f"\nERRO: dependências pesadas carregadas na importação: {', '.join(pesados)}")
+    if total_ms > args.orcamento_ms:
+        ok = False
+        print(f"\nERRO: importação acima do orçamento ({total_ms:.0f} ms > {args.orcamento_ms:.0f} ms)")
+    if ok:
+        print("\nOK: importação dentro do orçamento.")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())